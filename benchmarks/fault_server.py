@@ -0,0 +1,100 @@
+import argparse
+import http.server
+import random
+import re
+import threading
+import time
+
+# 本地的下载源替身: 按路径生成确定性的内容, 支持 Range, 可配置带宽/延迟/断流/5xx/并发连接上限 (超出时返回 429)
+# 路径格式: /<字节数>/<任意名字>, 例如 /1048576/a.bin; 名字以 norange 开头时不支持 Range
+BLOCK = random.Random(0).randbytes(1024 * 1024)
+CHUNK = 64 * 1024
+
+def content(offset, length):
+    # 内容是 BLOCK 的循环, 任意区间都能直接切出来, 不占内存
+    parts, position = [], offset
+    while length > 0:
+        start = position % len(BLOCK); piece = BLOCK[start:start + min(length, len(BLOCK) - start)]
+        parts.append(piece); position += len(piece); length -= len(piece)
+    return b"".join(parts)
+
+class FaultHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    def log_message(self, *args): pass
+    def do_HEAD(self): self._respond(False)
+    def do_GET(self): self._respond(True)
+    def _respond(self, body):
+        server = self.server
+        match = re.match(r"/(\d+)/([^?]*)", self.path)
+        if not match: self.send_error(404); return
+        size, name = int(match.group(1)), match.group(2)
+        with server.lock: server.stats["requests"] += 1
+        if server.latency: time.sleep(server.latency)
+        if body and server.rng.random() < server.error_rate:
+            with server.lock: server.stats["errors"] += 1
+            self.send_response(503); self.send_header("Content-Length", "0"); self.end_headers(); return
+        with server.lock:
+            # 模拟对并发连接数敏感的源站: 同时传输的响应超过上限就拒绝
+            throttled = body and server.max_connections and server.in_flight >= server.max_connections
+            if throttled: server.stats["throttled"] += 1
+            elif body: server.in_flight += 1
+        if throttled:
+            self.send_response(429); self.send_header("Retry-After", "1"); self.send_header("Content-Length", "0"); self.end_headers(); return
+        try: self._send(body, size, name)
+        finally:
+            if body:
+                with server.lock: server.in_flight -= 1
+    def _send(self, body, size, name):
+        server = self.server
+        start, end, code, ranges = 0, size - 1, 200, not name.startswith("norange")
+        requested = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if ranges and requested and self.headers.get("If-Range", server.etag) == server.etag:
+            start, end, code = int(requested.group(1)), min(int(requested.group(2) or size - 1), size - 1), 206
+        self.send_response(code); self.send_header("Content-Length", str(end - start + 1)); self.send_header("ETag", server.etag)
+        if ranges: self.send_header("Accept-Ranges", "bytes")
+        if code == 206: self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if body: self._stream(start, end)
+    def _stream(self, start, end):
+        server = self.server
+        # 按概率在中途断开连接, 断点随机落在响应范围内
+        cut = server.rng.randint(start, end) if server.rng.random() < server.drop_rate else end + 1
+        began, sent = time.monotonic(), 0
+        try:
+            for offset in range(start, cut, CHUNK):
+                data = content(offset, min(CHUNK, cut - offset))
+                self.wfile.write(data); sent += len(data)
+                if server.bandwidth:
+                    delay = sent / server.bandwidth - (time.monotonic() - began)
+                    if delay > 0: time.sleep(delay)
+            if cut <= end:
+                with server.lock: server.stats["drops"] += 1
+                self.close_connection = True
+        except OSError: self.close_connection = True
+        with server.lock: server.stats["bytes_sent"] += sent
+
+class FaultServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    def __init__(self, port=0, bandwidth_kb=0, latency_ms=0, drop_rate=0.0, error_rate=0.0, seed=0, max_connections=0):
+        super().__init__(("127.0.0.1", port), FaultHandler)
+        self.bandwidth, self.latency, self.drop_rate, self.error_rate = bandwidth_kb * 1024, latency_ms / 1000, drop_rate, error_rate
+        self.rng, self.lock, self.etag = random.Random(seed), threading.Lock(), '"bench"'
+        self.max_connections, self.in_flight = max_connections, 0
+        self.stats = {"requests": 0, "bytes_sent": 0, "drops": 0, "errors": 0, "throttled": 0}
+    def url(self, size, name): return f"http://127.0.0.1:{self.server_port}/{size}/{name}"
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start(); return self
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve deterministic payloads with Range support, throttling, latency and injected faults.")
+    parser.add_argument("--port", type=int, default=8080); parser.add_argument("--bandwidth-kb", type=int, default=0, help="per-connection cap, 0 = unlimited")
+    parser.add_argument("--latency-ms", type=int, default=0); parser.add_argument("--drop-rate", type=float, default=0.0); parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0); parser.add_argument("--max-connections", type=int, default=0, help="answer 429 above this many concurrent transfers, 0 = unlimited")
+    args = parser.parse_args()
+    server = FaultServer(args.port, args.bandwidth_kb, args.latency_ms, args.drop_rate, args.error_rate, args.seed, args.max_connections)
+    print(f"Serving on port {server.server_port}", flush=True)
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+
+if __name__ == "__main__":
+    main()
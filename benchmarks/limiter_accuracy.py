@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import DownloadEngine
+from storage import HistoryStore
+
+# 验证全局令牌桶: 多个并发任务的总速率应贴近 speed_limit_kb
+class PatternHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    size = 256 * 1024 * 1024
+    block = os.urandom(64 * 1024)
+    def log_message(self, *args): pass
+    def do_GET(self):
+        self.send_response(200); self.send_header("Content-Length", str(self.size)); self.end_headers()
+        try:
+            for _ in range(self.size // len(self.block)): self.wfile.write(self.block)
+        except (BrokenPipeError, ConnectionResetError): pass
+
+async def measure(tasks, limit_kb, duration, workdir):
+    store = HistoryStore(os.path.join(workdir, "history.db"))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PatternHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    engine = DownloadEngine(store, {"speed_limit_kb": limit_kb, "segments_per_task": 1, "max_concurrent": tasks})
+    samples, throttle = [], engine.limiter.throttle
+    async def counting_throttle(db_id, host, amount):
+        samples.append((time.monotonic(), amount)); await throttle(db_id, host, amount)
+    engine.limiter.throttle = counting_throttle
+    rows = [(store.add_task(url, f"f{i}", filepath), url, filepath) for i, url, filepath in
+            ((i, f"http://127.0.0.1:{server.server_port}/f{i}", os.path.join(workdir, f"f{i}")) for i in range(tasks))]
+    jobs = [asyncio.create_task(engine.download(db_id, url, filepath)) for db_id, url, filepath in rows]
+    await asyncio.sleep(duration)
+    for db_id, _, _ in rows: engine.paused.add(db_id)
+    await asyncio.gather(*jobs); await engine.close(); server.shutdown(); store.close()
+    # 丢弃第一秒的突发额度, 只统计稳态
+    start = samples[0][0] + 1
+    steady = [amount for t, amount in samples if t >= start]
+    return sum(steady) / (samples[-1][0] - start) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the shared bandwidth limiter holds the aggregate rate to the configured cap.")
+    parser.add_argument("--tasks", type=int, default=8); parser.add_argument("--limit-kb", type=int, default=4096)
+    parser.add_argument("--duration", type=float, default=10); parser.add_argument("--tolerance", type=float, default=0.03)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        rate_kb = asyncio.run(measure(args.tasks, args.limit_kb, args.duration, workdir))
+    deviation = (rate_kb - args.limit_kb) / args.limit_kb
+    print(f"tasks={args.tasks} cap={args.limit_kb}KB/s measured={rate_kb:.1f}KB/s deviation={deviation:+.2%}")
+    sys.exit(0 if abs(deviation) <= args.tolerance else 1)
+
+if __name__ == "__main__":
+    main()
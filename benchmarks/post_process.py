@@ -0,0 +1,77 @@
+import argparse
+import gzip
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import DownloadEngine
+from storage import HistoryStore
+from progress import ProgressHub
+from postprocess import PostProcessor
+
+# 比较 .gz 下载后解压的两种方式: 进程池事后再读一遍文件 (second-pass) 和下载时边下边解压 (streaming)
+# tail 是下载完成到解压结果可用的时间, 也就是用户在下载结束后还要等的部分; 本机回环比真实网络快得多, 可用 --speed-limit-kb 模拟链路带宽
+MODES = {"second-pass": False, "streaming": True}
+
+def make_payload(path, size):
+    # 类似日志的文本, 压缩比和真实数据接近 (约 3:1), 而不是一串零
+    rnd, words = random.Random(0), [f"{w}{i}" for i, w in enumerate("alpha beta gamma delta epsilon zeta eta theta".split() * 32)]
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        written = 0
+        while written < size:
+            block = "".join(f"{time.strftime('%H:%M:%S', time.gmtime(written % 86400))} {' '.join(rnd.choices(words, k=8))} {rnd.random()}\n" for _ in range(20000)).encode()
+            f.write(block); written += len(block)
+    return written
+
+def measure(port, expected, mode, workdir, speed_limit_kb):
+    store = HistoryStore(os.path.join(workdir, f"{mode}.db"))
+    settings = {"segments_per_task": 4, "speed_limit_kb": speed_limit_kb, "stream_decompress": MODES[mode], "post_process_rules": [{"pattern": "*.gz", "actions": ["decompress"]}]}
+    hub, done, times = ProgressHub(interval=0.05), threading.Event(), {}
+    postprocessor = PostProcessor(store, settings, hub)
+    def on_finished(db_id, status):
+        times["download"] = time.monotonic()
+        if status != "Complete" or not postprocessor.submit(db_id): times["status"] = status; done.set()
+    def on_batch(batch):
+        for event in batch:
+            if event.get("finished"): times["status"] = event["status"]; done.set()
+    hub.add_listener(on_batch)
+    # 和 DownloadService 一样的接法; 先建好进程池, 不把进程启动时间算进 tail
+    engine = DownloadEngine(store, settings, on_finished=on_finished, open_decoder=postprocessor.open_decoder)
+    postprocessor._pool(); engine.start()
+    url, filepath = f"http://127.0.0.1:{port}/payload.log.gz", os.path.join(workdir, f"{mode}.log.gz")
+    db_id, = store.add_tasks([(url, os.path.basename(filepath), filepath, None)])
+    started = time.monotonic(); engine.enqueue(db_id, url, filepath)
+    done.wait(); finished = time.monotonic()
+    engine.stop(); postprocessor.close(); hub.close(); store.close()
+    output = filepath[:-3]
+    if times["status"] != "Complete" or os.path.getsize(output) != expected: raise SystemExit(f"{mode}: post-processing failed ({times['status']})")
+    os.remove(output)
+    return finished - started, finished - times["download"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long a .gz download takes to become usable with and without streaming decompression.")
+    parser.add_argument("--size-mb", type=int, default=512, help="uncompressed size"); parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--speed-limit-kb", type=int, default=0, help="download bandwidth, 0 = unlimited")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        expected = make_payload(os.path.join(workdir, "payload.log.gz"), args.size_mb * 1024 * 1024)
+        compressed = os.path.getsize(os.path.join(workdir, "payload.log.gz"))
+        server = subprocess.Popen([sys.executable, "-u", "-m", "http.server", "0", "--bind", "127.0.0.1"], cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            port = int(server.stdout.readline().split("port ")[1].split()[0])
+            print(f"payload: {compressed / 1024 ** 2:.0f} MB compressed, {expected / 1024 ** 2:.0f} MB uncompressed")
+            results = {}
+            for mode in MODES:
+                wall, tail = min(measure(port, expected, mode, workdir, args.speed_limit_kb) for _ in range(args.runs))
+                results[mode] = tail
+                print(f"{mode:>12}: {wall:.2f} s until usable, {tail:.2f} s after the download finished")
+        finally: server.terminate()
+    print(f"tail after download: streaming {results['streaming'] / results['second-pass'] - 1:+.0%} vs second-pass")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# 测量无界面模式的冷启动: 从启动进程到 /health 返回 200 的墙钟时间, 以及进程自报的各阶段耗时
+# 每次都在全新的配置目录里启动 (空数据库); 另跑一次 -X importtime 确认没有加载 Qt
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(workdir, trace_imports=False):
+    # 便携模式: 配置目录里有 settings.json 时就用它, 不碰用户目录
+    shutil.rmtree(workdir, ignore_errors=True); shutil.copytree(ROOT, workdir, ignore=shutil.ignore_patterns(".git", "__pycache__", "history.db*", "benchmarks"))
+    with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f: json.dump({"download_path": os.path.join(workdir, "downloads")}, f)
+    began = time.perf_counter()
+    # -X importtime 的输出写到文件里, 之后检查是否导入了 PySide6
+    imports = open(os.path.join(workdir, "imports.log"), "w+", encoding="utf-8")
+    process = subprocess.Popen([sys.executable, *(["-X", "importtime"] if trace_imports else []), os.path.join(workdir, "main.py"), "--headless", "--port", "0"],
+                               cwd=workdir, stdout=subprocess.PIPE, stderr=imports, text=True)
+    try:
+        ready = None
+        while ready is None:
+            line = process.stdout.readline()
+            if not line: raise SystemExit("daemon exited before the API was ready")
+            ready = re.search(r"API ready on http://[^:]+:(\d+) in", line)
+        port = int(ready.group(1))
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as r: health = json.load(r); break
+            except OSError: time.sleep(0.005)
+        wall = time.perf_counter() - began
+    finally:
+        process.terminate(); process.wait(timeout=30)
+        imports.seek(0); loaded = imports.read(); imports.close()
+    if trace_imports and "PySide6" in loaded: raise SystemExit("headless mode imported PySide6")
+    return wall, health["startup"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure headless cold start until the HTTP API answers.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        measure(os.path.join(root, "imports"), trace_imports=True)
+        results = [measure(os.path.join(root, str(run))) for run in range(args.runs)]
+    walls = [wall for wall, _ in results]
+    print(f"spawn -> /health: median {statistics.median(walls) * 1000:.0f} ms, max {max(walls) * 1000:.0f} ms over {len(walls)} runs")
+    for phase in results[0][1]:
+        print(f"{phase:>10}: median {statistics.median(startup[phase] for _, startup in results) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import DownloadEngine
+from storage import HistoryStore
+
+# 无界面地驱动完整下载路径 (HistoryStore + 调度 + DownloadEngine), 对本地 fault_server 跑一组场景
+# 每个场景在独立子进程里运行, CPU 时间和峰值内存互不干扰; 服务器也在单独的进程里, 不计入下载进程的 CPU
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fault_server.py")
+MB = 1024 * 1024
+SCENARIOS = {
+    "huge_file": {"tasks": 1, "size": 1024 * MB, "settings": {"segments_per_task": 4}},
+    "tiny_files": {"tasks": 10000, "size": 4096, "settings": {"max_concurrent": 32}},
+    "limited_concurrent": {"tasks": 64, "size": 8 * MB, "settings": {"max_concurrent": 64, "speed_limit_kb": 16384}},
+    "flaky_link": {"tasks": 8, "size": 32 * MB, "settings": {"max_concurrent": 8, "retry_backoff_base": 0.1},
+                   "server": {"bandwidth_kb": 8192, "latency_ms": 50, "drop_rate": 0.3, "error_rate": 0.05}},
+    # 自适应连接数: 源站超过 4 个并发就返回 429, 应收敛到 4 左右; CDN 每个连接限速但不限并发, 应一路加到上界
+    "throttled_origin": {"tasks": 32, "size": 8 * MB, "settings": {"max_concurrent": 32, "max_connections_per_host": 32}, "server": {"bandwidth_kb": 2048, "max_connections": 4}},
+    "scaling_cdn": {"tasks": 32, "size": 8 * MB, "settings": {"max_concurrent": 32, "max_connections_per_host": 32}, "server": {"bandwidth_kb": 1024}},
+}
+# --quick: 缩小规模, 用于冒烟和 CI
+QUICK = {"huge_file": {"size": 128 * MB}, "tiny_files": {"tasks": 1000}, "limited_concurrent": {"tasks": 16, "size": 4 * MB}, "flaky_link": {"tasks": 4, "size": 8 * MB},
+         "throttled_origin": {"tasks": 16, "size": 4 * MB}, "scaling_cdn": {"tasks": 16, "size": 4 * MB}}
+
+def peak_rss_mb():
+    try: import resource
+    except ImportError: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (MB if sys.platform == "darwin" else 1024), 1)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+def run_scenario(name, spec, timeout):
+    server_args = [f"--{key.replace('_', '-')}={value}" for key, value in spec.get("server", {}).items()]
+    server = subprocess.Popen([sys.executable, SERVER, "--port", "0", *server_args], stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline().split()[-1])
+        with tempfile.TemporaryDirectory() as workdir:
+            store = HistoryStore(os.path.join(workdir, "history.db"))
+            started, first_byte, finished, done = {}, {}, [], threading.Event()
+            def on_status(db_id, status):
+                if status == "Downloading": started.setdefault(db_id, time.monotonic())
+            def on_finished(db_id, status):
+                finished.append(status)
+                if len(finished) == spec["tasks"]: done.set()
+            engine = DownloadEngine(store, dict({"max_concurrent": 3, "segments_per_task": 4}, **spec["settings"]), on_finished=on_finished, on_status=on_status)
+            # 首个数据块写入后会经过限速器, 在这里记下首字节时间
+            throttle = engine.limiter.throttle
+            async def timed_throttle(db_id, host, amount):
+                first_byte.setdefault(db_id, time.monotonic()); await throttle(db_id, host, amount)
+            engine.limiter.throttle = timed_throttle
+            tasks = [(f"http://127.0.0.1:{port}/{spec['size']}/{name}-{i}.bin", f"{name}-{i}.bin", os.path.join(workdir, f"{name}-{i}.bin"), None) for i in range(spec["tasks"])]
+            db_ids = store.add_tasks(tasks)
+            commits, rows_written = store.commits, store.rows_written
+            cpu, wall = time.process_time(), time.monotonic()
+            engine.start(); engine.enqueue_many([(db_id, url, filepath, 0) for db_id, (url, _, filepath, _) in zip(db_ids, tasks)])
+            completed = done.wait(timeout)
+            cpu, wall = time.process_time() - cpu, time.monotonic() - wall
+            connection_limits = [stats["connection_limit"] for stats in engine.concurrency.stats().values()]
+            engine.stop(); store.flush()
+            total_bytes = spec["tasks"] * spec["size"]
+            ttfb = [first_byte[db_id] - started[db_id] for db_id in first_byte if db_id in started]
+            result = {
+                "tasks": spec["tasks"], "size_bytes": spec["size"], "settings": spec["settings"], "server": spec.get("server", {}), "completed": completed,
+                "complete": finished.count("Complete"), "errors": finished.count("Error"), "wall_s": round(wall, 3),
+                "mb_per_s": round(total_bytes / wall / MB, 2), "cpu_s_per_gb": round(cpu / (total_bytes / 1024 ** 3), 3),
+                "sqlite_commits_per_task": round((store.commits - commits) / spec["tasks"], 2), "sqlite_rows_per_task": round((store.rows_written - rows_written) / spec["tasks"], 2),
+                "peak_rss_mb": peak_rss_mb(), "connection_limit_final": max(connection_limits, default=None), "ttfb_ms_p50": round(percentile(ttfb, 0.5) * 1000, 1) if ttfb else None, "ttfb_ms_p95": round(percentile(ttfb, 0.95) * 1000, 1) if ttfb else None,
+            }
+            store.close()
+            return result
+    finally: server.terminate(); server.wait()
+
+def git_revision():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(SERVER), capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the download benchmark scenarios against a local fault-injecting server and emit JSON results.")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--quick", action="store_true", help="smaller payloads for smoke runs"); parser.add_argument("--timeout", type=float, default=900)
+    parser.add_argument("--output", help="write results JSON here instead of stdout"); parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown: parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.child:
+        spec = dict(SCENARIOS[args.child], **(QUICK.get(args.child, {}) if args.quick else {}))
+        print("RESULT " + json.dumps(run_scenario(args.child, spec, args.timeout)), flush=True); return
+    results = {"meta": {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(), "quick": args.quick,
+                        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds")}, "scenarios": {}}
+    for name in args.scenarios or SCENARIOS:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--timeout", str(args.timeout)] + (["--quick"] if args.quick else []), capture_output=True, text=True)
+        lines = [line for line in child.stdout.splitlines() if line.startswith("RESULT ")]
+        results["scenarios"][name] = json.loads(lines[-1][7:]) if lines else {"failed": True, "stderr": child.stderr[-2000:]}
+        print(f"{name}: {results['scenarios'][name]}", file=sys.stderr)
+    if args.baseline:
+        # 与上一次的结果对比, 只打印变化, 不影响输出的 JSON
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)["scenarios"]
+        for name, result in results["scenarios"].items():
+            for metric in ("mb_per_s", "cpu_s_per_gb", "sqlite_commits_per_task", "peak_rss_mb", "ttfb_ms_p50"):
+                old, new = baseline.get(name, {}).get(metric), result.get(metric)
+                if old and new is not None: print(f"{name}.{metric}: {old} -> {new} ({new / old - 1:+.1%})", file=sys.stderr)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(output + "\n")
+    else: print(output)
+
+if __name__ == "__main__":
+    main()
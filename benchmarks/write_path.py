@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import DownloadEngine
+from storage import HistoryStore
+
+# 比较写盘路径的 CPU 开销: 服务器跑在子进程里, 只统计下载进程自己的 CPU 时间
+# legacy 复现旧版 DownloadWorker 的 iter_content(8192) 循环, 作为对照
+PROFILES = {"legacy": None, "64k": {"io_buffer_kb": 64, "write_behind": False}, "tuned": {"io_buffer_kb": 1024, "write_behind": False},
+            "write-behind": {"io_buffer_kb": 1024, "write_behind": True}}
+
+def measure_legacy(port, size, workdir):
+    filepath = os.path.join(workdir, "legacy.bin")
+    cpu, wall = time.process_time(), time.monotonic()
+    with requests.get(f"http://127.0.0.1:{port}/payload.bin", stream=True, timeout=30) as r, open(filepath, 'wb') as f:
+        downloaded_size, last_time = 0, time.time()
+        for chunk in r.iter_content(chunk_size=8192):
+            f.write(chunk); downloaded_size += len(chunk)
+            if time.time() - last_time >= 1: last_time = time.time()
+    cpu, wall = time.process_time() - cpu, time.monotonic() - wall
+    if os.path.getsize(filepath) != size: raise SystemExit("legacy: download failed")
+    os.remove(filepath)
+    return cpu, wall
+
+async def measure(port, size, profile, workdir):
+    store = HistoryStore(os.path.join(workdir, f"{profile}.db"))
+    engine = DownloadEngine(store, dict(PROFILES[profile], segments_per_task=1))
+    url, filepath = f"http://127.0.0.1:{port}/payload.bin", os.path.join(workdir, f"{profile}.bin")
+    db_id = store.add_task(url, profile, filepath)
+    cpu, wall = time.process_time(), time.monotonic()
+    status = await engine.download(db_id, url, filepath)
+    cpu, wall = time.process_time() - cpu, time.monotonic() - wall
+    await engine.close(); store.close()
+    if status != "Complete" or os.path.getsize(filepath) != size: raise SystemExit(f"{profile}: download failed ({status})")
+    os.remove(filepath)
+    return cpu, wall
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CPU seconds per downloaded GB for the baseline and tuned write paths.")
+    parser.add_argument("--size-mb", type=int, default=1024); parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        size = args.size_mb * 1024 * 1024
+        with open(os.path.join(workdir, "payload.bin"), "wb") as f:
+            for _ in range(args.size_mb): f.write(os.urandom(1024 * 1024))
+        server = subprocess.Popen([sys.executable, "-u", "-m", "http.server", "0", "--bind", "127.0.0.1"], cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            port = int(server.stdout.readline().split("port ")[1].split()[0])
+            results = {}
+            for profile in PROFILES:
+                runs = [measure_legacy(port, size, workdir) if profile == "legacy" else asyncio.run(measure(port, size, profile, workdir)) for _ in range(args.runs)]
+                cpu, wall = min(runs)
+                results[profile] = cpu / (size / 1024 ** 3)
+                print(f"{profile:>12}: {results[profile]:.2f} CPU s/GB, {size / wall / 1024 ** 2:.0f} MB/s")
+        finally: server.terminate()
+    print("CPU per GB vs legacy: " + ", ".join(f"{profile} {results[profile] / results['legacy'] - 1:+.0%}" for profile in PROFILES if profile != "legacy"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import sys
+import os
+import json
+
+# --- 1. 配置目录与设置 (不依赖 Qt, 图形界面和无界面模式共用) ---
+def get_app_dir():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+PORTABLE_CONFIG_DIR = get_app_dir()
+USER_CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".SummerSunDownloader")
+
+def get_config_dir():
+    if os.path.exists(os.path.join(PORTABLE_CONFIG_DIR, "settings.json")):
+        return PORTABLE_CONFIG_DIR
+    else:
+        os.makedirs(USER_CONFIG_DIR, exist_ok=True)
+        return USER_CONFIG_DIR
+
+CONFIG_DIR = get_config_dir()
+DB_FILE = os.path.join(CONFIG_DIR, "history.db")
+SETTINGS_FILE = os.path.join(CONFIG_DIR, "settings.json")
+
+# settings 原地更新, 引擎和界面持有的都是同一个字典
+settings = {}
+
+def load_settings():
+    try:
+        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        loaded = {"theme": "Dark Knight", "max_concurrent": 3, "language": "en", "speed_limit_kb": 0, "minimize_to_tray": True, "segments_per_task": 4}
+    settings.clear(); settings.update(loaded)
+    defaults = {"download_path": os.path.expanduser("~/Downloads"), "language": "en", "speed_limit_kb": 0, "minimize_to_tray": True, "max_concurrent": 3, "theme": "Dark Knight", "segments_per_task": 4,
+                "max_connections_per_host": 8, "keepalive_timeout": 30, "dns_cache_ttl": 300, "host_speed_limits_kb": {}, "speed_schedule": [],
+                "io_buffer_kb": 1024, "write_behind": False, "hash_algorithm": "sha256",
+                "retry_budgets": {"timeout": 5, "server": 5, "connection": 8}, "retry_backoff_base": 1, "retry_backoff_max": 60,
+                "adaptive_concurrency": True, "min_connections_per_host": 1,
+                "post_process_rules": [], "post_process_workers": 2, "stream_decompress": True}
+    for key, value in defaults.items():
+        if key not in settings or settings.get(key) in [None, ""]:
+            settings[key] = value
+    return settings
+
+def save_settings():
+    with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=4)
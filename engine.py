@@ -0,0 +1,881 @@
+import asyncio
+import collections
+import hashlib
+import heapq
+import os
+import random
+import shutil
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+import aiohttp
+from metrics import REGISTRY
+
+# --- 1. 下载引擎配置 (不依赖 Qt, 可在无界面环境中运行) ---
+REQUEST_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'}
+MIN_SEGMENT_SIZE = 1024 * 1024
+MIN_STEAL_SIZE = 512 * 1024
+STEAL_OVERHEAD = 0.25
+CHUNK_SIZE = 64 * 1024
+READ_BUFSIZE = 512 * 1024
+PART_SUFFIX = ".part"
+HASH_READ_SIZE = 1024 * 1024
+HASH_LENGTHS = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}
+DEFAULT_RETRY_BUDGETS = {"timeout": 5, "server": 5, "connection": 8}
+LAG_INTERVAL = 0.25
+CONCURRENCY_WINDOW = 2.0
+PROBE_HOLD = 15
+SESSION_IDLE_TIMEOUT = 300
+
+# 引擎指标, 由 /metrics 输出
+BYTES_RECEIVED = REGISTRY.counter("downloader_bytes_received_total", "Bytes received from the network", ("host",))
+TTFB_SECONDS = REGISTRY.histogram("downloader_ttfb_seconds", "Time from sending a request to receiving the response headers", ("host",))
+THROUGHPUT = REGISTRY.histogram("downloader_task_throughput_bytes_per_second", "Per-task throughput sampled on every progress tick",
+                                buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2))
+RETRIES = REGISTRY.counter("downloader_retries_total", "Failed requests by error class and whether they were retried", ("error_class", "outcome"))
+SEGMENTS_STOLEN = REGISTRY.counter("downloader_segments_stolen_total", "Byte ranges split off a slower connection by an idle one")
+MIRRORS_DROPPED = REGISTRY.counter("downloader_mirrors_dropped_total", "Mirrors dropped from a task, by reason", ("reason",))
+FINISHED = REGISTRY.counter("downloader_tasks_finished_total", "Tasks that left the engine, by final status", ("status",))
+CONCURRENCY_CHANGES = REGISTRY.counter("downloader_concurrency_adjustments_total", "Per-host connection limit changes made by the adaptive controller", ("direction",))
+LOOP_LAG = REGISTRY.histogram("downloader_event_loop_lag_seconds", "How late a periodic timer fired on each event loop", ("loop",),
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+# --- 2. 按主机共享的连接池 (长连接复用 + DNS 缓存) 与自适应连接数上限 ---
+class HostPool:
+    # 每个主机一个会话; 连接池的每主机上限跟随 ceiling() (HostConcurrency 的上界), 空闲超过 SESSION_IDLE_TIMEOUT 秒的会话由 sweep 关闭
+    def __init__(self, settings, ceiling):
+        self.settings, self.ceiling = settings, ceiling
+        self.sessions, self.counters, self.last_used = {}, {}, {}
+    def session_for(self, url):
+        host = urlsplit(url).netloc.lower()
+        session, self.last_used[host] = self.sessions.get(host), time.monotonic()
+        if session is None or session.closed:
+            counters = self.counters.setdefault(host, {"requests": 0, "connections_created": 0, "connections_reused": 0, "dns_cache_hits": 0, "dns_cache_misses": 0})
+            trace = aiohttp.TraceConfig()
+            for signal, key in ((trace.on_request_start, "requests"), (trace.on_connection_create_end, "connections_created"), (trace.on_connection_reuseconn, "connections_reused"),
+                                (trace.on_dns_cache_hit, "dns_cache_hits"), (trace.on_dns_cache_miss, "dns_cache_misses")):
+                signal.append(self._counter(counters, key))
+            trace.on_request_start.append(self._request_started); trace.on_request_end.append(self._request_ended)
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.ceiling(), keepalive_timeout=self.settings.get("keepalive_timeout", 30),
+                                             use_dns_cache=True, ttl_dns_cache=self.settings.get("dns_cache_ttl", 300))
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+            session = self.sessions[host] = aiohttp.ClientSession(headers=REQUEST_HEADERS, timeout=timeout, connector=connector, trace_configs=[trace], read_bufsize=READ_BUFSIZE)
+        return session
+    @staticmethod
+    def _counter(counters, key):
+        async def increment(session, ctx, params): counters[key] += 1
+        return increment
+    @staticmethod
+    async def _request_started(session, ctx, params): ctx.started = time.monotonic()
+    @staticmethod
+    async def _request_ended(session, ctx, params): TTFB_SECONDS.observe(time.monotonic() - ctx.started, urlsplit(str(params.url)).netloc.lower())
+    def stats(self):
+        result = {}
+        for host, counters in list(self.counters.items()):
+            session = self.sessions.get(host)
+            connector = session.connector if session and not session.closed else None
+            in_use = len(getattr(connector, "_acquired", ())) if connector else 0
+            idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values()) if connector else 0
+            result[host] = dict(counters, open_sockets=in_use + idle, idle_sockets=idle)
+        return result
+    async def sweep(self):
+        # 每个调整周期调用: 上界随设置变化时同步到已有的连接池 (aiohttp 没有公开的修改方法); 长时间没有请求的会话关闭
+        now, ceiling = time.monotonic(), self.ceiling()
+        for host, session in list(self.sessions.items()):
+            connector = session.connector
+            if session.closed or connector is None: del self.sessions[host]; continue
+            connector._limit_per_host = ceiling
+            if connector._acquired: self.last_used[host] = now
+            elif now - self.last_used.get(host, now) > SESSION_IDLE_TIMEOUT:
+                del self.sessions[host]; self.last_used.pop(host, None); await session.close()
+    async def close(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions: await session.close()
+
+class HostConcurrency:
+    # 每个主机同时下载的连接数上限, 在 [min_connections_per_host, max_connections_per_host] 之间按 AIMD 调整, 每个周期评估一次:
+    # 名额用满且还有连接或任务在等时试探着加连接 (没学过的主机先翻倍, 之后每次 +1); 试探后出现拥塞 (429/503 超过请求数的八分之一, 或其他错误超过四分之一; 单次出错不算)
+    # 或总吞吐量没有提高 5% 就退回去, 隔 PROBE_HOLD 个周期再试; 没在试探时出现拥塞则 429/503 减半, 其他错误减到 3/4
+    # 调低后的两个周期里还会收到按旧上限发出的请求 (包括退避中的重试) 的错误, 这期间不再重复调低; adaptive_concurrency 关闭时固定为上界
+    def __init__(self, settings):
+        self.settings, self.hosts, self.learned = settings, {}, {}
+    def bounds(self):
+        low = max(self.settings.get("min_connections_per_host", 1), 1)
+        return low, max(self.settings.get("max_connections_per_host", 8), low)
+    def state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            low, high = self.bounds()
+            learned = self.learned.get(host)
+            state = self.hosts[host] = {"limit": float(learned or min(max(self.settings.get("segments_per_task", 4), low), high)), "growing": learned is None, "probe": None, "hold": 0, "cooldown": 0,
+                                        "in_use": 0, "peak": 0, "waiters": collections.deque(), "blocked": False, "bytes": 0, "requests": 0, "errors": 0, "throttled": 0, "started": time.monotonic()}
+        return state
+    def limit(self, host):
+        # 每次读取时按当前设置的上下界截断, 改设置立即生效
+        low, high = self.bounds()
+        if not self.settings.get("adaptive_concurrency", True): return high
+        return min(max(int(self.state(host)["limit"]), low), high)
+    async def acquire(self, host):
+        state = self.state(host)
+        if state["in_use"] >= self.limit(host) or state["waiters"]:
+            waiter = asyncio.get_running_loop().create_future(); state["waiters"].append(waiter)
+            try: await waiter
+            except asyncio.CancelledError:
+                # 已经分到名额又被取消时把名额还回去
+                if waiter.done() and not waiter.cancelled(): self.release(host)
+                elif waiter in state["waiters"]: state["waiters"].remove(waiter)
+                raise
+        else: state["in_use"] += 1
+        state["requests"] += 1; state["peak"] = max(state["peak"], state["in_use"])
+    def release(self, host):
+        state = self.hosts[host]; state["in_use"] -= 1; self._wake(host, state)
+    def shed(self, host):
+        # 上限降低后, 超出的连接在读完当前这块时主动让出名额 (只有分段下载能中途停下, 剩下的部分由别的连接接着下)
+        state = self.hosts[host]
+        if state["in_use"] <= self.limit(host): return False
+        state["in_use"] -= 1; return True
+    def _wake(self, host, state):
+        limit = self.limit(host)
+        while state["waiters"] and state["in_use"] < limit:
+            waiter = state["waiters"].popleft()
+            if not waiter.done(): state["in_use"] += 1; waiter.set_result(None)
+    def received(self, host, amount): self.state(host)["bytes"] += amount
+    def blocked(self, host): self.state(host)["blocked"] = True
+    def failed(self, host, error):
+        state = self.state(host); state["errors"] += 1
+        if isinstance(error, aiohttp.ClientResponseError) and error.status in (429, 503): state["throttled"] += 1
+    def tick(self):
+        # 结束一个评估周期, 返回上限有变化的主机 {host: limit}
+        now, changed, (low, high) = time.monotonic(), {}, self.bounds()
+        if not self.settings.get("adaptive_concurrency", True): return changed
+        for host, state in self.hosts.items():
+            elapsed, previous = now - state["started"], state["limit"]
+            rate, saturated = state["bytes"] / elapsed if elapsed > 0 else 0, state["peak"] >= int(state["limit"])
+            (probe, state["probe"]), (cooling, state["cooldown"]) = (state["probe"], None), (state["cooldown"], max(state["cooldown"] - 1, 0))
+            congested = (state["throttled"] >= 2 and state["throttled"] * 8 > state["requests"]) or (state["errors"] >= 2 and state["errors"] * 4 > state["requests"])
+            if probe and (congested or (saturated and rate < probe[1] * 1.05)):
+                state["limit"], state["growing"], state["hold"], state["cooldown"] = state["limit"] - probe[0], False, PROBE_HOLD, 2; CONCURRENCY_CHANGES.inc("revert")
+            elif congested:
+                if not cooling:
+                    state["limit"], state["growing"], state["hold"], state["cooldown"] = state["limit"] * (0.5 if state["throttled"] >= 2 else 0.75), False, max(state["hold"], 2), 2; CONCURRENCY_CHANGES.inc("decrease")
+            elif state["hold"]: state["hold"] -= 1
+            elif saturated and (state["waiters"] or state["blocked"]) and state["limit"] < high:
+                step = min(state["limit"] if state["growing"] else 1, high - state["limit"])
+                state["limit"], state["probe"] = state["limit"] + step, (step, rate); CONCURRENCY_CHANGES.inc("increase")
+            state["limit"] = min(max(state["limit"], low), high)
+            if state["limit"] != previous: changed[host] = state["limit"]
+            state.update(bytes=0, requests=0, errors=0, throttled=0, peak=state["in_use"], blocked=False, started=now)
+            self._wake(host, state)
+        return changed
+    def stats(self):
+        return {host: {"connection_limit": self.limit(host), "connections_in_use": state["in_use"], "connections_waiting": len(state["waiters"])} for host, state in list(self.hosts.items())}
+
+# --- 3. 全局令牌桶限速 (所有任务共享, 可叠加按主机/按任务上限和时间段计划) ---
+class TokenBucket:
+    def __init__(self):
+        self.rate, self.tokens, self.updated = 0, 0.0, time.monotonic()
+    def reserve(self, rate, amount):
+        # 允许令牌透支: 先取走数据, 再按欠账时长休眠, 长期平均速率严格等于 rate
+        now = time.monotonic()
+        if rate != self.rate: self.rate, self.tokens = rate, min(self.tokens, 0.0)
+        self.tokens = min(rate * 0.25, self.tokens + (now - self.updated) * rate) - amount
+        self.updated = now
+        return -self.tokens / rate if self.tokens < 0 else 0
+
+class BandwidthLimiter:
+    def __init__(self, settings):
+        self.settings = settings
+        self.global_bucket, self.host_buckets, self.task_buckets = TokenBucket(), {}, {}
+        self.task_limits = {}
+        self._global_limit, self._checked_at = 0, 0
+    def global_limit_kb(self):
+        now = time.monotonic()
+        if now - self._checked_at >= 1:
+            self._global_limit, self._checked_at = self._scheduled_limit_kb(datetime.now().strftime("%H:%M")), now
+        return self._global_limit
+    def _scheduled_limit_kb(self, clock):
+        # speed_schedule: [{"start": "09:00", "end": "18:00", "limit_kb": 500}, ...], 跨午夜的时间段 start > end
+        for window in self.settings.get("speed_schedule", []):
+            start, end = window.get("start", "00:00"), window.get("end", "24:00")
+            if (start <= clock < end) if start <= end else (clock >= start or clock < end):
+                return window.get("limit_kb", 0)
+        return self.settings.get("speed_limit_kb", 0)
+    async def throttle(self, db_id, host, amount):
+        delay = 0
+        for buckets, key, limit_kb in ((None, None, self.global_limit_kb()), (self.host_buckets, host, self.settings.get("host_speed_limits_kb", {}).get(host, 0)),
+                                       (self.task_buckets, db_id, self.task_limits.get(db_id, 0))):
+            if limit_kb > 0:
+                bucket = self.global_bucket if buckets is None else buckets.setdefault(key, TokenBucket())
+                delay = max(delay, bucket.reserve(limit_kb * 1024, amount))
+        if delay > 0: await asyncio.sleep(delay)
+    def chunk_cap(self, db_id, host):
+        # 限速时单次读取不超过令牌桶的突发额度, 否则大块读取会变成长时间的停顿
+        limits = [limit_kb for limit_kb in (self.global_limit_kb(), self.settings.get("host_speed_limits_kb", {}).get(host, 0), self.task_limits.get(db_id, 0)) if limit_kb > 0]
+        return int(min(limits) * 1024 * 0.25) if limits else 0
+    def forget(self, db_id):
+        self.task_buckets.pop(db_id, None); self.task_limits.pop(db_id, None)
+
+# --- 4. 写盘路径 (复用缓冲区 + 双缓冲后写 + 流式摘要) ---
+def part_path(filepath): return filepath + PART_SUFFIX
+def recover_part(partpath, downloaded_size):
+    # 单连接的 .part 按 content-length 预分配, 文件长度说明不了进度; 它是顺序写入的, 从记录的进度往后找第一个空洞 (稀疏文件里没写过的区域) 就是实际写到的位置
+    # 最后一个文件系统块可能只写了一半, 整块丢掉, 再把文件截到这里; 不支持 SEEK_HOLE 或文件里没有空洞时沿用记录的进度
+    with open(partpath, 'r+b') as f:
+        stat = os.fstat(f.fileno())
+        recovered = min(downloaded_size, stat.st_size)
+        if hasattr(os, "SEEK_HOLE") and recovered < stat.st_size:
+            try: hole = os.lseek(f.fileno(), recovered, os.SEEK_HOLE)
+            except OSError: hole = stat.st_size
+            if hole < stat.st_size: recovered = max(recovered, hole - stat.st_blksize)
+        f.truncate(recovered)
+    return recovered
+class RemoteChanged(IOError):
+    pass
+class MirrorMismatch(IOError):
+    pass
+def classify_error(error):
+    # 只有网络层的暂时性错误才自动重试; 4xx, 校验失败和磁盘错误直接报错
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ServerTimeoutError)): return "timeout"
+    if isinstance(error, aiohttp.ClientResponseError): return "server" if error.status >= 500 or error.status == 429 else None
+    if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, ConnectionError)): return "connection"
+    return None
+def if_range_value(etag, last_modified):
+    # If-Range 只能用强校验值, 弱 ETag 退回 Last-Modified
+    return etag if etag and not etag.startswith("W/") else last_modified
+def parse_checksum(value):
+    # 接受 "sha256:<hex>" 或只给十六进制摘要 (按长度推断算法), 统一成 "算法:小写摘要"
+    algorithm, _, digest = value.strip().lower().rpartition(":")
+    algorithm = algorithm.replace("-", "") or HASH_LENGTHS.get(len(digest), "")
+    if algorithm not in hashlib.algorithms_available or hashlib.new(algorithm).digest_size * 2 != len(digest) or not all(c in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Unsupported checksum: {value}")
+    return f"{algorithm}:{digest}"
+
+class BufferedWriter:
+    # 网络数据先拷进复用的 bytearray, 攒满一块 (或超过 1 秒) 才写盘; write_behind 时写盘在线程里进行, 同时填充另一块
+    def __init__(self, f, buffer_size, write_behind=False, on_written=None, position=0, on_submit=None):
+        self.f, self.write_behind, self.on_written = f, write_behind, on_written or (lambda amount: None)
+        self.position, self.on_submit = position, on_submit or (lambda offset, data: None)
+        self.buffers = [bytearray(buffer_size) for _ in range(2 if write_behind else 1)]
+        self.view, self.used, self.pending, self.flushed_at = memoryview(self.buffers[0]), 0, None, time.monotonic()
+    async def write(self, data):
+        if not self.used and len(data) >= len(self.view) // 2:
+            # 大块数据已经是 read(n) 拼好的一整块, 直接交给写盘, 省掉一次拷贝
+            await self._submit(data); return
+        data = memoryview(data)
+        while data:
+            amount = min(len(data), len(self.view) - self.used)
+            self.view[self.used:self.used + amount] = data[:amount]
+            self.used += amount; data = data[amount:]
+            if self.used == len(self.view): await self._flush_buffer()
+        if time.monotonic() - self.flushed_at >= 1: await self._flush_buffer()
+    async def flush(self):
+        await self._flush_buffer()
+        if self.pending: await self._wait_pending()
+    async def _flush_buffer(self):
+        self.flushed_at = time.monotonic()
+        if not self.used: return
+        view, self.used = self.view[:self.used], 0
+        await self._submit(view)
+        if self.write_behind: self.buffers.reverse(); self.view = memoryview(self.buffers[0])
+    async def _submit(self, data):
+        self.on_submit(self.position, data); self.position += len(data)
+        if self.pending: await self._wait_pending()
+        if self.write_behind: self.pending = asyncio.ensure_future(asyncio.to_thread(self.f.write, data))
+        else: self.on_written(self.f.write(data))
+    async def _wait_pending(self):
+        pending, self.pending = self.pending, None
+        self.on_written(await pending)
+
+class StreamHasher:
+    # 按文件顺序增量计算摘要: 写到摘要位置的数据直接喂进去, 分段下载中先落盘的部分之后再从文件补读
+    # hashlib 的内部状态无法序列化, 暂停/续传在同一进程里沿用这个对象; 重启后从 .part 文件补读已下载的前缀
+    # decoder 是可选的边下边解压器 (postprocess.StreamDecoder), 按同样的顺序收到同样的数据
+    def __init__(self, algorithm):
+        self.algorithm, self.hash, self.offset, self.expected, self.decoder = algorithm, hashlib.new(algorithm), 0, None, None
+    def rewind(self, offset):
+        # 摘要只能从头重算; 已经算过的位置超出了实际续传的位置时丢弃状态
+        if self.offset > offset:
+            self.hash, self.offset = hashlib.new(self.algorithm), 0
+            if self.decoder: self.decoder.rewind()
+    def feed(self, offset, data):
+        if offset == self.offset:
+            self.hash.update(data); self.offset += len(data)
+            if self.decoder: self.decoder.feed(data)
+    def discard(self):
+        # 不再使用时结束解压器, 删掉解了一半的文件
+        if self.decoder: self.decoder.discard(); self.decoder = None
+    async def catch_up(self, path, end):
+        with open(path, 'rb') as f:
+            while self.offset < end:
+                offset = self.offset
+                data = await asyncio.to_thread(self._read, f, offset, min(HASH_READ_SIZE, end - offset))
+                if not data: break
+                self.feed(offset, data)
+    @staticmethod
+    def _read(f, offset, size):
+        f.seek(offset); return f.read(size)
+    def checksum(self): return f"{self.algorithm}:{self.hash.hexdigest()}"
+
+# --- 5. 异步下载引擎 ---
+class DownloadEngine:
+    def __init__(self, store, settings, on_progress=None, on_finished=None, on_status=None, open_decoder=None):
+        self.store, self.settings = store, settings
+        # 可选: open_decoder(db_id, filepath) 返回边下边解压的解压器或 None, 在线程里调用
+        # 任务结束时 on_finished(db_id, status) 也在线程里调用: 后处理要读库, 第一次还要启动进程池, 不能卡住正在进行的传输
+        self.on_progress = on_progress or (lambda db_id, downloaded_size, total_size, speed: None)
+        self.on_finished = on_finished or (lambda db_id, status: None)
+        self.on_status = on_status or (lambda db_id, status: None)
+        self.open_decoder = open_decoder
+        self.loop, self.limiter, self.concurrency = None, BandwidthLimiter(settings), HostConcurrency(settings)
+        self.pool = HostPool(settings, lambda: self.concurrency.bounds()[1])
+        self.active, self.paused = set(), set()
+        # 调度队列: queued 保存排队任务, host_queues 按主机分堆 (-priority, position, db_id), 实现主机间公平
+        self.queued, self.host_queues, self.host_active = {}, {}, {}
+        self.hashers, self.retries = {}, {}
+        # 本次运行中每个活动任务收到的字节数, 供 /metrics 按任务输出
+        self.transferred, self._lag_task, self._tune_task = {}, None, None
+
+    # 线程安全的外部接口: GUI 线程调用, 协程在引擎自己的事件循环里执行
+    def start(self):
+        if self.loop: return
+        # 上次运行学到的各主机连接数上限
+        self.concurrency.learned = self.store.load_connection_limits()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True, name="DownloadEngine").start()
+        self.loop.call_soon_threadsafe(lambda: setattr(self, "_lag_task", self.loop.create_task(self._measure_lag())))
+        self.loop.call_soon_threadsafe(lambda: setattr(self, "_tune_task", self.loop.create_task(self._tune_concurrency())))
+    def stop(self):
+        if not self.loop: return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+    def submit(self, db_id, url, filepath, resume_from=0):
+        return asyncio.run_coroutine_threadsafe(self.download(db_id, url, filepath, resume_from), self.loop)
+    def pause(self, db_id): self.loop.call_soon_threadsafe(self._pause, db_id)
+    def enqueue(self, db_id, url, filepath, priority=0): self.enqueue_many([(db_id, url, filepath, priority)], notify=True)
+    def enqueue_many(self, tasks, notify=False):
+        # 返回因正在下载或后处理而没有重新排队的 db_id
+        positions = self.store.queue_tasks([(db_id, priority) for db_id, _, _, priority in tasks])
+        self.loop.call_soon_threadsafe(self._enqueue_many, [(*task, position) for task, position in zip(tasks, positions) if position is not None], notify)
+        return {task[0] for task, position in zip(tasks, positions) if position is None}
+    def set_priority(self, db_id, priority):
+        self.store.update_task(db_id, flush=True, priority=priority)
+        self.loop.call_soon_threadsafe(self._reprioritize, db_id, priority)
+    def set_task_limit(self, db_id, limit_kb):
+        self.store.update_task(db_id, flush=True, speed_limit_kb=limit_kb)
+        self.loop.call_soon_threadsafe(self._set_task_limit, db_id, limit_kb)
+    def _set_task_limit(self, db_id, limit_kb):
+        if db_id in self.active: self.limiter.task_limits[db_id] = limit_kb
+    def restore_queue(self): return asyncio.run_coroutine_threadsafe(self._restore_queue(), self.loop)
+    def reschedule(self): self.loop.call_soon_threadsafe(self._dispatch)
+
+    async def close(self):
+        for task in (self._lag_task, self._tune_task):
+            if task: task.cancel()
+        await self.pool.close()
+    async def _measure_lag(self):
+        # 定时器实际触发比预期晚多少, 反映事件循环被阻塞的程度
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            LOOP_LAG.observe(max(time.monotonic() - expected, 0), "engine")
+    async def _tune_concurrency(self):
+        # 每个周期调整一次各主机的连接数上限; 有变化就保存, 并重新调度 (上限提高后同一主机可以多开任务)
+        while True:
+            await asyncio.sleep(CONCURRENCY_WINDOW)
+            await self.pool.sweep()
+            changed = self.concurrency.tick()
+            if changed: self.store.save_connection_limits(changed); self._dispatch()
+
+    # --- 调度: 优先级 + 主机公平 + 运行时可调的并发上限 ---
+    def _enqueue_many(self, entries, notify):
+        for entry in entries: self._enqueue(*entry, notify=notify, dispatch=False)
+        self._dispatch()
+    def _enqueue(self, db_id, url, filepath, priority, position, notify=True, dispatch=True):
+        if db_id in self.active: return
+        host = urlsplit(url).netloc.lower()
+        self.queued[db_id] = {"url": url, "filepath": filepath, "priority": priority, "position": position, "host": host}
+        heapq.heappush(self.host_queues.setdefault(host, []), (-priority, position, db_id))
+        if notify: self.on_status(db_id, "Queued")
+        if dispatch: self._dispatch()
+    def _reprioritize(self, db_id, priority):
+        entry = self.queued.get(db_id)
+        if entry is None: return
+        entry["priority"] = priority
+        heapq.heappush(self.host_queues.setdefault(entry["host"], []), (-priority, entry["position"], db_id))
+        self._dispatch()
+    def _pause(self, db_id):
+        if self.queued.pop(db_id, None) is not None:
+            self.store.update_task(db_id, flush=True, status="Paused")
+            self.on_finished(db_id, "Paused")
+        elif db_id in self.active: self.paused.add(db_id)
+    async def _restore_queue(self):
+        await asyncio.to_thread(self._recover_interrupted)
+        for db_id, url, filepath, priority, position in await asyncio.to_thread(self.store.load_queue):
+            self._enqueue(db_id, url, filepath, priority or 0, position or 0)
+    def _recover_interrupted(self):
+        # 上次异常退出时还在下载的任务: 记录的进度最多落后一个刷新周期, 按磁盘上的 .part 校正后改回 Queued, 随后和其他排队任务一起恢复
+        tasks, segments = self.store.load_interrupted()
+        if not tasks: return
+        started, recovered, segment_rows = time.perf_counter(), [], []
+        for db_id, filepath, downloaded_size in tasks:
+            partpath, plan = part_path(filepath or ""), segments.get(db_id, [])
+            if not filepath or not os.path.exists(partpath):
+                # 没有 .part: 目标文件已存在时交给 _download 处理 (旧版本直接写目标文件, 或改名后没来得及记为完成), 否则从头下载
+                if filepath and os.path.exists(filepath): recovered.append((db_id, downloaded_size or 0)); continue
+                recovered.append((db_id, 0)); segment_rows += [(db_id, seg[0], 0) for seg in plan if seg[3]]; continue
+            try:
+                if plan:
+                    # 分段的进度都是数据写入之后才记录的, 直接沿用; 只把超出文件长度的部分 (文件被截断过) 退回去
+                    size = os.path.getsize(partpath)
+                    for seg in plan:
+                        downloaded = max(min(seg[3], size - seg[1]), 0)
+                        if downloaded != seg[3]: seg[3] = downloaded; segment_rows.append((db_id, seg[0], downloaded))
+                    recovered.append((db_id, sum(seg[3] for seg in plan)))
+                else: recovered.append((db_id, recover_part(partpath, downloaded_size or 0)))
+            except OSError as e:
+                print(f"Recovery error (ID: {db_id}): {e}"); recovered.append((db_id, downloaded_size or 0))
+        self.store.recover_tasks(recovered, segment_rows)
+        print(f"Recovered {len(recovered)} interrupted download(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+    def _next_queued(self):
+        best = None
+        for host, heap in list(self.host_queues.items()):
+            # 惰性删除: 已出队或优先级已变化的旧条目直接丢弃
+            while heap and (heap[0][2] not in self.queued or (-self.queued[heap[0][2]]["priority"], self.queued[heap[0][2]]["position"]) != heap[0][:2]):
+                heapq.heappop(heap)
+            if not heap:
+                del self.host_queues[host]; continue
+            # 每个任务至少占一个连接, 同一主机同时运行的任务数不超过它的连接数上限
+            if self.host_active.get(host, 0) >= self.concurrency.limit(host):
+                self.concurrency.blocked(host); continue
+            key = (heap[0][0], self.host_active.get(host, 0), heap[0][1])
+            if best is None or key < best[0]: best = (key, host)
+        if best is None: return None
+        db_id = heapq.heappop(self.host_queues[best[1]])[2]
+        return db_id, self.queued.pop(db_id)
+    def _dispatch(self):
+        while len(self.active) < max(self.settings.get("max_concurrent", 3), 1):
+            picked = self._next_queued()
+            if picked is None: return
+            db_id, entry = picked
+            self._mark_active(db_id, entry["url"])
+            self.store.update_task(db_id, status="Downloading")
+            self.on_status(db_id, "Downloading")
+            self.loop.create_task(self._download(db_id, entry["url"], entry["filepath"]))
+    def _mark_active(self, db_id, url):
+        host = urlsplit(url).netloc.lower()
+        self.paused.discard(db_id); self.active.add(db_id)
+        self.host_active[host] = self.host_active.get(host, 0) + 1
+
+    async def download(self, db_id, url, filepath, resume_from=0):
+        self._mark_active(db_id, url)
+        return await self._download(db_id, url, filepath, resume_from)
+    async def _download(self, db_id, url, filepath, resume_from=None):
+        host = urlsplit(url).netloc.lower()
+        try:
+            state = await asyncio.to_thread(self.store.load_task_state, db_id)
+            self.limiter.task_limits[db_id] = state["speed_limit_kb"]
+            if resume_from is None: resume_from = state["downloaded_size"]
+            segments = await asyncio.to_thread(self.store.load_segments, db_id)
+            completed = state["total_size"] and state["downloaded_size"] >= state["total_size"] and os.path.exists(filepath)
+            # 旧版本直接写目标文件, 未完成的任务续传前先改名为 .part
+            if not completed and (resume_from or segments) and not os.path.exists(part_path(filepath)) and os.path.exists(filepath): os.replace(filepath, part_path(filepath))
+            hasher = self._hasher(db_id, state["expected_checksum"])
+            if state["expected_checksum"] and await asyncio.to_thread(self._link_cached, db_id, state["expected_checksum"], filepath): status = "Complete"
+            elif completed and (state["etag"] or state["last_modified"]):
+                # 已完成的任务再次下载: 条件请求, 304 时不传输任何数据
+                status = await self._run_single(db_id, url, filepath, 0, {"If-None-Match": state["etag"], "If-Modified-Since": state["last_modified"]})
+            else:
+                # 后处理的第一步是解压时, 下载的同时就解压 (见 postprocess.py); 解压器要从文件开头收到数据
+                if self.open_decoder and hasher.decoder is None and not hasher.offset: hasher.decoder = await asyncio.to_thread(self.open_decoder, db_id, filepath)
+                try: status = await self._fetch(db_id, url, filepath, resume_from, segments, if_range_value(state["etag"], state["last_modified"]), state["mirrors"])
+                except RemoteChanged as e:
+                    # 续传期间远端文件变了, 已下载的部分作废, 从头重新下载
+                    print(f"Remote file changed (ID: {db_id}): {e}")
+                    await asyncio.to_thread(self.store.save_segment_plan, db_id, [], None)
+                    if os.path.exists(part_path(filepath)): os.remove(part_path(filepath))
+                    status = await self._fetch(db_id, url, filepath, 0, [], None, state["mirrors"])
+        except Exception as e:
+            print(f"Worker Error (ID: {db_id}): {e}")
+            self.store.update_task(db_id, flush=True, status="Error")
+            status = "Error"
+        finally:
+            self.active.discard(db_id); self.limiter.forget(db_id)
+            if db_id not in self.paused:
+                hasher = self.hashers.pop(db_id, None)
+                if hasher: hasher.discard()
+            self.retries.pop(db_id, None); self.transferred.pop(db_id, None)
+            self.host_active[host] -= 1
+            if not self.host_active[host]: del self.host_active[host]
+        FINISHED.inc(status)
+        await asyncio.to_thread(self.on_finished, db_id, status)
+        self._dispatch()
+        return status
+
+    async def _fetch(self, db_id, url, filepath, resume_from, segments, if_range, mirrors=()):
+        if mirrors and (segments or resume_from == 0):
+            # 多镜像: 所有可用镜像同时分段下载; 没有任何镜像支持 Range 时退回单连接下载主 URL
+            sources, total_size = await self._probe_mirrors(db_id, [url, *mirrors], segments, if_range)
+            if total_size:
+                if not segments: segments = await asyncio.to_thread(self._plan_segments, db_id, total_size, 1)
+                return await self._run_segmented(db_id, sources, filepath, segments)
+        if not segments and resume_from == 0:
+            total_size, etag, last_modified = await self._probe(url)
+            self.store.update_task(db_id, etag=etag, last_modified=last_modified)
+            segments, if_range = await asyncio.to_thread(self._plan_segments, db_id, total_size), if_range_value(etag, last_modified)
+        if segments: return await self._run_segmented(db_id, [self._source(url, if_range)], filepath, segments)
+        return await self._run_single(db_id, url, filepath, resume_from, {"If-Range": if_range} if resume_from > 0 else {})
+
+    async def _run_single(self, db_id, url, filepath, resume_from, conditions):
+        partpath = part_path(filepath)
+        if not os.path.exists(partpath): resume_from = 0
+        transfer, host = {"downloaded_size": resume_from, "total_size": 0, "if_range": conditions.get("If-Range")}, urlsplit(url).netloc.lower()
+        while True:
+            # 每次请求占一个连接名额, 退避等待时仍然占着 (不让别的连接立刻补上去加重拥塞), 重试前重新申请, 上限降低后要排队
+            await self.concurrency.acquire(host)
+            try:
+                try:
+                    not_modified = await self._stream_single(db_id, url, partpath, conditions, transfer); break
+                except Exception as e:
+                    self.store.update_task(db_id, downloaded_size=transfer["downloaded_size"]); self.concurrency.failed(host, e)
+                    await self._backoff(db_id, e, None, transfer["downloaded_size"])
+                    # 断线重连: 从已落盘的位置续传, 用本次响应的校验值防止远端文件中途被替换
+                    if transfer["downloaded_size"] > 0: conditions = {"If-Range": transfer["if_range"]}
+            finally: self.concurrency.release(host)
+        if not_modified:
+            self.store.update_task(db_id, flush=True, status="Complete")
+            return "Complete"
+        if db_id in self.paused:
+            self.store.update_task(db_id, flush=True, downloaded_size=transfer["downloaded_size"], status="Paused")
+            return "Paused"
+        status = await self._finish(db_id, partpath, filepath, transfer["downloaded_size"])
+        self.store.update_task(db_id, flush=True, downloaded_size=transfer["downloaded_size"] if status == "Complete" else 0, status=status, total_size=transfer["total_size"])
+        return status
+    async def _stream_single(self, db_id, url, partpath, conditions, transfer):
+        host = urlsplit(url).netloc.lower()
+        resume_from = transfer["downloaded_size"]
+        headers = {key: value for key, value in conditions.items() if value}
+        if resume_from > 0: headers['Range'] = f'bytes={resume_from}-'
+        async with self.pool.session_for(url).get(url, headers=headers) as r:
+            if r.status == 304: return True
+            r.raise_for_status()
+            if r.status != 206: resume_from = 0
+            # 每次拿到完整响应都刷新校验值, 供之后的 If-Range 和条件请求使用
+            if resume_from == 0:
+                self.store.update_task(db_id, etag=r.headers.get('etag'), last_modified=r.headers.get('last-modified'))
+                transfer["if_range"] = if_range_value(r.headers.get('etag'), r.headers.get('last-modified'))
+            total_size = int(r.headers.get('content-length', 0)) + resume_from
+            transfer.update(downloaded_size=resume_from, total_size=total_size)
+            hasher = self.hashers[db_id]
+            hasher.rewind(resume_from)
+            if resume_from > 0: await hasher.catch_up(partpath, resume_from)
+            with open(partpath, 'r+b' if resume_from > 0 else 'wb') as f:
+                # 按 content-length 预分配, 之后原位写入
+                if total_size > resume_from: f.truncate(total_size)
+                f.seek(resume_from)
+                writer = self._writer(db_id, f, resume_from, lambda amount: transfer.__setitem__("downloaded_size", transfer["downloaded_size"] + amount))
+                last_time, last_downloaded_size = time.monotonic(), resume_from
+                try:
+                    async for chunk in self._read_chunks(db_id, host, r):
+                        await writer.write(chunk)
+                        current_time = time.monotonic()
+                        if current_time - last_time >= 1:
+                            downloaded_size = transfer["downloaded_size"]
+                            self._report(db_id, downloaded_size, total_size, (downloaded_size - last_downloaded_size) / (current_time - last_time))
+                            self.store.update_task(db_id, downloaded_size=downloaded_size, status="Downloading", total_size=total_size)
+                            last_time, last_downloaded_size = current_time, downloaded_size
+                        await self.limiter.throttle(db_id, host, len(chunk))
+                finally: await writer.flush()
+        if db_id not in self.paused and transfer["downloaded_size"] < total_size: raise ConnectionResetError("Stream ended early")
+        return False
+
+    async def _backoff(self, db_id, error, segment, offset):
+        # 可重试的错误按类别消耗预算, 指数退避加全抖动后再从已落盘的位置继续; 每次失败都记入 attempts 表
+        kind = classify_error(error)
+        if db_id in self.paused: raise error
+        # 预算按"没有新进度的连续失败"计: 两次失败之间有数据落盘就重新计数, 慢而不稳的链路不会被耗尽
+        used = self.retries.setdefault(db_id, {}).setdefault(segment, {"offset": offset})
+        if offset > used["offset"]: used.clear(); used["offset"] = offset
+        budget = dict(DEFAULT_RETRY_BUDGETS, **self.settings.get("retry_budgets", {})).get(kind, 0) if kind else 0
+        if used.get(kind, 0) >= budget:
+            RETRIES.inc(kind or "fatal", "gave_up")
+            self.store.record_attempt(db_id, segment, kind or "fatal", f"{type(error).__name__}: {error}", offset, None)
+            raise error
+        used[kind] = used.get(kind, 0) + 1
+        delay = random.uniform(0, min(self.settings.get("retry_backoff_max", 60), self.settings.get("retry_backoff_base", 1) * 2 ** (used[kind] - 1)))
+        retry_after = (getattr(error, "headers", None) or {}).get("Retry-After", "")
+        if retry_after.isdigit(): delay = max(delay, min(int(retry_after), self.settings.get("retry_backoff_max", 60)))
+        RETRIES.inc(kind, "retried")
+        self.store.record_attempt(db_id, segment, kind, f"{type(error).__name__}: {error}", offset, delay)
+        print(f"Retrying (ID: {db_id}, {kind} {used[kind]}/{budget}) in {delay:.1f}s: {error}")
+        await asyncio.sleep(delay)
+    def _report(self, db_id, downloaded_size, total_size, speed):
+        THROUGHPUT.observe(speed); self.on_progress(db_id, downloaded_size, total_size, speed)
+    def _writer(self, db_id, f, position, on_written):
+        return BufferedWriter(f, max(self.settings.get("io_buffer_kb", 1024) * 1024, CHUNK_SIZE), self.settings.get("write_behind", False), on_written, position, self.hashers[db_id].feed)
+    def _hasher(self, db_id, expected_checksum):
+        # 没有给出期望值时按 hash_algorithm 计算, 完成后摘要写入 checksum 列供之后查找
+        algorithm = expected_checksum.split(":")[0] if expected_checksum else self.settings.get("hash_algorithm", "sha256")
+        hasher = self.hashers.get(db_id)
+        if hasher is None or hasher.algorithm != algorithm:
+            if hasher: hasher.discard()
+            hasher = self.hashers[db_id] = StreamHasher(algorithm)
+        hasher.expected = expected_checksum
+        return hasher
+    def _link_cached(self, db_id, checksum, filepath):
+        # 内容寻址: 已经有相同摘要的完整文件时直接硬链接过来 (跨盘等情况退回复制), 不再下载
+        for cached_id, _, cached_path, size in self.store.find_by_checksum(checksum):
+            if cached_id == db_id or not os.path.isfile(cached_path) or os.path.getsize(cached_path) != size: continue
+            if os.path.abspath(cached_path) != os.path.abspath(filepath):
+                partpath = part_path(filepath)
+                if os.path.exists(partpath): os.remove(partpath)
+                try: os.link(cached_path, partpath)
+                except OSError: shutil.copyfile(cached_path, partpath)
+                os.replace(partpath, filepath)
+            print(f"Reused {cached_path} for {checksum} (ID: {db_id})")
+            self.store.update_task(db_id, flush=True, checksum=checksum, total_size=size, downloaded_size=size, status="Complete")
+            return True
+        return False
+    async def _finish(self, db_id, partpath, filepath, size):
+        # 校验摘要, 通过后才把 .part 改名为目标文件; 不一致时删掉 .part, 下次从头下载
+        hasher = self.hashers.pop(db_id)
+        await hasher.catch_up(partpath, size)
+        checksum = hasher.checksum()
+        if hasher.expected and hasher.expected != checksum:
+            print(f"Checksum mismatch (ID: {db_id}): expected {hasher.expected}, got {checksum}")
+            os.remove(partpath); hasher.discard()
+            return "Error"
+        os.replace(partpath, filepath)
+        # 边下边解压的结果在校验通过后才落成正式文件; 解压器从此交给后处理, 不随任务结束丢弃
+        if hasher.decoder: decoder, hasher.decoder = hasher.decoder, None; decoder.finish(filepath)
+        self.store.update_task(db_id, checksum=checksum)
+        return "Complete"
+    async def _read_chunks(self, db_id, host, r):
+        # 自适应块大小: 一次读满就翻倍, 最大到写缓冲区大小; 暂停时停止读取
+        size, largest = CHUNK_SIZE, max(self.settings.get("io_buffer_kb", 1024) * 1024, CHUNK_SIZE)
+        while db_id not in self.paused:
+            cap = self.limiter.chunk_cap(db_id, host)
+            want = min(size, max(cap, 4096)) if cap else size
+            chunk = await r.content.read(want)
+            if not chunk: return
+            BYTES_RECEIVED.inc(host, amount=len(chunk)); self.transferred[db_id] = self.transferred.get(db_id, 0) + len(chunk); self.concurrency.received(host, len(chunk))
+            yield chunk
+            if len(chunk) == want and size < largest: size *= 2
+
+    async def _probe(self, url):
+        # 只有声明支持 Range 且给出长度的服务器才走分段下载; 同时取回 ETag/Last-Modified
+        try:
+            async with self.pool.session_for(url).head(url, allow_redirects=True) as r:
+                r.raise_for_status()
+                size = int(r.headers.get('content-length', 0) or 0) if r.headers.get('accept-ranges', '').lower() == 'bytes' else 0
+                return size, r.headers.get('etag'), r.headers.get('last-modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError): return 0, None, None
+
+    async def _probe_mirrors(self, db_id, urls, segments, if_range):
+        # 并发探测所有镜像: 不支持 Range 或长度与基准不一致的镜像剔除; 其余按各主机的历史吞吐量排序, 快的镜像先分到连接
+        # 主 URL 续传时沿用保存的校验值, 其他镜像用本次探测到的校验值 (跨镜像的 ETag 没有可比性)
+        probes = await asyncio.gather(*(self._probe(url) for url in urls))
+        sizes = [size for size, _, _ in probes if size]
+        if not sizes: return [], 0
+        expected = segments[-1][2] + 1 if segments else probes[0][0] or max(set(sizes), key=sizes.count)
+        if not segments and probes[0][0]: self.store.update_task(db_id, etag=probes[0][1], last_modified=probes[0][2])
+        throughputs = await asyncio.to_thread(self.store.host_throughputs, sorted({urlsplit(url).netloc.lower() for url in urls}))
+        sources = []
+        for position, (url, (size, etag, last_modified)) in enumerate(zip(urls, probes)):
+            source = self._source(url, if_range if position == 0 and segments else if_range_value(etag, last_modified))
+            source["throughput"] = throughputs.get(source["host"])
+            if size != expected: source["status"] = f"size mismatch ({size} != {expected})" if size else "no range support"; MIRRORS_DROPPED.inc("size" if size else "range")
+            sources.append(source)
+        # 续传时所有镜像的长度都和保存的分段对不上: 远端文件已经变了, 交给 RemoteChanged 从头下载
+        if segments and all(source["status"] is not None for source in sources): raise RemoteChanged(f"no mirror still serves {expected} bytes")
+        sources.sort(key=lambda source: (source["status"] is not None, -(source["throughput"] or 0)))
+        return sources, expected
+    @staticmethod
+    def _source(url, if_range):
+        return {"url": url, "host": urlsplit(url).netloc.lower(), "if_range": if_range, "bytes": 0, "seconds": 0.0, "status": None, "failed": False, "throughput": None}
+
+    async def _run_segmented(self, db_id, sources, filepath, segments):
+        total_size = segments[-1][2] + 1
+        partpath = part_path(filepath)
+        if not os.path.exists(partpath):
+            for seg in segments: seg[3] = 0
+            with open(partpath, 'wb') as f: f.truncate(total_size)
+        hasher, catching_up = self.hashers[db_id], None
+        hasher.rewind(self._contiguous_size(segments))
+        # 每个连接一个工作协程, 按历史吞吐量分配到可用镜像上; owners 记录每个分段当前由谁在下载
+        owners, count = {}, min(max(self.settings.get("segments_per_task", 4), 1), max(total_size // MIN_SEGMENT_SIZE, 1))
+        fetches = [asyncio.create_task(self._segment_worker(db_id, source, sources, partpath, segments, owners)) for source in self._assign_workers(sources, count)]
+        last_time, last_downloaded_size = time.monotonic(), sum(seg[3] for seg in segments)
+        try:
+            pending = fetches
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=1, return_when=asyncio.FIRST_EXCEPTION)
+                if any(t.exception() for t in done): break
+                current_time = time.monotonic()
+                if current_time - last_time >= 1 and db_id not in self.paused:
+                    downloaded_size = sum(seg[3] for seg in segments)
+                    self._report(db_id, downloaded_size, total_size, (downloaded_size - last_downloaded_size) / (current_time - last_time))
+                    self._save_segments(db_id, segments, "Downloading", total_size)
+                    last_time, last_downloaded_size = current_time, downloaded_size
+                    # 第一段之后的数据先落盘, 摘要在后台按顺序从刚写入的文件里补读
+                    if (catching_up is None or catching_up.done()) and hasher.offset < self._contiguous_size(segments):
+                        catching_up = asyncio.create_task(hasher.catch_up(partpath, self._contiguous_size(segments)))
+        finally:
+            for t in fetches: t.cancel()
+            results = await asyncio.gather(*fetches, return_exceptions=True)
+            if catching_up: await asyncio.gather(catching_up, return_exceptions=True)
+            if len(sources) > 1:
+                # 传输量太少且时间太短的测量不可靠, 不计入主机吞吐量
+                self.store.record_mirrors(db_id, [(s["url"], s["host"], s["bytes"], s["seconds"], s["bytes"] / s["seconds"] if s["bytes"] and (s["seconds"] >= 0.5 or s["bytes"] >= MIN_STEAL_SIZE) else None,
+                                                   s["status"] or ("ok" if s["bytes"] else "unused"), s["failed"]) for s in sources])
+        errors = [e for e in results if isinstance(e, Exception)]
+        if any(isinstance(e, RemoteChanged) for e in errors): raise next(e for e in errors if isinstance(e, RemoteChanged))
+        if errors:
+            print(f"Worker Error (ID: {db_id}): {errors[0]}")
+            status = "Error"
+        elif db_id in self.paused: status = "Paused"
+        elif any(seg[1] + seg[3] <= seg[2] for seg in segments):
+            print(f"Worker Error (ID: {db_id}): segments left unfinished")
+            status = "Error"
+        else: status = "Complete"
+        if status == "Complete":
+            status = await self._finish(db_id, partpath, filepath, total_size)
+            if status == "Error":
+                for seg in segments: seg[3] = 0
+        self._save_segments(db_id, segments, status, total_size)
+        return status
+
+    @staticmethod
+    def _assign_workers(sources, count):
+        # 最高平均数法: 每个连接分给 "吞吐量 / (已分连接数 + 1)" 最大的镜像; 没有记录的镜像按已知最快的估计, 保证会被试到
+        live = [source for source in sources if source["status"] is None]
+        if not live: return []
+        best, assigned, result = max((s["throughput"] for s in live if s["throughput"]), default=1), [0] * len(live), []
+        for _ in range(count):
+            index = max(range(len(live)), key=lambda i: ((live[i]["throughput"] or best) / (assigned[i] + 1), -i))
+            assigned[index] += 1; result.append(live[index])
+        return result
+    async def _segment_worker(self, db_id, source, sources, partpath, segments, owners):
+        # 先认领没人下载的分段 (按文件顺序), 没有了就从预计最晚完成的分段尾部切走一块; 两样都没有时结束
+        worker = {"source": source, "cursor": 0, "bytes": 0, "started": 0.0, "rate": None, "slot": None}
+        while db_id not in self.paused:
+            if worker["source"]["status"] is not None:
+                # 绑定的镜像被剔除, 换到当前最快的可用镜像
+                worker["source"] = next((s for s in sources if s["status"] is None), None)
+                if worker["source"] is None: return
+            # 每次请求前向所在主机申请一个连接名额, 请求结束 (或上限降低后中途让出) 时归还, 退避等待时仍然占着; 等名额时不占分段
+            worker["slot"] = worker["source"]["host"]
+            await self.concurrency.acquire(worker["slot"])
+            seg = None if db_id in self.paused else next((seg for seg in segments if seg[0] not in owners and seg[1] + seg[3] <= seg[2]), None) or self._steal(db_id, segments, owners, worker)
+            if seg is None:
+                self._release_slot(worker)
+                if db_id in self.paused: return
+                # 别的连接刚开始, 速度还没测出来时先等一会再判断要不要接手, 免得快的连接提前退出, 留慢的连接拖尾
+                now = time.monotonic()
+                if worker["rate"] and any(victim is not worker and other[2] >= victim["cursor"] and self._worker_rate(victim, now) is None for other in segments for victim in [owners.get(other[0])] if victim):
+                    await asyncio.sleep(0.05); continue
+                return
+            owners[seg[0]], source = worker, worker["source"]
+            worker["bytes"], worker["started"] = 0, time.monotonic()
+            try: await self._fetch_segment_once(db_id, worker, partpath, seg, segments[-1][2] + 1)
+            except Exception as e:
+                # 出错的分段立即放回, 空闲的连接 (可能在别的镜像上) 可以马上接手
+                owners.pop(seg[0], None)
+                if db_id in self.paused: return
+                self.concurrency.failed(source["host"], e)
+                others = any(s is not source and s["status"] is None for s in sources)
+                if isinstance(e, (RemoteChanged, MirrorMismatch)):
+                    if not others: raise RemoteChanged(str(e)) from e
+                    source["status"] = f"changed: {e}"; MIRRORS_DROPPED.inc("changed"); continue
+                try: await self._backoff(db_id, e, seg[0], seg[1] + seg[3])
+                except Exception:
+                    if not others: raise
+                    print(f"Dropping mirror {source['url']} (ID: {db_id}): {e}")
+                    source["status"], source["failed"] = f"failed: {type(e).__name__}: {e}", True; MIRRORS_DROPPED.inc("failed")
+            else: owners.pop(seg[0], None)
+            finally:
+                self._release_slot(worker)
+                elapsed = time.monotonic() - worker["started"]
+                source["seconds"] += elapsed
+                if elapsed > 0 and worker["bytes"]: worker["rate"] = worker["bytes"] / elapsed
+    def _release_slot(self, worker):
+        if worker["slot"]: self.concurrency.release(worker["slot"]); worker["slot"] = None
+    def _steal(self, db_id, segments, owners, worker):
+        # 按双方的速度比例切分剩余范围, 两边预计同时完成; 切下来的尾部作为新分段插在原分段之后
+        # 剩下的太少不值得再切时, 如果自己明显更快 (加上一次请求的开销也能先完成), 就把剩余部分整个接过来
+        now, mine, best = time.monotonic(), worker["rate"], None
+        for seg in segments:
+            victim = owners.get(seg[0])
+            if victim is None or victim is worker: continue
+            remaining, theirs = seg[2] + 1 - victim["cursor"], self._worker_rate(victim, now)
+            if remaining <= 0: continue
+            share = mine / (mine + theirs) if mine and theirs else 0.5
+            size = int(remaining * share)
+            if remaining - size < MIN_STEAL_SIZE or size < MIN_STEAL_SIZE:
+                if not (mine and theirs and remaining / mine + STEAL_OVERHEAD < remaining / theirs): continue
+                size = remaining
+            eta = remaining / max(theirs or 1, 1)
+            if best is None or eta > best[0]: best = (eta, seg, size)
+        if best is None: return None
+        _, seg, size = best
+        stolen = [max(s[0] for s in segments) + 1, seg[2] + 1 - size, seg[2], 0]
+        seg[2] = stolen[1] - 1
+        segments.insert(segments.index(seg) + 1, stolen)
+        self.store.save_segment_plan(db_id, [list(s) for s in segments], segments[-1][2] + 1, wait=False)
+        SEGMENTS_STOLEN.inc()
+        return stolen
+    @staticmethod
+    def _worker_rate(worker, now):
+        elapsed = now - worker["started"]
+        return worker["bytes"] / elapsed if elapsed >= 0.2 and worker["bytes"] else worker["rate"]
+    async def _fetch_segment_once(self, db_id, worker, partpath, seg, total_size):
+        source = worker["source"]
+        url, host = source["url"], source["host"]
+        worker["cursor"] = position = seg[1] + seg[3]
+        headers = {'Range': f'bytes={position}-{seg[2]}'}
+        if source["if_range"]: headers['If-Range'] = source["if_range"]
+        async with self.pool.session_for(url).get(url, headers=headers) as r:
+            r.raise_for_status()
+            if r.status != 206 and source["if_range"]: raise RemoteChanged(f"validator {source['if_range']} no longer matches")
+            if r.status != 206: raise IOError(f"Server ignored Range request (HTTP {r.status})")
+            # Content-Range 里的总长度不一致, 说明这个镜像上不是同一个文件
+            length = r.headers.get('content-range', '').rpartition('/')[2]
+            if length.isdigit() and int(length) != total_size: raise MirrorMismatch(f"{host} reports {length} bytes, expected {total_size}")
+            with open(partpath, 'r+b') as f:
+                f.seek(position)
+                # seg[3] 只在数据真正写入文件后增加, 落盘的分段进度不会超前于文件内容
+                writer = self._writer(db_id, f, position, lambda amount: seg.__setitem__(3, seg[3] + amount))
+                try:
+                    async for chunk in self._read_chunks(db_id, host, r):
+                        # 分段尾部可能已被其他连接切走, 每块都按当前终点截断
+                        chunk = chunk[:seg[2] + 1 - worker["cursor"]]
+                        worker["cursor"] += len(chunk); worker["bytes"] += len(chunk); source["bytes"] += len(chunk)
+                        await writer.write(chunk)
+                        if worker["cursor"] > seg[2]: return
+                        # 主机的连接数上限降低了: 让出名额, 剩下的部分放回去由拿到名额的连接接着下
+                        if self.concurrency.shed(host): worker["slot"] = None; return
+                        await self.limiter.throttle(db_id, host, len(chunk))
+                finally: await writer.flush()
+        if seg[1] + seg[3] <= seg[2] and db_id not in self.paused: raise ConnectionResetError(f"Segment {seg[0]} ended early")
+
+    # --- 6. 持久化 (写入交给 HistoryStore 合并落盘, 不阻塞事件循环) ---
+    def _plan_segments(self, db_id, total_size, minimum=2):
+        # minimum=1 时即使文件太小也返回一个分段, 供多镜像下载使用
+        count = min(max(self.settings.get("segments_per_task", 4), 1), total_size // MIN_SEGMENT_SIZE)
+        if count < 2 and minimum > 1: return []
+        count = max(count, 1)
+        step = total_size // count
+        segments = [[i, i * step, (i + 1) * step - 1 if i < count - 1 else total_size - 1, 0] for i in range(count)]
+        self.store.save_segment_plan(db_id, segments, total_size)
+        return segments
+    @staticmethod
+    def _contiguous_size(segments):
+        # 从文件开头起连续写完的字节数
+        size = 0
+        for _, start, end, downloaded in segments:
+            size = start + downloaded
+            if start + downloaded <= end: break
+        return size
+    def _save_segments(self, db_id, segments, status, total_size):
+        self.store.update_segments(db_id, segments)
+        self.store.update_task(db_id, flush=status != "Downloading", downloaded_size=sum(seg[3] for seg in segments), status=status, total_size=total_size)
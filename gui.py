@@ -0,0 +1,557 @@
+import sys
+import os
+import json
+import subprocess
+import webbrowser
+import ctypes
+import time
+from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
+                             QTableView, QStyledItemDelegate, QStyle, QStyleOptionProgressBar, QProgressBar, QToolBar, QDialog,
+                             QLineEdit, QPushButton, QLabel, QComboBox, QDialogButtonBox,
+                             QHeaderView, QStackedWidget, QFileDialog, QSpinBox, QMenu, QMessageBox,
+                             QSplashScreen, QListWidget, QListWidgetItem, QSystemTrayIcon, QCheckBox, QInputDialog)
+from PySide6.QtGui import QAction, QIcon, QFont, QDesktopServices, QCursor, QPixmap
+from PySide6.QtCore import (Qt, Signal, QPropertyAnimation, QPoint, QEasingCurve, QUrl,
+                            QAbstractTableModel, QModelIndex, QSortFilterProxyModel, QTimer)
+from config import DB_FILE, settings, load_settings, save_settings
+from engine import parse_checksum, LOOP_LAG, LAG_INTERVAL
+from storage import HistoryStore, lock_instance
+import service
+
+# --- 1. 资源路径与主题 (配置目录和设置见 config.py) ---
+def resource_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+LANG_PATH = resource_path("languages")
+FONT_PATH = resource_path("fonts")
+ICON_PATH = resource_path("icons")
+STYLE_TEMPLATE_PATH = resource_path("style_template.qss")
+
+THEMES = {
+    "Dark Knight": {"accent": "#0078d7", "accent_hover": "#0089f0", "bg1": "#2b2b2b", "bg2": "#3c3c3c", "bg3": "#4f4f4f", "text1": "#f0f0f0", "text2": "#d0d0d0"},
+    "Ocean Blue": {"accent": "#005f73", "accent_hover": "#0a9396", "bg1": "#e9f5f7", "bg2": "#d8eef1", "bg3": "#c1e5ea", "text1": "#001219", "text2": "#2e3e42"},
+    "Forest Green": {"accent": "#4d7c0f", "accent_hover": "#65a30d", "bg1": "#f0fdf4", "bg2": "#dcfce7", "bg3": "#bbf7d0", "text1": "#14532d", "text2": "#166534"},
+    "Sunrise Orange": {"accent": "#ea580c", "accent_hover": "#f97316", "bg1": "#fff7ed", "bg2": "#ffedd5", "bg3": "#fed7aa", "text1": "#7c2d12", "text2": "#9a3412"},
+    "Royal Purple": {"accent": "#7e22ce", "accent_hover": "#9333ea", "bg1": "#f5f3ff", "bg2": "#ede9fe", "bg3": "#ddd6fe", "text1": "#581c87", "text2": "#6b21a8"},
+    "Crimson Red": {"accent": "#dc2626", "accent_hover": "#ef4444", "bg1": "#fef2f2", "bg2": "#fee2e2", "bg3": "#fecaca", "text1": "#7f1d1d", "text2": "#991b1b"},
+    "Slate Gray": {"accent": "#475569", "accent_hover": "#64748b", "bg1": "#f8fafc", "bg2": "#f1f5f9", "bg3": "#e2e8f0", "text1": "#1e293b", "text2": "#334155"},
+    "Cyberpunk Neon": {"accent": "#db2777", "accent_hover": "#ec4899", "bg1": "#1e1b4b", "bg2": "#312e81", "bg3": "#4338ca", "text1": "#e0e7ff", "text2": "#c7d2fe"},
+    "Coffee Cream": {"accent": "#78350f", "accent_hover": "#92400e", "bg1": "#fdfaf6", "bg2": "#f3eade", "bg3": "#e7d8c9", "text1": "#422006", "text2": "#572e0e"},
+    "Mint Fresh": {"accent": "#059669", "accent_hover": "#10b981", "bg1": "#f0fdfa", "bg2": "#ccfbf1", "bg3": "#99f6e4", "text1": "#047857", "text2": "#065f46"},
+}
+lang_data = {}
+store = None
+
+def apply_theme(app_or_window):
+    theme_name = settings.get("theme", "Dark Knight")
+    palette = THEMES.get(theme_name, THEMES["Dark Knight"])
+    try:
+        with open(STYLE_TEMPLATE_PATH, "r", encoding='utf-8') as f:
+            template = f.read()
+        stylesheet = template.replace("{COLOR_ACCENT}", palette["accent"]) \
+                             .replace("{COLOR_ACCENT_HOVER}", palette["accent_hover"]) \
+                             .replace("{COLOR_BACKGROUND_1}", palette["bg1"]) \
+                             .replace("{COLOR_BACKGROUND_2}", palette["bg2"]) \
+                             .replace("{COLOR_BACKGROUND_3}", palette["bg3"]) \
+                             .replace("{COLOR_TEXT_PRIMARY}", palette["text1"]) \
+                             .replace("{COLOR_TEXT_SECONDARY}", palette["text2"])
+        app_or_window.setStyleSheet(stylesheet)
+    except Exception as e:
+        print(f"Error applying theme: {e}")
+
+# --- 2. UI 界面定义 ---
+def format_size(downloaded_size, total_size):
+    return f"{downloaded_size/1024**2:.2f}MB / {total_size/1024**2:.2f}MB" if total_size else "N/A"
+def format_speed(speed):
+    if speed is None: return "N/A"
+    return f"{speed/1024**2:.2f}MB/s" if speed > 1024**2 else f"{speed/1024:.2f}KB/s"
+
+class DownloadsModel(QAbstractTableModel):
+    # 行: [db_id, filename, total_size, downloaded_size, status, speed, (created_at, id)], 按最后一项降序排列; row_of 以 db_id 直接定位行号
+    PAGE_SIZE = 500
+    SORT_ROLE = Qt.ItemDataRole.UserRole + 1
+    HEADER_KEYS = ["col_filename", "col_size", "col_progress", "col_speed", "col_status"]
+    COLUMNS = "SELECT id, filename, total_size, downloaded_size, status, created_at FROM downloads"
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows, self.row_of = [], {}
+        self._cursors = {}  # (status, text) -> [游标, 是否取完], 每种筛选条件各自分页
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.rows)
+    def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.HEADER_KEYS)
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole: return lang_data.get(self.HEADER_KEYS[section], self.HEADER_KEYS[section])
+        return None
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        db_id, filename, total_size, downloaded_size, status, speed, _ = self.rows[index.row()]
+        column = index.column()
+        percent = int((downloaded_size / total_size) * 100) if total_size else 0
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0: return filename
+            if column == 1: return format_size(downloaded_size, total_size)
+            if column == 2: return percent
+            if column == 3: return format_speed(speed)
+            if column == 4: return lang_data.get(f"status_{status.lower()}", status)
+        elif role == Qt.ItemDataRole.UserRole: return db_id
+        elif role == self.SORT_ROLE: return (filename.lower(), total_size or 0, percent, speed or 0, status)[column]
+        return None
+    # 懒加载: 按 (created_at, id) 游标分页读取, 只在视图滚动到底部或筛选结果不足一页时才继续取
+    def canFetchMore(self, parent=QModelIndex()): return not parent.isValid() and self.can_fetch()
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid(): self.fetch_page()
+    def can_fetch(self, status=None, text=""): return not self._cursors.get((status, text), [None, False])[1]
+    def fetch_page(self, status=None, text=""):
+        state = self._cursors.setdefault((status, text), [None, False])
+        if state[1]: return
+        clauses, params = [], []
+        if status: clauses.append("status=?"); params.append(status)
+        if text: clauses.append("filename LIKE ?"); params.append(f"%{text}%")
+        if state[0]: clauses.append("(created_at < ? OR (created_at = ? AND id < ?))"); params.extend((state[0][0], *state[0]))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        page = store.read(f"{self.COLUMNS}{where} ORDER BY created_at DESC, id DESC LIMIT ?", (*params, self.PAGE_SIZE))
+        state[1] = len(page) < self.PAGE_SIZE
+        if page: state[0] = (page[-1][5], page[-1][0])
+        self._merge(page)
+    def reload(self):
+        self.beginResetModel()
+        self.rows, self.row_of, self._cursors = [], {}, {}
+        self.endResetModel()
+    def prepend_tasks(self, db_ids):
+        page = []
+        for start in range(0, len(db_ids), self.PAGE_SIZE):
+            chunk = tuple(db_ids[start:start + self.PAGE_SIZE])
+            page.extend(store.read(f"{self.COLUMNS} WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        page.sort(key=lambda row: (row[5] or "", row[0]), reverse=True)
+        self._merge(page)
+    def _merge(self, page):
+        # 新取到的行按排序键插入到正确位置, 相邻的行合并成一次插入
+        runs = []
+        for db_id, filename, total_size, downloaded_size, status, created_at in page:
+            if db_id in self.row_of: continue
+            row = [db_id, filename, total_size, downloaded_size or 0, status, None, (created_at or "", db_id)]
+            position = self._insert_position(row[6])
+            if runs and runs[-1][0] == position: runs[-1][1].append(row)
+            else: runs.append((position, [row]))
+        for position, rows in reversed(runs):
+            self.beginInsertRows(QModelIndex(), position, position + len(rows) - 1)
+            self.rows[position:position] = rows
+            self.endInsertRows()
+        if runs: self._reindex(runs[0][0])
+    def _insert_position(self, key):
+        low, high = 0, len(self.rows)
+        while low < high:
+            middle = (low + high) // 2
+            if self.rows[middle][6] > key: low = middle + 1
+            else: high = middle
+        return low
+    def remove_tasks(self, db_ids):
+        rows = sorted((self.row_of[db_id] for db_id in db_ids if db_id in self.row_of), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row); del self.row_of[self.rows[row][0]]; del self.rows[row]; self.endRemoveRows()
+        if rows: self._reindex(rows[-1])
+    def _reindex(self, first):
+        for row in range(first, len(self.rows)): self.row_of[self.rows[row][0]] = row
+    # 一批进度合并成一次 dataChanged, 整批只重绘一次
+    def update_tasks(self, batch):
+        rows = []
+        for event in batch:
+            row = self.row_of.get(event["id"])
+            if row is None: continue
+            values = self.rows[row]
+            for key in ("total_size", "downloaded_size", "status", "speed"):
+                if key in event: values[("total_size", "downloaded_size", "status", "speed").index(key) + 2] = event[key]
+            rows.append(row)
+        if rows: self.dataChanged.emit(self.index(min(rows), 1), self.index(max(rows), 4))
+    def task(self, db_id):
+        row = self.row_of.get(db_id)
+        return self.rows[row] if row is not None else None
+
+class DownloadsFilterProxy(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.status_filter, self.text_filter = None, ""
+        self.setSortRole(DownloadsModel.SORT_ROLE)
+    def set_status_filter(self, status_filter):
+        self.status_filter = None if status_filter in (None, "All") else status_filter
+        self.invalidateFilter(); self.fill()
+    def set_text_filter(self, text):
+        self.text_filter = text.lower()
+        self.invalidateFilter(); self.fill()
+    def filterAcceptsRow(self, source_row, source_parent):
+        _, filename, _, _, status, _, _ = self.sourceModel().rows[source_row]
+        return (self.status_filter is None or status == self.status_filter) and self.text_filter in (filename or "").lower()
+    # 向数据库要的是"当前筛选条件下的下一页", 稀疏的分类不会把整张历史表都拉进内存
+    def canFetchMore(self, parent=QModelIndex()): return not parent.isValid() and self.sourceModel().can_fetch(self.status_filter, self.text_filter)
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid(): self.sourceModel().fetch_page(self.status_filter, self.text_filter)
+    def fill(self):
+        while self.rowCount() < DownloadsModel.PAGE_SIZE and self.canFetchMore(): self.fetchMore()
+
+class ProgressDelegate(QStyledItemDelegate):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.bar = QProgressBar()  # 不显示, 仅借用它的样式表来绘制进度条
+    def paint(self, painter, option, index):
+        if option.state & QStyle.StateFlag.State_Selected: painter.fillRect(option.rect, option.palette.highlight())
+        bar_option = QStyleOptionProgressBar()
+        bar_option.rect = option.rect.adjusted(4, 4, -4, -4); bar_option.minimum, bar_option.maximum = 0, 100
+        bar_option.progress = index.data() or 0; bar_option.text = f"{bar_option.progress}%"; bar_option.textVisible = True
+        bar_option.textAlignment = Qt.AlignmentFlag.AlignCenter; bar_option.state = option.state | QStyle.StateFlag.State_Horizontal
+        self.bar.style().drawControl(QStyle.ControlElement.CE_ProgressBar, bar_option, painter, self.bar)
+
+class DownloadsPage(QWidget):
+    download_complete_signal = Signal(str)
+    progress_batch = Signal(list)
+    def __init__(self, downloader, parent=None):
+        super().__init__(parent)
+        self.init_ui()
+        # 下载核心在 service.py 中 (不依赖 Qt); 汇总后的进度批次通过信号排队回到 GUI 线程
+        self.downloader, self.engine, self.progress = downloader, downloader.engine, downloader.progress
+        self.progress.add_listener(self.progress_batch.emit); self.progress_batch.connect(self.apply_progress_batch)
+    def init_ui(self):
+        layout = QVBoxLayout(self); layout.setContentsMargins(0, 0, 0, 0); layout.setSpacing(0)
+        top_layout = QHBoxLayout(); top_layout.setContentsMargins(10, 5, 10, 5)
+        self.toolbar = QToolBar("Downloads"); self.add_action = QAction(self); self.pause_resume_action = QAction(self); self.delete_action = QAction(self)
+        self.toolbar.addAction(self.add_action); self.toolbar.addAction(self.pause_resume_action); self.toolbar.addAction(self.delete_action)
+        self.search_box = QLineEdit(self, objectName="SearchBox"); self.search_box.textChanged.connect(self.filter_table)
+        top_layout.addWidget(self.toolbar); top_layout.addStretch(); top_layout.addWidget(self.search_box)
+        layout.addLayout(top_layout)
+        self.model = DownloadsModel(self); self.proxy = DownloadsFilterProxy(self); self.proxy.setSourceModel(self.model)
+        self.table = QTableView(); self.table.setModel(self.proxy); self.table.setItemDelegateForColumn(2, ProgressDelegate(self.table))
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows); self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers); self.table.horizontalHeader().setStretchLastSection(True); self.table.verticalHeader().setVisible(False); self.table.setShowGrid(False)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder); self.table.setSortingEnabled(True)
+        self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu); self.table.customContextMenuRequested.connect(self.show_context_menu); self.table.doubleClicked.connect(self.open_file_on_double_click); self.table.selectionModel().selectionChanged.connect(self.update_pause_resume_button)
+        layout.addWidget(self.table)
+        self.add_action.triggered.connect(self.show_add_url_dialog); self.pause_resume_action.triggered.connect(self.toggle_pause_resume); self.delete_action.triggered.connect(self.delete_task)
+    def retranslate_ui(self):
+        self.add_action.setText(lang_data.get("add_url_button")); self.add_action.setIcon(QIcon(os.path.join(ICON_PATH, "add.svg")))
+        self.delete_action.setText(lang_data.get("delete_button")); self.delete_action.setIcon(QIcon(os.path.join(ICON_PATH, "delete.svg")))
+        self.search_box.setPlaceholderText(lang_data.get("search_placeholder"))
+        self.model.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, self.model.columnCount() - 1)
+        if self.model.rows: self.model.dataChanged.emit(self.model.index(0, 4), self.model.index(len(self.model.rows) - 1, 4))
+        self.update_pause_resume_button()
+    def load_history(self, status_filter=None):
+        # 切换分类只改代理模型的筛选条件, 不再重建整张表
+        self.proxy.set_status_filter(status_filter)
+    def selected_db_ids(self):
+        return [self.proxy.index(index.row(), 0).data(Qt.ItemDataRole.UserRole) for index in self.table.selectionModel().selectedRows()]
+    def show_add_url_dialog(self):
+        dialog = QDialog(self); dialog.setWindowTitle(lang_data.get("add_url_button")); layout = QVBoxLayout(dialog)
+        url_input = QLineEdit(placeholderText=lang_data.get("url_placeholder")); layout.addWidget(url_input)
+        checksum_input = QLineEdit(placeholderText=lang_data.get("checksum_placeholder")); layout.addWidget(checksum_input)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel); buttons.accepted.connect(dialog.accept); buttons.rejected.connect(dialog.reject); layout.addWidget(buttons)
+        while dialog.exec():
+            # 用空格分隔的多个 URL 是同一文件的镜像, 第一个为主 URL
+            urls, checksum = url_input.text().split(), checksum_input.text().strip()
+            if not urls: return
+            try: self.start_new_download(urls[0], parse_checksum(checksum) if checksum else None, urls[1:]); return
+            except ValueError: QMessageBox.warning(self, lang_data.get("add_url_button"), lang_data.get("invalid_checksum"))
+    def start_new_download(self, url, checksum=None, mirrors=()):
+        # 写入和入队由下载核心完成, 表格通过 tasks_added_signal 刷新
+        self.downloader.add_tasks([(url, None, checksum, 0)], interactive=True, mirrors=[list(mirrors)])
+    def show_added_tasks(self, db_ids):
+        # 批量添加后只刷新一次表格
+        self.model.prepend_tasks(db_ids)
+    def resume_download(self, db_id):
+        data = store.read_one("SELECT url, filepath, priority FROM downloads WHERE id=?", (db_id,))
+        if data:
+            url, filepath, priority = data
+            self.engine.enqueue(db_id, url, filepath, priority or 0)
+    def toggle_pause_resume(self):
+        db_ids = self.selected_db_ids()
+        if not db_ids: return
+        db_id = db_ids[0]
+        status = self.get_status_by_db_id(db_id)
+        if status in ["Downloading", "Queued"]: self.engine.pause(db_id)
+        elif status in ["Paused", "Error", "Ready"]: self.resume_download(db_id)
+    def delete_task(self):
+        db_ids = self.selected_db_ids()
+        for db_id in db_ids:
+            self.engine.pause(db_id)
+            store.delete_task(db_id)
+        self.model.remove_tasks(db_ids)
+    def update_pause_resume_button(self):
+        db_ids = self.selected_db_ids()
+        if not db_ids: self.pause_resume_action.setEnabled(False); return
+        status = self.get_status_by_db_id(db_ids[0])
+        if status in ["Downloading", "Queued"]:
+            self.pause_resume_action.setEnabled(True); self.pause_resume_action.setText(lang_data.get("pause_button")); self.pause_resume_action.setIcon(QIcon(os.path.join(ICON_PATH, "pause.svg")))
+        elif status in ["Paused", "Error", "Ready"]:
+            self.pause_resume_action.setEnabled(True); self.pause_resume_action.setText(lang_data.get("resume_button")); self.pause_resume_action.setIcon(QIcon(os.path.join(ICON_PATH, "play.svg")))
+        else: self.pause_resume_action.setEnabled(False); self.pause_resume_action.setText(lang_data.get("pause_button")); self.pause_resume_action.setIcon(QIcon(os.path.join(ICON_PATH, "pause.svg")))
+    def apply_progress_batch(self, batch):
+        # 同一批事件字典也交给了推送客户端, 在 Flask 线程里序列化; 这里只改副本
+        events = []
+        for event in batch:
+            task = self.model.task(event["id"])
+            if task and event.get("status") == "Complete":
+                event = dict(event, downloaded_size=event.get("total_size") or task[2] or task[3]); self.download_complete_signal.emit(task[1])
+            events.append(event)
+        self.model.update_tasks(events)
+        if any("status" in event for event in batch): self.update_pause_resume_button()
+    def filter_table(self, text):
+        self.proxy.set_text_filter(text)
+    def show_context_menu(self, pos):
+        index = self.table.indexAt(pos)
+        if not index.isValid(): return
+        db_id = self.proxy.index(index.row(), 0).data(Qt.ItemDataRole.UserRole)
+        data = store.read_one("SELECT filepath, priority, speed_limit_kb, output_path FROM downloads WHERE id=?", (db_id,))
+        if not data: return
+        # 有后处理结果时打开结果 (解压出的文件或解包的目录)
+        filepath, priority, task_limit_kb, output_path = data
+        filepath = output_path or filepath
+        status = store.get_status(db_id)
+        menu = QMenu(); open_action = menu.addAction(lang_data.get("open_file")); open_action.setEnabled(status == "Complete"); folder_action = menu.addAction(lang_data.get("open_folder"))
+        menu.addSeparator(); raise_action = menu.addAction(lang_data.get("priority_up")); lower_action = menu.addAction(lang_data.get("priority_down"))
+        limit_action = menu.addAction(lang_data.get("task_speed_limit")); refresh_action = menu.addAction(lang_data.get("refresh_download"))
+        refresh_action.setEnabled(status == "Complete"); raise_action.setEnabled(status != "Complete"); lower_action.setEnabled(status != "Complete"); limit_action.setEnabled(status != "Complete")
+        action = menu.exec(self.table.viewport().mapToGlobal(pos))
+        try:
+            if action in (raise_action, lower_action):
+                self.engine.set_priority(db_id, (priority or 0) + (1 if action == raise_action else -1))
+            elif action == limit_action:
+                limit_kb, ok = QInputDialog.getInt(self, lang_data.get("task_speed_limit"), lang_data.get("speed_limit"), task_limit_kb or 0, 0, 1000000, 100)
+                if ok: self.engine.set_task_limit(db_id, limit_kb)
+            elif action == refresh_action: self.resume_download(db_id)
+            elif action == open_action:
+                if sys.platform == "win32": os.startfile(filepath)
+                else: subprocess.call(("open", filepath))
+            elif action == folder_action:
+                if sys.platform == "win32": os.startfile(os.path.dirname(filepath))
+                else: subprocess.call(("open", os.path.dirname(filepath)))
+        except Exception as e: print(f"Error opening file/folder: {e}")
+    def open_file_on_double_click(self, index):
+        db_id = self.proxy.index(index.row(), 0).data(Qt.ItemDataRole.UserRole)
+        if store.get_status(db_id) == "Complete": self.show_context_menu(self.table.visualRect(index).center())
+    def get_status_by_db_id(self, db_id):
+        return store.get_status(db_id)
+class SettingsPage(QWidget):
+    settings_saved = Signal()
+    def __init__(self, parent=None):
+        super().__init__(parent); self.setObjectName("SettingsPage"); self.init_ui(); self.load_ui_from_settings()
+    def init_ui(self):
+        layout = QVBoxLayout(self); layout.setContentsMargins(40, 20, 40, 20); layout.setSpacing(15)
+        self.title = QLabel(); self.title.setStyleSheet("font-size: 20px; font-weight: bold;"); layout.addWidget(self.title)
+        self.path_label = QLabel(); self.path_edit = QLineEdit(); self.path_button = QPushButton(); self.path_button.clicked.connect(self.browse_path)
+        path_layout = QHBoxLayout(); path_layout.addWidget(self.path_edit); path_layout.addWidget(self.path_button)
+        layout.addLayout(path_layout)
+        self.max_label = QLabel(); self.max_spinbox = QSpinBox(); self.max_spinbox.setRange(1, 64)
+        layout.addWidget(self.max_label); layout.addWidget(self.max_spinbox)
+        # 每个主机的连接数上下界; 开启自适应时在这个范围内按吞吐量和错误自动调整, 关闭时固定为上界
+        self.connections_label = QLabel(); self.min_connections_spinbox = QSpinBox(); self.max_connections_spinbox = QSpinBox()
+        self.min_connections_spinbox.setRange(1, 64); self.max_connections_spinbox.setRange(1, 64)
+        self.min_connections_spinbox.valueChanged.connect(lambda value: self.max_connections_spinbox.setValue(max(value, self.max_connections_spinbox.value())))
+        self.max_connections_spinbox.valueChanged.connect(lambda value: self.min_connections_spinbox.setValue(min(value, self.min_connections_spinbox.value())))
+        connections_layout = QHBoxLayout(); connections_layout.addWidget(self.min_connections_spinbox); connections_layout.addWidget(QLabel("–")); connections_layout.addWidget(self.max_connections_spinbox)
+        layout.addWidget(self.connections_label); layout.addLayout(connections_layout)
+        self.adaptive_checkbox = QCheckBox(); layout.addWidget(self.adaptive_checkbox)
+        # 下载完成后解压/解包等后处理同时使用的进程数 (规则在 settings.json 的 post_process_rules 里配置)
+        self.post_process_label = QLabel(); self.post_process_spinbox = QSpinBox(); self.post_process_spinbox.setRange(1, 32)
+        layout.addWidget(self.post_process_label); layout.addWidget(self.post_process_spinbox)
+        self.speed_label = QLabel(); self.speed_limit_spinbox = QSpinBox(); self.speed_limit_spinbox.setRange(0, 100000); self.speed_limit_spinbox.setSingleStep(100)
+        layout.addWidget(self.speed_label); layout.addWidget(self.speed_limit_spinbox)
+        self.lang_label = QLabel(); self.lang_combo = QComboBox(); self.lang_combo.addItems(["English", "中文"])
+        layout.addWidget(self.lang_label); layout.addWidget(self.lang_combo)
+        self.theme_label = QLabel(); self.theme_combo = QComboBox(); self.theme_combo.addItems(THEMES.keys())
+        layout.addWidget(self.theme_label); layout.addWidget(self.theme_combo)
+        self.tray_checkbox = QCheckBox(); layout.addWidget(self.tray_checkbox)
+        layout.addStretch()
+        self.save_button = QPushButton(); self.save_button.clicked.connect(self.save_ui_to_settings)
+        layout.addWidget(self.save_button, 0, Qt.AlignmentFlag.AlignRight)
+    def retranslate_ui(self):
+        self.title.setText(lang_data.get("settings_title")); self.path_label.setText(lang_data.get("download_location")); self.path_button.setText(lang_data.get("browse"))
+        self.max_label.setText(lang_data.get("max_concurrent_downloads")); self.speed_label.setText(lang_data.get("speed_limit")); self.speed_limit_spinbox.setSuffix(" KB/s")
+        self.lang_label.setText(lang_data.get("language")); self.theme_label.setText(lang_data.get("theme")); self.save_button.setText(lang_data.get("save_settings"))
+        self.tray_checkbox.setText(lang_data.get("minimize_to_tray"))
+        self.connections_label.setText(lang_data.get("connections_per_host")); self.adaptive_checkbox.setText(lang_data.get("adaptive_concurrency"))
+        self.post_process_label.setText(lang_data.get("post_process_workers"))
+    def browse_path(self):
+        path = QFileDialog.getExistingDirectory(self, "Select Download Folder", self.path_edit.text())
+        if path: self.path_edit.setText(path)
+    def load_ui_from_settings(self):
+        self.path_edit.setText(settings.get("download_path", "")); self.max_spinbox.setValue(settings.get("max_concurrent", 3)); self.theme_combo.setCurrentText(settings.get("theme", "Dark Knight"))
+        self.lang_combo.setCurrentIndex(1 if settings.get("language") == "zh" else 0); self.speed_limit_spinbox.setValue(settings.get("speed_limit_kb", 0))
+        self.tray_checkbox.setChecked(settings.get("minimize_to_tray", True))
+        self.max_connections_spinbox.setValue(settings.get("max_connections_per_host", 8)); self.min_connections_spinbox.setValue(settings.get("min_connections_per_host", 1))
+        self.adaptive_checkbox.setChecked(settings.get("adaptive_concurrency", True)); self.post_process_spinbox.setValue(settings.get("post_process_workers", 2))
+    def save_ui_to_settings(self):
+        settings["download_path"] = self.path_edit.text(); settings["max_concurrent"] = self.max_spinbox.value(); settings["theme"] = self.theme_combo.currentText()
+        settings["language"] = "zh" if self.lang_combo.currentIndex() == 1 else "en"; settings["speed_limit_kb"] = self.speed_limit_spinbox.value()
+        settings["minimize_to_tray"] = self.tray_checkbox.isChecked()
+        settings["min_connections_per_host"], settings["max_connections_per_host"] = self.min_connections_spinbox.value(), self.max_connections_spinbox.value(); settings["adaptive_concurrency"] = self.adaptive_checkbox.isChecked()
+        settings["post_process_workers"] = self.post_process_spinbox.value()
+        save_settings()
+        self.settings_saved.emit()
+class AboutPage(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent); self.setObjectName("AboutPage"); self.init_ui()
+    def init_ui(self):
+        layout = QVBoxLayout(self); layout.setContentsMargins(40, 40, 40, 40); layout.setSpacing(20); layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.title = QLabel(); self.title.setStyleSheet("font-size: 24px; font-weight: bold;"); self.title.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.my_info = QLabel(); self.my_info.setStyleSheet("font-size: 16px;"); self.my_info.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.github_button = QPushButton()
+        self.github_button.clicked.connect(lambda: webbrowser.open("https://github.com/Close245"))
+        layout.addWidget(self.title); layout.addWidget(self.my_info); layout.addStretch(); layout.addWidget(self.github_button); layout.addStretch()
+    def retranslate_ui(self):
+        self.title.setText(lang_data.get("about_title")); self.my_info.setText(lang_data.get("about_me"))
+        self.github_button.setText(lang_data.get("github_link")); self.github_button.setIcon(QIcon(os.path.join(ICON_PATH, "github.svg")))
+
+class DownloaderApp(QMainWindow):
+    tasks_added_signal = Signal(list, bool)
+    def __init__(self, downloader):
+        super().__init__()
+        self.downloader = downloader
+        self.load_language()
+        self.init_tray_icon() # MUST be before init_ui
+        self.init_ui()
+        # 新任务可能来自 HTTP 线程, 经信号排队回到 GUI 线程再刷新表格
+        self.tasks_added_signal.connect(self.on_tasks_added); downloader.listeners.append(self.tasks_added_signal.emit)
+        # 界面线程的事件循环延迟: 定时器实际触发比预期晚多少, 反映 Qt 线程被阻塞的程度
+        self.lag_timer = QTimer(self); self.lag_timer.timeout.connect(self.measure_ui_lag); self.lag_expected = time.monotonic() + LAG_INTERVAL; self.lag_timer.start(int(LAG_INTERVAL * 1000))
+
+    def init_ui(self):
+        self.setWindowTitle("SummerSun Downloader"); self.setGeometry(200, 200, 1000, 750)
+        central_widget = QWidget(); self.setCentralWidget(central_widget)
+        main_layout = QHBoxLayout(central_widget); main_layout.setSpacing(0); main_layout.setContentsMargins(0, 0, 0, 0)
+        nav_panel = QWidget(); nav_panel.setFixedWidth(220); nav_layout = QVBoxLayout(nav_panel); nav_layout.setContentsMargins(0, 0, 0, 0); nav_layout.setSpacing(0)
+        sidebar = QWidget(); sidebar.setObjectName("Sidebar"); sidebar_layout = QVBoxLayout(sidebar); sidebar_layout.setContentsMargins(0, 10, 0, 10); sidebar_layout.setSpacing(5)
+        self.nav_downloads_btn = QPushButton(objectName="NavButton", checkable=True, checked=True); self.nav_settings_btn = QPushButton(objectName="NavButton", checkable=True); self.nav_about_btn = QPushButton(objectName="NavButton", checkable=True)
+        sidebar_layout.addWidget(self.nav_downloads_btn); sidebar_layout.addWidget(self.nav_settings_btn); sidebar_layout.addWidget(self.nav_about_btn); sidebar_layout.addStretch()
+        nav_layout.addWidget(sidebar)
+        self.category_list = QListWidget(objectName="CategoryList"); self.category_list.setFixedWidth(220); self.category_list.currentItemChanged.connect(self.filter_downloads_by_category)
+        nav_layout.addWidget(self.category_list)
+        main_layout.addWidget(nav_panel)
+        self.stacked_widget = QStackedWidget(); main_layout.addWidget(self.stacked_widget)
+        self.downloads_page = DownloadsPage(self.downloader); self.settings_page = SettingsPage(); self.about_page = AboutPage()
+        self.stacked_widget.addWidget(self.downloads_page); self.stacked_widget.addWidget(self.settings_page); self.stacked_widget.addWidget(self.about_page)
+        self.downloads_page.download_complete_signal.connect(self.show_tray_notification)
+        self.nav_downloads_btn.clicked.connect(lambda: self.switch_view(0)); self.nav_settings_btn.clicked.connect(lambda: self.switch_view(1)); self.nav_about_btn.clicked.connect(lambda: self.switch_view(2))
+        self.settings_page.settings_saved.connect(self.on_settings_saved)
+        self.retranslate_ui()
+
+    def init_tray_icon(self):
+        self.tray_icon = QSystemTrayIcon(self)
+        self.tray_icon.setIcon(QIcon(os.path.join(ICON_PATH, "app_icon.ico")))
+        self.tray_icon.activated.connect(self.on_tray_icon_activated)
+        tray_menu = QMenu()
+        self.show_action = QAction(self); self.show_action.triggered.connect(self.toggle_visibility)
+        self.quit_action = QAction(self); self.quit_action.triggered.connect(self.quit_application)
+        tray_menu.addAction(self.show_action); tray_menu.addSeparator(); tray_menu.addAction(self.quit_action)
+        self.tray_icon.setContextMenu(tray_menu)
+        self.tray_icon.show()
+
+    def on_settings_saved(self):
+        self.load_language()
+        apply_theme(QApplication.instance())
+        self.retranslate_ui()
+        self.downloads_page.retranslate_ui()
+        self.settings_page.retranslate_ui()
+        self.about_page.retranslate_ui()
+        self.downloads_page.engine.reschedule()
+        QMessageBox.information(self, lang_data.get("settings_saved_title"), lang_data.get("settings_saved_body_instant"))
+
+    def load_language(self):
+        global lang_data; lang_code = settings.get("language", "en")
+        path = os.path.join(LANG_PATH, f"{lang_code}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f: lang_data = json.load(f)
+        except Exception:
+            with open(os.path.join(LANG_PATH, "en.json"), 'r', encoding='utf-8') as f: lang_data = json.load(f)
+
+    def retranslate_ui(self):
+        self.setWindowTitle(lang_data.get("window_title")); self.nav_downloads_btn.setText(f" {lang_data.get('downloads_nav')}"); self.nav_downloads_btn.setIcon(QIcon(os.path.join(ICON_PATH, "download.svg")))
+        self.nav_settings_btn.setText(f" {lang_data.get('settings_nav')}"); self.nav_settings_btn.setIcon(QIcon(os.path.join(ICON_PATH, "settings.svg")))
+        self.nav_about_btn.setText(f" {lang_data.get('about_nav')}"); self.nav_about_btn.setIcon(QIcon(os.path.join(ICON_PATH, "info.svg")))
+        self.category_list.blockSignals(True); self.category_list.clear()
+        self.categories = {"cat_all": "All", "cat_downloading": "Downloading", "cat_processing": "Processing", "cat_queued": "Queued", "cat_paused": "Paused", "cat_completed": "Complete", "cat_error": "Error"}
+        for key, value in self.categories.items():
+            item = QListWidgetItem(lang_data.get(key)); item.setData(Qt.ItemDataRole.UserRole, value); self.category_list.addItem(item)
+        self.category_list.setCurrentRow(0); self.category_list.blockSignals(False)
+        self.show_action.setText(lang_data.get("tray_show_hide")); self.quit_action.setText(lang_data.get("tray_quit"))
+
+    def switch_view(self, index):
+        if index == self.stacked_widget.currentIndex(): return
+        self.nav_downloads_btn.setChecked(index == 0); self.nav_settings_btn.setChecked(index == 1); self.nav_about_btn.setChecked(index == 2)
+        self.category_list.setVisible(index == 0)
+        self.stacked_widget.setCurrentIndex(index)
+    
+    def filter_downloads_by_category(self, current, previous):
+        if current:
+            status_filter = current.data(Qt.ItemDataRole.UserRole)
+            self.downloads_page.load_history(status_filter)
+
+    def on_tasks_added(self, db_ids, interactive):
+        # 单个添加的任务 (对话框或浏览器扩展) 把窗口带到前台, 批量导入只刷新表格
+        if interactive:
+            self.activate_window()
+            if self.stacked_widget.currentIndex() != 0: self.switch_view(0)
+        self.downloads_page.show_added_tasks(db_ids)
+
+    def measure_ui_lag(self):
+        now = time.monotonic(); LOOP_LAG.observe(max(now - self.lag_expected, 0), "ui"); self.lag_expected = now + LAG_INTERVAL
+
+    def activate_window(self):
+        self.showNormal(); self.activateWindow(); self.raise_()
+        if sys.platform == "win32":
+            try: ctypes.windll.user32.SetForegroundWindow(self.winId())
+            except Exception as e: print(f"Could not bring window to front: {e}")
+
+    def on_tray_icon_activated(self, reason):
+        if reason == QSystemTrayIcon.ActivationReason.Trigger: self.toggle_visibility()
+
+    def toggle_visibility(self):
+        if self.isVisible(): self.hide()
+        else: self.show(); self.activate_window()
+
+    def closeEvent(self, event):
+        if settings.get("minimize_to_tray", True):
+            event.ignore(); self.hide(); self.tray_icon.showMessage(lang_data.get("tray_minimized_title"), lang_data.get("tray_minimized_body"), QSystemTrayIcon.MessageIcon.Information, 2000)
+        else:
+            self.quit_application()
+
+    def quit_application(self):
+        self.tray_icon.hide(); self.downloader.stop(); QApplication.instance().quit()
+
+    def show_tray_notification(self, filename):
+        self.tray_icon.showMessage(lang_data.get("tray_complete_title"), f"'{filename}' {lang_data.get('tray_complete_body')}", QSystemTrayIcon.MessageIcon.Information, 4000)
+
+# --- 3. 图形界面入口 (由 main.py 调用) ---
+def run(args, qt_args, started):
+    global store
+    service.mark_startup("imports", started)
+    app = QApplication(sys.argv[:1] + qt_args)
+    QApplication.setQuitOnLastWindowClosed(False)
+    try:
+        splash_pix = QPixmap(resource_path("icons/splash.png"))
+        splash = QSplashScreen(splash_pix, Qt.WindowType.WindowStaysOnTopHint)
+        splash.show()
+    except Exception as e:
+        print(f"Could not load splash screen (is splash.png in icons folder?): {e}")
+        splash = None
+    app.processEvents()
+    service.mark_startup("qt", started)
+    # 同一个数据库只运行一个实例 (见 storage.lock_instance); 界面语言此时还没加载, 提示用英文
+    instance_lock = lock_instance(DB_FILE)
+    if instance_lock is None:
+        if splash: splash.close()
+        QMessageBox.warning(None, "SummerSun Downloader", f"Another instance is already running (it is using {DB_FILE}).")
+        return 1
+    # 端口被占用时界面照常运行, 只是没有 HTTP API (浏览器扩展无法添加任务)
+    server = service.bind_api(args.host, args.port)
+    store = HistoryStore(DB_FILE)
+    load_settings()
+    # 下载核心和 HTTP API 先于窗口启动, 界面构建期间浏览器扩展已经可以添加任务
+    service.downloader = service.DownloadService(store, settings).start()
+    if server: service.start_api(server, started)
+    main_app = DownloaderApp(service.downloader)
+    apply_theme(app)
+    main_app.retranslate_ui() # Ensure all text is correct on first launch, including tray menu
+    if splash:
+        splash.finish(main_app)
+    main_app.show()
+    service.mark_startup("window", started)
+    return app.exec()
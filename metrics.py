@@ -0,0 +1,123 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally
+
+# --- 1. 指标 (Prometheus 文本格式, 不依赖 Qt 和 prometheus_client) ---
+def _escape(value): return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+def _format_labels(pairs): return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+def _format_value(value): return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.values, self.lock = {}, threading.Lock()
+    def samples(self):
+        with self.lock: return [("", key, (), value) for key, value in self.values.items()]
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels([*zip(self.labelnames, key), *extra])} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+    def inc(self, *labels, amount=1):
+        with self.lock: self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    # collect 在抓取时调用: 无标签时返回一个数, 有标签时返回 {标签值元组: 数值}
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames); self.collect = collect
+    def set(self, value, *labels):
+        with self.lock: self.values[labels] = value
+    def samples(self):
+        if self.collect is None: return super().samples()
+        values = self.collect()
+        return [("", key, (), value) for key, value in (values.items() if isinstance(values, dict) else [((), values)])]
+
+class Histogram(Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames); self.buckets = tuple(sorted(buckets))
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            # 每个标签组合: [各桶计数 (不累计, 最后一格是 +Inf), 总和, 次数]
+            entry = self.values.get(labels)
+            if entry is None: entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1; entry[1] += value; entry[2] += 1
+    def samples(self):
+        with self.lock: entries = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        result = []
+        for key, counts, total, count in entries:
+            cumulative = 0
+            for bound, amount in zip((*self.buckets, float("inf")), counts):
+                cumulative += amount; result.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+            result += [("_sum", key, (), total), ("_count", key, (), count)]
+        return result
+
+class Registry:
+    def __init__(self): self.metrics, self.lock = {}, threading.Lock()
+    def _register(self, cls, name, *args, **kwargs):
+        # 同名指标只创建一次, 多个引擎实例或重复导入时共用
+        with self.lock:
+            if name not in self.metrics: self.metrics[name] = cls(name, *args, **kwargs)
+            return self.metrics[name]
+    def counter(self, name, documentation, labelnames=()): return self._register(Counter, name, documentation, labelnames)
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        gauge = self._register(Gauge, name, documentation, labelnames)
+        if collect is not None: gauge.collect = collect
+        return gauge
+    def histogram(self, name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS): return self._register(Histogram, name, documentation, labelnames, buckets)
+    def render(self):
+        with self.lock: metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+# --- 2. 采样分析器 (默认关闭, 运行时开关; 定期抓取所有线程的调用栈, 输出 collapsed stack 格式, 可直接生成火焰图) ---
+class SamplingProfiler:
+    def __init__(self):
+        self.stacks, self.samples, self.interval, self.started = Tally(), 0, 0.01, None
+        self.lock, self._stop, self._thread = threading.Lock(), None, None
+    @property
+    def running(self): return self._thread is not None
+    def start(self, interval=0.01):
+        if self.running: return False
+        self.interval, self.started, self._stop = max(interval, 0.001), time.time(), threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, args=(self._stop,), daemon=True, name="SamplingProfiler"); self._thread.start()
+        return True
+    def stop(self):
+        if not self.running: return False
+        self._stop.set(); self._thread.join(timeout=2); self._thread = None
+        return True
+    def reset(self):
+        with self.lock: self.stacks, self.samples = Tally(), 0
+    def status(self):
+        return {"running": self.running, "interval_ms": round(self.interval * 1000, 3), "samples": self.samples, "started": self.started, "stacks": len(self.stacks)}
+    def collapsed(self, limit=None):
+        # 每行 "线程;最外层函数;...;最内层函数 次数", 可交给 flamegraph.pl 或 speedscope
+        with self.lock: return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit))
+
+    def _sample_loop(self, stop):
+        me = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code; stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"); frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled); self.samples += 1
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,404 @@
+import bz2
+import fnmatch
+import gzip
+import json
+import lzma
+import multiprocessing
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from metrics import REGISTRY
+
+# --- 1. 后处理规则 (不依赖 Qt) ---
+# 动作按顺序执行, 每个动作拿到上一个动作的结果路径:
+#   decompress  .gz/.bz2/.xz/.zst 解压到去掉扩展名的文件 (.tgz 等得到 .tar), 扩展名不认识时按文件头判断并原地替换
+#   extract     zip/tar (含压缩的 tar) 解包到 "to" 目录, 默认是压缩包旁边去掉扩展名的同名目录
+#   move        移到 "to" 目录下
+#   hook        运行 "command" (字符串或参数列表), 其中的 {path} {dir} {name} {id} 替换为当前结果; 退出码非 0 算失败, 可设 "timeout" 秒
+# decompress/extract 完成后删除输入文件, 给出 "keep": true 时保留; "to" 的相对路径以当前结果所在的目录为基准
+# 任务添加时给出的 post_process 优先 (空列表表示不处理), 否则用 settings["post_process_rules"] 里第一条 pattern 匹配文件名的规则
+# HTTP API 没有认证, 经它添加的任务只能用 REMOTE_ACTIONS 且不能给出 "to": 运行命令和写到任意位置只能来自本机的 post_process_rules
+ACTIONS = ("decompress", "extract", "move", "hook")
+REMOTE_ACTIONS = ("decompress", "extract")
+COMPRESSED = {".gz": ("gzip", ""), ".tgz": ("gzip", ".tar"), ".bz2": ("bz2", ""), ".tbz2": ("bz2", ".tar"), ".tbz": ("bz2", ".tar"),
+              ".xz": ("xz", ""), ".txz": ("xz", ".tar"), ".lzma": ("xz", ""), ".zst": ("zstd", "")}
+MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd"))
+ARCHIVE_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tbz2", ".tbz", ".txz", ".tar", ".zip")
+PART_SUFFIX = ".part"
+BLOCK_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 0.25
+STREAM_BACKLOG = 32 * 1024 * 1024
+# 3.11.4 起 tarfile 自带 "data" 过滤器 (拒绝绝对路径, 越出目标目录的成员和链接, 设备文件)
+TAR_FILTER = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+POSTPROCESS_JOBS = REGISTRY.counter("downloader_postprocess_jobs_total", "Post-processing jobs by final status", ("status",))
+POSTPROCESS_SECONDS = REGISTRY.histogram("downloader_postprocess_seconds", "Time from a download completing to its post-processing finishing",
+                                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+STREAM_DECODES = REGISTRY.counter("downloader_stream_decompress_total", "Downloads decompressed while streaming, by outcome (fallback = left to the process pool)", ("outcome",))
+
+def normalize_actions(actions, remote=False):
+    # 校验并统一成 [{"action": ..., ...}], 字符串是不带参数的动作; 不合法时抛 ValueError
+    # remote: 来自 HTTP API 的动作, 拒绝 hook/move 和带 "to" 的动作
+    if not isinstance(actions, list): raise ValueError("post_process must be a list of actions")
+    result = []
+    for action in actions:
+        if isinstance(action, str): action = {"action": action}
+        if not isinstance(action, dict) or action.get("action") not in ACTIONS: raise ValueError(f"unknown post-processing action: {action!r}")
+        if remote and (action["action"] not in REMOTE_ACTIONS or "to" in action):
+            raise ValueError(f"{action['action']}: commands and target directories are only allowed in post_process_rules, not through the API")
+        if "to" in action and not (isinstance(action["to"], str) and action["to"].strip()): raise ValueError(f"{action['action']}: \"to\" must be a directory path")
+        if action["action"] == "move" and "to" not in action: raise ValueError("move: missing target directory \"to\"")
+        command = action.get("command")
+        if action["action"] == "hook" and not ((isinstance(command, str) and command.strip()) or (isinstance(command, list) and command and all(isinstance(arg, str) for arg in command))):
+            raise ValueError("hook: \"command\" must be a string or a list of arguments")
+        result.append(dict(action))
+    return result
+
+def actions_for(post_process, filename, rules):
+    # post_process 是任务上保存的 JSON (NULL 表示按规则); 它只能经 API 写入, 执行前按 API 的限制再校验一次
+    if post_process is not None: return normalize_actions(json.loads(post_process), remote=True)
+    for rule in rules or []:
+        patterns = rule.get("pattern") if isinstance(rule, dict) else None
+        if isinstance(patterns, str): patterns = [patterns]
+        if not isinstance(patterns, list): raise ValueError(f"post_process_rules: rule without a pattern: {rule!r}")
+        if any(fnmatch.fnmatch(filename.lower(), pattern.lower()) for pattern in patterns): return normalize_actions(rule.get("actions", []))
+    return []
+
+def compressed_target(path):
+    # (压缩格式, 解压后的路径), 按扩展名判断; 不认识的扩展名返回 None
+    lower = path.lower()
+    for suffix, (kind, replacement) in COMPRESSED.items():
+        if lower.endswith(suffix): return kind, path[:-len(suffix)] + replacement
+    return None
+
+def resolve_dir(directory, path):
+    return os.path.normpath(os.path.join(os.path.dirname(path), os.path.expanduser(directory)))
+
+# --- 2. 进程池里执行的动作 ---
+_progress = None  # 工作进程向主进程报告进度的队列, 由 _init_worker 设置
+
+def _init_worker(progress):
+    global _progress; _progress = progress
+
+class Progress:
+    # 工作进程里的进度上报: 每 PROGRESS_INTERVAL 秒最多发一次 (db_id, 动作序号, 已处理字节, 总字节)
+    def __init__(self, db_id, step, total):
+        self.db_id, self.step, self.total, self.sent = db_id, step, total, 0.0
+        self.update(0, force=True)
+    def update(self, done, force=False):
+        now = time.monotonic()
+        if _progress is not None and (force or now - self.sent >= PROGRESS_INTERVAL):
+            self.sent = now; _progress.put((self.db_id, self.step, done, self.total))
+
+def run_actions(db_id, path, actions, streamed=None, resumed=False):
+    # 依次执行, 返回最终路径; streamed 是下载时已经边下边解压好的文件, 第一个动作 (decompress) 直接用它
+    # resumed: 重启后重做, 输入已经不在的动作是上次做完了 (结果又被后面的动作用掉), 各动作直接给出它的结果路径往下走
+    # 异常统一转成 RuntimeError: 有些异常 (如 subprocess.TimeoutExpired) 无法在进程间传回
+    for step, action in enumerate(actions):
+        try:
+            if not resumed and not os.path.lexists(path): raise FileNotFoundError(f"{path} does not exist")
+            path = HANDLERS[action["action"]](db_id, step, path, action, streamed if step == 0 else None)
+        except Exception as e: raise RuntimeError(f"{action['action']}: {type(e).__name__}: {e}") from None
+    # 重做时所有输入都不在了也会走到这里, 结果必须存在 (hook 可能自己把文件挪走, 不检查)
+    if resumed and actions[-1]["action"] != "hook" and not os.path.lexists(path): raise RuntimeError(f"{path} does not exist")
+    return path
+
+def open_decompressed(kind, raw):
+    if kind == "gzip": return gzip.GzipFile(fileobj=raw)
+    if kind == "bz2": return bz2.BZ2File(raw)
+    if kind == "xz": return lzma.LZMAFile(raw)
+    # zstd 不在标准库里, 只有装了 zstandard 才支持
+    try: import zstandard
+    except ImportError: raise RuntimeError("decompressing .zst needs the zstandard package") from None
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+def _decompress(db_id, step, path, action, streamed):
+    if streamed and os.path.exists(streamed):
+        if not action.get("keep") and os.path.exists(path): os.remove(path)
+        return streamed
+    target = compressed_target(path)
+    if not os.path.exists(path): return target[1] if target else path
+    if target is None:
+        with open(path, 'rb') as f: head = f.read(8)
+        kind = next((kind for magic, kind in MAGIC if head.startswith(magic)), None)
+        if kind is None: raise ValueError("not a compressed file")
+        target = kind, path
+    kind, output = target
+    partpath, progress = output + PART_SUFFIX, Progress(db_id, step, os.path.getsize(path))
+    try:
+        with open(path, 'rb') as raw, open_decompressed(kind, raw) as source, open(partpath, 'wb') as out:
+            while True:
+                block = source.read(BLOCK_SIZE)
+                if not block: break
+                out.write(block); progress.update(raw.tell())
+    except BaseException:
+        if os.path.exists(partpath): os.remove(partpath)
+        raise
+    os.replace(partpath, output)
+    if output != path and not action.get("keep"): os.remove(path)
+    progress.update(progress.total, force=True)
+    return output
+
+def _extract(db_id, step, path, action, streamed):
+    name = os.path.basename(path)
+    stem = next((name[:-len(suffix)] for suffix in ARCHIVE_SUFFIXES if name.lower().endswith(suffix) and len(name) > len(suffix)), os.path.splitext(name)[0] + "_files")
+    target = resolve_dir(action["to"], path) if action.get("to") else os.path.join(os.path.dirname(path), stem)
+    if not os.path.exists(path): return target
+    # 先解到临时目录, 完整解开后再移到目标位置, 中途失败不会留下半个目录
+    temporary = target + PART_SUFFIX
+    shutil.rmtree(temporary, ignore_errors=True); os.makedirs(temporary)
+    progress = Progress(db_id, step, os.path.getsize(path))
+    try:
+        with open(path, 'rb') as raw:
+            if zipfile.is_zipfile(raw):
+                with zipfile.ZipFile(raw) as archive:
+                    for member in archive.infolist(): archive.extract(member, temporary); progress.update(raw.tell())
+            else:
+                raw.seek(0)
+                try: archive = tarfile.open(fileobj=raw, mode="r:*")
+                except tarfile.ReadError: raise ValueError("not a zip or tar archive") from None
+                with archive:
+                    for member in archive:
+                        if not TAR_FILTER and (os.path.isabs(member.name) or ".." in member.name.replace("\\", "/").split("/") or member.issym() or member.islnk()): raise ValueError(f"unsafe archive member: {member.name}")
+                        archive.extract(member, temporary, **TAR_FILTER); progress.update(raw.tell())
+        _merge(temporary, target)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True); raise
+    if not action.get("keep"): os.remove(path)
+    progress.update(progress.total, force=True)
+    return target
+
+def _merge(source, target):
+    # 目标不存在时整个改名过去; 已存在的目录逐项合并, 同名文件覆盖
+    if not os.path.lexists(target): os.replace(source, target); return
+    for name in os.listdir(source):
+        src, dst = os.path.join(source, name), os.path.join(target, name)
+        if os.path.isdir(src) and not os.path.islink(src) and os.path.isdir(dst) and not os.path.islink(dst): _merge(src, dst); continue
+        if os.path.isdir(dst) and not os.path.islink(dst): shutil.rmtree(dst)
+        elif os.path.lexists(dst): os.remove(dst)
+        os.replace(src, dst)
+    os.rmdir(source)
+
+def _move(db_id, step, path, action, streamed):
+    directory = resolve_dir(action["to"], path)
+    target = os.path.join(directory, os.path.basename(path.rstrip(os.sep)))
+    if os.path.abspath(target) == os.path.abspath(path): return path
+    if not os.path.lexists(path): return target
+    progress = Progress(db_id, step, os.path.getsize(path) if os.path.isfile(path) else 0)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.isdir(target) and os.path.isdir(path):
+        # 同一文件系统内逐项改名, 跨盘时退回复制
+        try: _merge(path, target)
+        except OSError:
+            shutil.copytree(path, target, symlinks=True, dirs_exist_ok=True); shutil.rmtree(path)
+    else:
+        # 同名文件覆盖; 同名的是目录时不动它, 算失败
+        if os.path.isdir(target) and not os.path.islink(target): raise FileExistsError(f"{target} is a directory")
+        if os.path.lexists(target): os.remove(target)
+        shutil.move(path, target)
+    progress.update(progress.total, force=True)
+    return target
+
+def _hook(db_id, step, path, action, streamed):
+    if not os.path.lexists(path): return path
+    command = action["command"]
+    args = shlex.split(command, posix=os.name != "nt") if isinstance(command, str) else list(command)
+    fields = {"{path}": path, "{dir}": os.path.dirname(path), "{name}": os.path.basename(path), "{id}": str(db_id)}
+    for placeholder, value in fields.items(): args = [arg.replace(placeholder, value) for arg in args]
+    Progress(db_id, step, 0)
+    result = subprocess.run(args, cwd=os.path.dirname(path) or None, capture_output=True, text=True, timeout=action.get("timeout"))
+    if result.returncode: raise RuntimeError(f"{args[0]} exited with {result.returncode}: {(result.stderr or result.stdout).strip()[-500:]}")
+    return path
+
+HANDLERS = {"decompress": _decompress, "extract": _extract, "move": _move, "hook": _hook}
+
+# --- 3. 边下边解压 ---
+# 引擎按文件顺序把数据交给解压器 (和流式摘要同一条路径, 分段下载的后续部分从磁盘补读), 下载结束时解压也基本完成, 不用再读一遍文件
+# 引擎线程只把数据拷进队列, 解压和写盘在单独的线程里 (zlib/bz2/lzma 解压时释放 GIL, 可以用上另一个核)
+# 解压跟不上下载 (积压超过 STREAM_BACKLOG) 时后面的数据不再排队, 下载完成后从文件里接着读; 数据有误时放弃, 交给进程池事后处理
+DECODERS = {"gzip": lambda: zlib.decompressobj(31), "bz2": bz2.BZ2Decompressor, "xz": lzma.LZMADecompressor}
+_REWIND, _FINISH, _DISCARD = object(), object(), object()
+
+class StreamDecoder:
+    # 结束时 (完成, 出错或丢弃) 在解压线程里调用 on_done(self); 成功时 result 是解压出的文件, 否则为 None
+    # on_progress(已处理, 总字节) 报告下载完成后补读文件的进度
+    def __init__(self, kind, output, on_done, on_progress=None):
+        self.kind, self.output, self.on_done, self.on_progress = kind, output, on_done, on_progress
+        # fed 只由引擎线程修改, consumed 只由解压线程修改, 两者之差是积压; behind 是不再排队时的位置
+        self.queue, self.fed, self.consumed, self.behind = queue.Queue(), 0, 0, None
+        self.failed, self.finished, self.result = None, False, None
+        self.thread = threading.Thread(target=self._run, daemon=True, name="StreamDecoder")
+        self.thread.start()
+    def feed(self, data):
+        if self.failed or self.behind is not None: return
+        if self.fed - self.consumed > STREAM_BACKLOG: self.behind = self.fed; return
+        self.fed += len(data); self.queue.put(bytes(data))
+    def rewind(self):
+        # 摘要从头重算时 (远端文件变了, 或续传位置早于已解压的位置) 解压也从头开始
+        if not self.failed: self.fed, self.behind = 0, None; self.queue.put(_REWIND)
+    def finish(self, path):
+        # 下载完成且校验通过后调用, 不等待: 剩下的数据 (和没排上队的部分) 在解压线程里处理完后调用 on_done
+        if not self.failed: self.queue.put((_FINISH, path, self.behind))
+    def discard(self):
+        if not self.failed: self.failed = "discarded"; self.queue.put(_DISCARD)
+    def _run(self):
+        partpath, decompressor, out = self.output + PART_SUFFIX, DECODERS[self.kind](), None
+        try:
+            out = open(partpath, 'wb')
+            while True:
+                item = self.queue.get()
+                if item is _DISCARD or self.failed: break
+                if item is _REWIND: decompressor = DECODERS[self.kind](); out.seek(0); out.truncate(); self.consumed = 0; continue
+                if isinstance(item, tuple):
+                    _, path, behind = item
+                    if behind is not None: decompressor = self._catch_up(decompressor, path, behind, out)
+                    # 最后一个压缩流必须完整结束, 否则交给进程池, 由它报告具体错误
+                    if self.failed: break
+                    if not decompressor.eof: raise EOFError("compressed stream is incomplete")
+                    out.close(); os.replace(partpath, self.output); self.result = self.output
+                    STREAM_DECODES.inc("complete"); return
+                decompressor = self._inflate(decompressor, item, out)
+                self.consumed += len(item)
+        except (OSError, EOFError, ValueError, zlib.error, lzma.LZMAError) as e:
+            self.failed = f"{type(e).__name__}: {e}"; print(f"Streaming decompression of {os.path.basename(self.output)} stopped: {self.failed}")
+        finally:
+            if self.result is None:
+                if out: out.close()
+                if os.path.exists(partpath): os.remove(partpath)
+                STREAM_DECODES.inc("discarded" if self.failed == "discarded" else "fallback")
+            self.finished = True; self.on_done(self)
+    def _catch_up(self, decompressor, path, offset, out):
+        with open(path, 'rb') as f:
+            f.seek(offset); total, sent = os.fstat(f.fileno()).st_size, 0.0
+            while not self.failed:
+                data = f.read(BLOCK_SIZE)
+                if not data: break
+                decompressor = self._inflate(decompressor, data, out); self.consumed += len(data)
+                if self.on_progress and time.monotonic() - sent >= PROGRESS_INTERVAL: sent = time.monotonic(); self.on_progress(f.tell(), total)
+        return decompressor
+    def _inflate(self, decompressor, data, out):
+        # 每次最多输出 BLOCK_SIZE, 压缩比很高的数据也不会一次占满内存; 多个压缩流首尾相接 (如 pigz/pbzip2 的输出) 时逐个解开
+        while data:
+            if decompressor.eof: decompressor = DECODERS[self.kind]()
+            if hasattr(decompressor, "unconsumed_tail"):
+                while True:
+                    block = decompressor.decompress(data, BLOCK_SIZE); out.write(block)
+                    data = decompressor.unconsumed_tail
+                    if not data and (len(block) < BLOCK_SIZE or decompressor.eof): break
+            else:
+                out.write(decompressor.decompress(data, BLOCK_SIZE))
+                while not decompressor.eof and not decompressor.needs_input: out.write(decompressor.decompress(b"", BLOCK_SIZE))
+            data = decompressor.unused_data if decompressor.eof else b""
+        return decompressor
+
+# --- 4. 调度 (主进程) ---
+class PostProcessor:
+    # 下载完成后把任务交给进程池, 同时最多 post_process_workers 个, 不占下载的并发名额; 进度和状态经 ProgressHub 显示在表格里
+    # 进程池用 spawn 启动: 主进程里有引擎, 写库和界面的线程, fork 出来的子进程可能继承到被别的线程持有的锁
+    def __init__(self, store, settings, progress):
+        self.store, self.settings, self.progress = store, settings, progress
+        self.pool, self.size, self.queue, self.closed = None, 0, None, False
+        # jobs: db_id -> {"started", "total_size", "sample": (时间, 动作序号, 已处理), "decoder", "call"}; decoders: db_id -> 下载时的解压器
+        self.jobs, self.decoders, self.lock = {}, {}, threading.Lock()
+    def _actions(self, db_id):
+        row = self.store.read_one("SELECT filepath, post_process, total_size FROM downloads WHERE id=?", (db_id,))
+        if not row or not row[0]: return None, [], 0
+        return row[0], actions_for(row[1], os.path.basename(row[0]), self.settings.get("post_process_rules")), row[2] or 0
+    def open_decoder(self, db_id, filepath):
+        # 引擎开始下载时调用 (在线程里): 第一个动作是解压且格式支持流式解压时返回解压器
+        target = compressed_target(filepath)
+        if not self.settings.get("stream_decompress", True) or target is None or target[0] not in DECODERS: return None
+        try: _, actions, _ = self._actions(db_id)
+        except ValueError: return None
+        if not actions or actions[0]["action"] != "decompress": return None
+        decoder = self.decoders[db_id] = StreamDecoder(target[0], target[1], lambda decoder: self._decoded(db_id, decoder), lambda done, total: self._report(db_id, 0, done, total))
+        return decoder
+    def submit(self, db_id, resumed=False):
+        # 下载完成时调用 (引擎的 on_finished, 在线程里, 会读库和创建进程池); 没有要做的动作时返回 False, 照常记为完成
+        decoder, error = self.decoders.pop(db_id, None), None
+        try: filepath, actions, total_size = self._actions(db_id)
+        except ValueError as e: filepath, actions, total_size, error = None, None, 0, e
+        if not actions and error is None:
+            # 规则改了, 下载时解压出来的文件用不上了
+            if decoder:
+                decoder.discard()
+                if decoder.result and os.path.exists(decoder.result): os.remove(decoder.result)
+            return False
+        self.store.update_task(db_id, flush=True, status="Processing")
+        with self.lock:
+            job = self.jobs[db_id] = {"started": time.monotonic(), "total_size": total_size, "sample": None, "decoder": decoder, "call": (filepath, actions, resumed)}
+            self.progress.publish(db_id, status="Processing", speed=None)
+            # 规则本身不合法 (settings.json 手工改错) 时直接记为出错, 错误信息写进 attempts
+            if error: self._finish(db_id, None, error)
+            # 解压器还在补读下载时没跟上的部分时, 等它结束 (_decoded) 再交给进程池; 已经在退出时保持 Processing, 下次启动时重做
+            elif (decoder is None or decoder.finished) and not self.closed: self._dispatch(db_id, job)
+        return True
+    def resume(self):
+        # 上次退出时还没处理完的任务重新处理, 各动作能识别上次已经完成的部分
+        for db_id in self.store.load_processing(): self.submit(db_id, resumed=True)
+    def pending(self):
+        return len(self.jobs)
+    def close(self):
+        # 退出时直接结束工作进程; 没处理完的任务保持 Processing, 下次启动时重做
+        with self.lock: pool, self.pool, self.closed = self.pool, None, True
+        for decoder in list(self.decoders.values()): decoder.discard()
+        if pool: pool.terminate(); pool.join()
+        if self.queue: self.queue.put(None)
+    def _decoded(self, db_id, decoder):
+        # 解压线程结束时调用; 有任务在等它时交给进程池, 没用上的解压器 (暂停, 出错) 不再保留
+        with self.lock:
+            job = self.jobs.get(db_id)
+            if job is not None and job["decoder"] is decoder and not self.closed: self._dispatch(db_id, job); return
+        if decoder.result is None and self.decoders.get(db_id) is decoder: self.decoders.pop(db_id, None)
+    def _dispatch(self, db_id, job):
+        # 持锁调用; 下载时已经解压好的文件交给第一个动作直接使用
+        decoder, job["decoder"] = job["decoder"], None
+        filepath, actions, resumed = job.pop("call")
+        self._pool().apply_async(run_actions, (db_id, filepath, actions, decoder.result if decoder else None, resumed),
+                                 callback=lambda path: self._done(db_id, path, None), error_callback=lambda error: self._done(db_id, None, error))
+    def _pool(self):
+        # 第一次用到时才创建; 进程数设置变了且空闲时重建
+        workers = max(int(self.settings.get("post_process_workers", 2)), 1)
+        if self.pool is not None and self.size != workers and not self.jobs: self.pool.close(); self.pool = None
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            if self.queue is None:
+                self.queue = context.Queue()
+                threading.Thread(target=self._read_progress, daemon=True, name="PostProcessProgress").start()
+            self.pool, self.size = context.Pool(workers, _init_worker, (self.queue,)), workers
+        return self.pool
+    def _read_progress(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+            self._report(*item)
+    def _report(self, db_id, step, done, total):
+        now = time.monotonic()
+        # 持锁发布, 保证不会在完成事件之后再发出一条 Processing
+        with self.lock:
+            job = self.jobs.get(db_id)
+            if job is None: return
+            last, job["sample"] = job["sample"], (now, step, done)
+            speed = (done - last[2]) / (now - last[0]) if last and last[1] == step and now > last[0] else None
+            self.progress.publish(db_id, status="Processing", downloaded_size=done, total_size=total, speed=speed)
+    def _done(self, db_id, path, error):
+        with self.lock: self._finish(db_id, path, error)
+    def _finish(self, db_id, path, error):
+        job = self.jobs.pop(db_id, None)
+        if job is None: return
+        if error is None:
+            status = "Complete"; self.store.update_task(db_id, flush=True, status=status, output_path=path)
+        else:
+            status = "Error"; print(f"Post-processing error (ID: {db_id}): {error}")
+            self.store.record_attempt(db_id, None, "postprocess", str(error), None, None)
+            self.store.update_task(db_id, flush=True, status=status)
+        POSTPROCESS_JOBS.inc(status); POSTPROCESS_SECONDS.observe(time.monotonic() - job["started"])
+        # 处理期间表格里显示的是处理进度, 结束时恢复成下载的大小
+        self.progress.publish(db_id, status=status, downloaded_size=job["total_size"], total_size=job["total_size"], speed=None, finished=True)
@@ -0,0 +1,47 @@
+import queue
+import threading
+
+# --- 1. 进度汇总器 (不依赖 Qt) ---
+# 引擎线程随时 publish, 同一任务在一个周期内的多次更新合并成一条, 每个周期只向界面和推送客户端各发一批
+class ProgressHub:
+    def __init__(self, interval=0.25, backlog=64):
+        self.interval, self.backlog = interval, backlog
+        self._pending, self._lock, self._stop = {}, threading.Lock(), threading.Event()
+        # state 保存每个未结束任务的最新状态, 新的推送客户端连上时先收到一份快照
+        self.state, self.listeners, self.subscribers = {}, [], []
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="ProgressHub")
+        self._thread.start()
+
+    def publish(self, db_id, **fields):
+        with self._lock: self._pending.setdefault(db_id, {"id": db_id}).update(fields)
+    def add_listener(self, callback): self.listeners.append(callback)
+    def subscribe(self):
+        subscriber = queue.Queue(self.backlog)
+        with self._lock:
+            if self.state: subscriber.put(list(self.state.values()))
+            self.subscribers.append(subscriber)
+        return subscriber
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self.subscribers: self.subscribers.remove(subscriber)
+    def close(self):
+        self._stop.set(); self._thread.join(timeout=2)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.interval): self.flush()
+    def flush(self):
+        with self._lock:
+            batch, self._pending = list(self._pending.values()), {}
+            for event in batch:
+                if event.get("finished"): self.state.pop(event["id"], None)
+                else: self.state.setdefault(event["id"], {}).update(event)
+            subscribers = list(self.subscribers)
+        if not batch: return
+        for callback in self.listeners: callback(batch)
+        for subscriber in subscribers:
+            # 消费太慢的客户端丢掉最旧的一批, 不让它拖住其他人
+            try: subscriber.put_nowait(batch)
+            except queue.Full:
+                try: subscriber.get_nowait()
+                except queue.Empty: pass
+                subscriber.put_nowait(batch)
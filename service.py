@@ -0,0 +1,254 @@
+import json
+import os
+import queue
+import signal
+import threading
+import time
+import xml.etree.ElementTree as ET
+from flask import Flask, request, jsonify, Response, stream_with_context
+from werkzeug.serving import make_server
+from config import DB_FILE, settings, load_settings
+from engine import DownloadEngine, parse_checksum
+from storage import HistoryStore, lock_instance
+from progress import ProgressHub
+from postprocess import PostProcessor, normalize_actions
+from metrics import REGISTRY, PROFILER
+
+# --- 1. 下载核心 (存储 + 引擎 + 进度汇总, 不依赖 Qt; 图形界面和无界面模式共用) ---
+def task_target(url, filename=None):
+    filename = os.path.basename(filename or "") or url.split('/')[-1].split('?')[0] or "new_download"
+    return filename, os.path.join(settings["download_path"], filename)
+
+class DownloadService:
+    def __init__(self, store, settings):
+        self.store, self.settings = store, settings
+        # 引擎回调发生在引擎线程, 先交给汇总器合并, 每个周期一批交给界面和推送客户端
+        self.progress = ProgressHub()
+        # 下载完成后的解压/解包/移动/钩子在进程池里进行, 期间任务显示为 Processing
+        self.postprocessor = PostProcessor(store, settings, self.progress)
+        self.engine = DownloadEngine(store, settings,
+                                     on_progress=lambda db_id, downloaded_size, total_size, speed: self.progress.publish(db_id, downloaded_size=downloaded_size, total_size=total_size, speed=speed, status="Downloading"),
+                                     on_finished=self._finished, on_status=lambda db_id, status: self.progress.publish(db_id, status=status),
+                                     open_decoder=self.postprocessor.open_decoder)
+        # 新任务的监听器 callback(db_ids, interactive), 图形界面用它刷新表格; interactive 表示是单个手动添加的任务
+        self.listeners = []
+    def start(self):
+        self.engine.start(); self.engine.restore_queue(); self.postprocessor.resume()
+        self._register_gauges()
+        return self
+    def stop(self):
+        self.engine.stop(); self.postprocessor.close(); self.progress.close(); self.store.close()
+    def _finished(self, db_id, status):
+        # 有后处理动作的任务处理完才算完成
+        if status == "Complete" and self.postprocessor.submit(db_id): return
+        self.progress.publish(db_id, status=status, finished=True)
+    def add_tasks(self, tasks, interactive=False, mirrors=None, post_process=None):
+        # tasks: [(url, filename 或 None, checksum 或 None, priority)], 一次事务写入, 一次入队; mirrors: 与 tasks 对应的其他镜像 URL 列表
+        # post_process: 与 tasks 对应的后处理动作列表 (已校验), None 表示按 post_process_rules
+        # 返回 (db_ids, active): 已有任务正在下载或后处理时不重新排队, 其 db_id 列在 active 里
+        targets = [task_target(url, filename) for url, filename, _, _ in tasks]
+        db_ids = self.store.add_tasks([(url, filename, filepath, checksum) for (url, _, checksum, _), (filename, filepath) in zip(tasks, targets)], mirrors, post_process)
+        active = self.engine.enqueue_many([(db_id, url, filepath, priority) for db_id, (url, _, _, priority), (_, filepath) in zip(db_ids, tasks, targets)], notify=interactive)
+        for callback in self.listeners: callback(db_ids, interactive)
+        return db_ids, active
+    def _register_gauges(self):
+        # 抓取时才读取的瞬时值
+        engine = self.engine
+        REGISTRY.gauge("downloader_queue_depth", "Tasks waiting in the scheduler queue", collect=lambda: len(engine.queued))
+        REGISTRY.gauge("downloader_active_workers", "Tasks currently downloading", collect=lambda: len(engine.active))
+        REGISTRY.gauge("downloader_task_bytes_received", "Bytes received this run for each active task", ("id",), collect=lambda: {(db_id,): size for db_id, size in list(engine.transferred.items())})
+        REGISTRY.gauge("downloader_open_sockets", "Open pooled connections per host", ("host",), collect=lambda: {(host,): stats["open_sockets"] for host, stats in engine.pool.stats().items()})
+        REGISTRY.gauge("downloader_host_connection_limit", "Current adaptive connection limit per host", ("host",), collect=lambda: {(host,): stats["connection_limit"] for host, stats in engine.concurrency.stats().items()})
+        REGISTRY.gauge("downloader_host_connections_in_use", "Download connections currently holding a slot per host", ("host",), collect=lambda: {(host,): stats["connections_in_use"] for host, stats in engine.concurrency.stats().items()})
+        REGISTRY.gauge("downloader_postprocess_pending", "Tasks waiting for or running post-processing", collect=self.postprocessor.pending)
+        REGISTRY.gauge("downloader_db_pending_ops", "Operations waiting for the SQLite writer thread", collect=self.store.backlog)
+        REGISTRY.gauge("downloader_profiler_running", "Whether the sampling profiler is collecting", collect=lambda: int(PROFILER.running))
+
+# --- 2. HTTP API ---
+flask_app = Flask(__name__)
+downloader = None  # 运行中的 DownloadService, 启动完成前接口返回 503
+@flask_app.route('/add_download', methods=['POST'])
+def add_download_route():
+    url, checksum, post_process = request.json.get('url'), request.json.get('checksum'), request.json.get('post_process')
+    try: checksum, post_process = parse_checksum(checksum) if checksum else None, normalize_actions(post_process, remote=True) if post_process is not None else None
+    except ValueError as e: return jsonify({"status": "error", "error": str(e)}), 400
+    if url and downloader:
+        (db_id,), active = downloader.add_tasks([(url, None, checksum, 0)], interactive=True, post_process=[post_process])
+        return jsonify({"status": "success", "id": db_id, "task_status": "active" if active else "queued"}), 200
+    return jsonify({"status": "error"}), 400
+@flask_app.route('/add_downloads', methods=['POST'])
+def add_downloads_route():
+    # 接受 JSON 数组或逐行的 NDJSON; 每项可以是 URL 字符串或 {"url", "filename", "checksum", "priority", "mirrors", "post_process"}
+    if not downloader: return jsonify({"status": "error"}), 503
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        items = []
+        for line in iter(request.stream.readline, b""):
+            if not line.strip(): continue
+            try: items.append(json.loads(line))
+            except json.JSONDecodeError as e: items.append({"error": f"invalid JSON: {e}"})
+    else: items = request.get_json(silent=True)
+    if not isinstance(items, list): return jsonify({"status": "error", "error": "expected a JSON array or NDJSON body"}), 400
+    return jsonify({"status": "success", "tasks": queue_items(items)}), 200
+METALINK_TYPES = ("application/metalink4+xml", "application/metalink+xml")
+@flask_app.route('/add_metalink', methods=['POST'])
+def add_metalink_route():
+    # 请求体是 Metalink 文件 (v3 或 RFC 5854 v4), 每个 <file> 一个任务, 其中的 <url> 作为镜像; ?priority= 对所有任务生效
+    if not downloader: return jsonify({"status": "error"}), 503
+    # 只接受 Metalink 的媒体类型: text/plain 等是不需要 CORS 预检的简单请求, 任何网页都能让浏览器发过来
+    if request.mimetype not in METALINK_TYPES: return jsonify({"status": "error", "error": f"Content-Type must be one of {', '.join(METALINK_TYPES)}"}), 415
+    try: items = parse_metalink(request.get_data())
+    except ET.ParseError as e: return jsonify({"status": "error", "error": f"invalid metalink: {e}"}), 400
+    if not items: return jsonify({"status": "error", "error": "no downloadable files in metalink"}), 400
+    for item in items: item["priority"] = request.args.get("priority", 0)
+    return jsonify({"status": "success", "tasks": queue_items(items)}), 200
+def metalink_elements(element):
+    # (去掉命名空间的标签, 节点), 跳过分块哈希 <pieces>
+    for child in element:
+        tag = child.tag.rpartition("}")[2]
+        if tag == "pieces": continue
+        yield tag, child; yield from metalink_elements(child)
+def parse_metalink(data):
+    # 只取 http(s) 镜像, 按 v4 的 priority 升序 / v3 的 preference 降序排列; 摘要取最强的整文件哈希
+    items = []
+    for tag, file in metalink_elements(ET.fromstring(data)):
+        if tag != "file": continue
+        urls, hashes = [], {}
+        for tag, child in metalink_elements(file):
+            text = (child.text or "").strip()
+            if tag == "url" and text.lower().startswith(("http://", "https://")):
+                try: rank = int(child.get("priority")) if child.get("priority") else -int(child.get("preference", 0))
+                except ValueError: rank = 0
+                urls.append((rank, len(urls), text))
+            elif tag == "hash" and text: hashes.setdefault((child.get("type") or "").lower().replace("-", ""), text)
+        checksum = next((f"{algorithm}:{hashes[algorithm]}" for algorithm in ("sha512", "sha256", "sha1", "md5") if algorithm in hashes), None)
+        urls = [url for _, _, url in sorted(urls)]
+        if urls: items.append({"url": urls[0], "mirrors": urls[1:], "filename": file.get("name"), "checksum": checksum})
+    return items
+def queue_items(items):
+    # 逐项校验后一次性入队, 返回与 items 一一对应的结果
+    results, tasks = [], []
+    for item in items:
+        if isinstance(item, str): item = {"url": item}
+        url = item.get("url") if isinstance(item, dict) else None
+        if not isinstance(url, str) or not url.strip():
+            results.append({"status": "error", "error": (item.get("error") if isinstance(item, dict) else None) or "missing url"}); continue
+        if item.get("filename") is not None and not isinstance(item["filename"], str): results.append({"url": url, "status": "error", "error": "invalid filename"}); continue
+        try: priority = int(item.get("priority", 0))
+        except (TypeError, ValueError): results.append({"url": url, "status": "error", "error": "invalid priority"}); continue
+        try: checksum = parse_checksum(item["checksum"]) if item.get("checksum") else None
+        except (AttributeError, ValueError): results.append({"url": url, "status": "error", "error": "invalid checksum"}); continue
+        mirrors = item.get("mirrors") or []
+        if not isinstance(mirrors, list) or not all(isinstance(mirror, str) and mirror.strip() for mirror in mirrors):
+            results.append({"url": url, "status": "error", "error": "mirrors must be a list of URLs"}); continue
+        try: post_process = normalize_actions(item["post_process"], remote=True) if item.get("post_process") is not None else None
+        except ValueError as e: results.append({"url": url, "status": "error", "error": str(e)}); continue
+        url = url.strip()
+        results.append({"url": url}); tasks.append((len(results) - 1, (url, item.get("filename"), checksum, priority), [mirror.strip() for mirror in mirrors], post_process))
+    db_ids, active = downloader.add_tasks([task for _, task, _, _ in tasks], mirrors=[mirrors for _, _, mirrors, _ in tasks], post_process=[actions for _, _, _, actions in tasks])
+    # active: 同一 URL 的任务正在下载或后处理, 保持原状
+    for db_id, (index, _, _, _) in zip(db_ids, tasks): results[index].update(id=db_id, status="active" if db_id in active else "queued")
+    return results
+@flask_app.route('/tasks/<int:db_id>', methods=['GET'])
+def task_route(db_id):
+    # 供脚本轮询单个任务的状态, 例如构建机把本服务当作下载缓存使用
+    if not downloader: return jsonify({"status": "error"}), 503
+    # output_path 是后处理的结果 (解压出的文件, 解包的目录或移动后的位置)
+    columns = ("url", "filename", "filepath", "status", "total_size", "downloaded_size", "checksum", "output_path", "post_process")
+    row = downloader.store.read_one(f"SELECT {', '.join(columns)} FROM downloads WHERE id=?", (db_id,))
+    if not row: return jsonify({"status": "error", "error": "unknown task"}), 404
+    mirrors = [dict(zip(("url", "bytes", "seconds", "status"), mirror)) for mirror in downloader.store.load_mirrors(db_id)]
+    task = dict(zip(columns, row), id=db_id, mirrors=mirrors)
+    if task["post_process"] is not None: task["post_process"] = json.loads(task["post_process"])
+    return jsonify(task), 200
+@flask_app.route('/events', methods=['GET'])
+def events_route():
+    # Server-Sent Events: 每个周期推送一批合并后的进度, 首条消息是当前活动任务的快照
+    if not downloader: return jsonify({"status": "error"}), 503
+    hub = downloader.progress
+    def stream():
+        subscriber = hub.subscribe()
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try: yield f"data: {json.dumps(subscriber.get(timeout=15))}\n\n"
+                except queue.Empty: yield ": keepalive\n\n"
+        finally: hub.unsubscribe(subscriber)
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+@flask_app.route('/lookup', methods=['GET'])
+def lookup_route():
+    # 按完成时记录的摘要查找已下载的文件, 例如 /lookup?checksum=sha256:<hex>
+    if not downloader: return jsonify({"status": "error"}), 503
+    try: checksum = parse_checksum(request.args.get('checksum', ''))
+    except ValueError as e: return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"checksum": checksum, "tasks": [{"id": db_id, "url": url, "filepath": filepath, "size": size} for db_id, url, filepath, size in downloader.store.find_by_checksum(checksum)]}), 200
+@flask_app.route('/tasks/<int:db_id>/attempts', methods=['GET'])
+def attempts_route(db_id):
+    if not downloader: return jsonify({"status": "error"}), 503
+    columns = ("attempted_at", "segment", "error_class", "error", "offset", "delay")
+    return jsonify([dict(zip(columns, row)) for row in downloader.store.load_attempts(db_id)]), 200
+@flask_app.route('/pool_stats', methods=['GET'])
+def pool_stats_route():
+    if not downloader: return jsonify({}), 503
+    # 连接池计数加上自适应并发的当前上限和占用
+    limits = downloader.engine.concurrency.stats()
+    return jsonify({host: dict(stats, **limits.get(host, {})) for host, stats in downloader.engine.pool.stats().items()}), 200
+@flask_app.route('/health', methods=['GET'])
+def health_route():
+    return jsonify({"status": "ok" if downloader else "starting", "startup": STARTUP}), 200 if downloader else 503
+@flask_app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+@flask_app.route('/profile', methods=['GET', 'POST'])
+def profile_route():
+    # 采样分析器: POST {"enabled": true, "interval_ms": 10, "reset": true} 开关; GET 取回 collapsed stacks (可用 ?limit= 截断)
+    if request.method == 'GET': return Response(PROFILER.collapsed(request.args.get('limit', type=int)) + "\n", mimetype="text/plain")
+    options = request.get_json(silent=True) or {}
+    try: interval = float(options.get("interval_ms", 10)) / 1000
+    except (TypeError, ValueError): return jsonify({"status": "error", "error": "invalid interval_ms"}), 400
+    if options.get("reset"): PROFILER.reset()
+    if options.get("enabled") is True: PROFILER.start(interval)
+    elif options.get("enabled") is False: PROFILER.stop()
+    return jsonify(PROFILER.status()), 200
+
+# --- 3. 启动 (记录冷启动各阶段耗时) ---
+STARTUP = {}  # 阶段 -> 距进程入口的秒数, 由 /health 和 /metrics 输出
+REGISTRY.gauge("downloader_startup_seconds", "Seconds from process entry to each startup phase", ("phase",), collect=lambda: {(phase,): seconds for phase, seconds in STARTUP.items()})
+def mark_startup(phase, started): STARTUP[phase] = round(time.perf_counter() - started, 4)
+
+def bind_api(host, port):
+    # 在启动下载核心之前绑定端口: 端口被占用时还没有碰过数据库和下载文件; 失败返回 None
+    # werkzeug 绑定失败时把原因打印到 stderr 后调用 sys.exit(1), 这里一并接住, 由调用方决定是否继续
+    try: return make_server(host, port, flask_app, threaded=True)
+    except (OSError, SystemExit): print(f"Could not start the HTTP API on {host}:{port}", flush=True); return None
+
+def start_api(server, started):
+    # 下载核心启动后开始处理请求, 这一刻记为 api_ready (之前连上来的请求在积压队列里等待)
+    mark_startup("api_ready", started)
+    threading.Thread(target=server.serve_forever, daemon=True, name="HttpApi").start()
+    print(f"API ready on http://{server.host}:{server.server_port} in {STARTUP['api_ready'] * 1000:.0f} ms", flush=True)
+    return server
+
+def run_headless(args, started):
+    # 无界面模式: 只运行下载核心和 HTTP API, 不导入 Qt, 可在没有显示器的服务器上作为下载服务
+    global downloader
+    mark_startup("imports", started)
+    load_settings()
+    if args.download_dir: settings["download_path"] = os.path.abspath(args.download_dir)
+    os.makedirs(settings["download_path"], exist_ok=True)
+    # 恢复和调度之前先拿到实例锁, 不碰另一个实例正在使用的数据库和 .part 文件
+    instance_lock = lock_instance(DB_FILE)
+    if instance_lock is None: print(f"Another instance is already using {DB_FILE}", flush=True); return 1
+    # 无界面模式只能通过 API 使用, 端口不可用时直接退出
+    server = bind_api(args.host, args.port)
+    if server is None: return 1
+    downloader = DownloadService(HistoryStore(DB_FILE), settings).start()
+    mark_startup("engine", started)
+    start_api(server, started); stopping = threading.Event()
+    # SIGTERM 与 Ctrl+C 一样: 停止接收请求, 落盘进度后退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    try:
+        while not stopping.wait(1): pass
+    except KeyboardInterrupt: pass
+    finally:
+        server.shutdown(); downloader.stop()
+    return 0
@@ -0,0 +1,253 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from metrics import REGISTRY
+
+# --- 1. 表结构 ---
+def init_db(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS downloads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE NOT NULL, filename TEXT,
+        filepath TEXT, total_size INTEGER, downloaded_size INTEGER DEFAULT 0,
+        status TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS segments (
+        download_id INTEGER NOT NULL, idx INTEGER NOT NULL, start INTEGER NOT NULL,
+        end INTEGER NOT NULL, downloaded INTEGER DEFAULT 0, PRIMARY KEY (download_id, idx)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, download_id INTEGER NOT NULL, segment INTEGER, error_class TEXT,
+        error TEXT, offset INTEGER, delay REAL, attempted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attempts_download ON attempts (download_id)")
+    # 同一内容的其他镜像 (downloads.url 是主 URL), 以及本任务里每个镜像的传输量和结果
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS mirrors (
+        download_id INTEGER NOT NULL, url TEXT NOT NULL, position INTEGER DEFAULT 0, bytes INTEGER DEFAULT 0,
+        seconds REAL DEFAULT 0, status TEXT, PRIMARY KEY (download_id, url)
+    )""")
+    # 按主机累计的单连接吞吐量 (指数滑动平均), 之后的任务优先用快的镜像; connection_limit 是自适应调整学到的连接数上限
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS host_stats (
+        host TEXT PRIMARY KEY, throughput REAL, failures INTEGER DEFAULT 0, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    if "connection_limit" not in {row[1] for row in cursor.execute("PRAGMA table_info(host_stats)")}: cursor.execute("ALTER TABLE host_stats ADD COLUMN connection_limit REAL")
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(downloads)")}
+    for column, definition in (("priority", "INTEGER DEFAULT 0"), ("position", "INTEGER DEFAULT 0"), ("speed_limit_kb", "INTEGER DEFAULT 0"), ("expected_checksum", "TEXT"), ("checksum", "TEXT"), ("etag", "TEXT"), ("last_modified", "TEXT"),
+                               ("post_process", "TEXT"), ("output_path", "TEXT")):
+        if column not in columns: cursor.execute(f"ALTER TABLE downloads ADD COLUMN {column} {definition}")
+    # load_history 按状态筛选并按创建时间倒序
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_downloads_status_created ON downloads (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_downloads_created ON downloads (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_downloads_checksum ON downloads (checksum)")
+
+def lock_instance(db_file):
+    # 同一个数据库只允许一个实例运行: 启动时的恢复会截断 .part 文件并改写任务状态, 另一个实例还在写这些文件时下载会损坏
+    # 锁归进程所有, 退出 (包括崩溃) 时由系统释放; 返回的文件对象要一直持有, 返回 None 表示已有实例在运行
+    handle = open(db_file + ".lock", "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt; msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl; fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close(); return None
+    return handle
+
+# --- 2. 单写线程的持久化层 ---
+_STOP = object()
+ACTIVE_STATUSES = ("Downloading", "Processing")  # 再次添加同一 URL 时不重新排队的状态
+WRITE_SECONDS = REGISTRY.histogram("downloader_db_write_seconds", "SQLite write transaction latency on the writer thread (op = queued operation, flush = coalesced progress)", ("kind",),
+                                   buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+class HistoryStore:
+    def __init__(self, db_file, flush_interval=1.0):
+        self.db_file, self.flush_interval = db_file, flush_interval
+        self._ops, self._lock, self._local = queue.Queue(), threading.Lock(), threading.local()
+        # 高频的进度写入先合并在内存里, 由写线程定期一次事务批量落盘
+        self._pending_tasks, self._pending_segments = {}, {}
+        # 写线程的事务数和累计改动行数, 供基准测试统计每个任务的写入量
+        self.commits, self.rows_written = 0, 0
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True, name="HistoryWriter")
+        self._writer.start()
+        self.run(init_db)
+        # 状态缓存按需读入, 启动时不再一次读完整个历史 (十万条记录要上百毫秒)
+        self.status_cache = {}
+
+    # 写入: 所有修改都交给同一个写线程, 按提交顺序执行
+    def run(self, fn, *args): return self.submit(fn, *args).result()
+    def submit(self, fn, *args):
+        future = Future(); self._ops.put((fn, args, future)); return future
+    def update_task(self, db_id, flush=False, **fields):
+        with self._lock: self._pending_tasks.setdefault(db_id, {}).update(fields)
+        if "status" in fields: self.status_cache[db_id] = fields["status"]
+        if flush: self._ops.put(None)
+    def update_segments(self, db_id, segments):
+        with self._lock:
+            for seg in segments: self._pending_segments[(db_id, seg[0])] = seg[3]
+    def flush(self): self.run(lambda conn: None)
+    def backlog(self): return self._ops.qsize()
+    def close(self):
+        self._ops.put(_STOP); self._writer.join(timeout=5)
+
+    # 读取: 每个线程一个长连接, WAL 模式下读写互不阻塞
+    def read(self, sql, params=()):
+        conn = getattr(self._local, "conn", None)
+        if conn is None: conn = self._local.conn = sqlite3.connect(self.db_file)
+        return conn.execute(sql, params).fetchall()
+    def read_one(self, sql, params=()):
+        rows = self.read(sql, params)
+        return rows[0] if rows else None
+    def get_status(self, db_id):
+        if db_id not in self.status_cache:
+            row = self.read_one("SELECT status FROM downloads WHERE id=?", (db_id,))
+            # setdefault: 读的同时有 update_task 写入缓存时以缓存为准
+            if row: return self.status_cache.setdefault(db_id, row[0])
+        return self.status_cache.get(db_id)
+
+    # --- 3. 业务读写 ---
+    def add_task(self, url, filename, filepath, expected_checksum=None):
+        return self.add_tasks([(url, filename, filepath, expected_checksum)])[0]
+    def add_tasks(self, tasks, mirrors=None, post_process=None):
+        # tasks: [(url, filename, filepath, expected_checksum)], 全部在同一个事务里插入; 已存在的 URL 返回原有 id
+        # mirrors: 与 tasks 对应的其他镜像 URL 列表, 只对新插入的任务生效; 有镜像时主 URL 也记为第 0 个镜像
+        # post_process: 与 tasks 对应的后处理动作列表, None 表示按全局规则
+        def add(conn):
+            db_ids = []
+            for (url, filename, filepath, expected_checksum), urls, actions in zip(tasks, mirrors or [()] * len(tasks), post_process or [None] * len(tasks)):
+                existing = conn.execute("SELECT id FROM downloads WHERE url=?", (url,)).fetchone()
+                if existing: db_ids.append(existing[0]); continue
+                db_ids.append(conn.execute("INSERT INTO downloads (url, filename, filepath, status, expected_checksum, post_process) VALUES (?, ?, ?, ?, ?, ?)",
+                                           (url, filename, filepath, "Ready", expected_checksum, json.dumps(actions) if actions is not None else None)).lastrowid)
+                if any(mirror != url for mirror in urls):
+                    conn.executemany("INSERT OR IGNORE INTO mirrors (download_id, url, position) VALUES (?, ?, ?)", [(db_ids[-1], mirror, position) for position, mirror in enumerate([url, *urls])])
+            return db_ids
+        return self.run(add)
+    def delete_task(self, db_id):
+        def delete(conn):
+            conn.execute("DELETE FROM downloads WHERE id=?", (db_id,)); conn.execute("DELETE FROM segments WHERE download_id=?", (db_id,)); conn.execute("DELETE FROM attempts WHERE download_id=?", (db_id,)); conn.execute("DELETE FROM mirrors WHERE download_id=?", (db_id,))
+        with self._lock: self._pending_tasks.pop(db_id, None)
+        self.run(delete)
+        self.status_cache.pop(db_id, None)
+    def queue_tasks(self, entries):
+        # entries: [(db_id, priority)], 依次排到队尾, 返回各自的 position
+        # 正在下载或后处理的任务保持原状, position 为 None: 重新排队会让下载重复开始, 或在进程池读文件时替换掉它
+        # 按 status_cache 判断, 进度写入是合并后延迟落盘的, 库里的状态可能还没跟上
+        queued = [(db_id, priority) for db_id, priority in entries if self.get_status(db_id) not in ACTIVE_STATUSES]
+        def enqueue(conn):
+            last = conn.execute("SELECT COALESCE(MAX(position), 0) FROM downloads").fetchone()[0]
+            rows = [("Queued", priority, last + offset, db_id) for offset, (db_id, priority) in enumerate(queued, 1)]
+            conn.executemany("UPDATE downloads SET status=?, priority=?, position=? WHERE id=?", rows)
+            return {row[3]: row[2] for row in rows}
+        positions = self.run(enqueue)
+        for db_id, _ in queued: self.status_cache[db_id] = "Queued"
+        return [positions.get(db_id) for db_id, _ in entries]
+    def save_segment_plan(self, db_id, segments, total_size, wait=True):
+        # wait=False 供事件循环里切分分段时使用, 写入按提交顺序执行, 不需要等
+        rows = [(db_id, *seg) for seg in segments]
+        def save(conn):
+            conn.execute("DELETE FROM segments WHERE download_id=?", (db_id,))
+            conn.executemany("INSERT INTO segments (download_id, idx, start, end, downloaded) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("UPDATE downloads SET total_size=? WHERE id=?", (total_size, db_id))
+        future = self.submit(save)
+        return future.result() if wait else future
+    def load_segments(self, db_id):
+        # 分段被切分后编号不再按文件顺序, 按起点排序
+        return [list(row) for row in self.read("SELECT idx, start, end, downloaded FROM segments WHERE download_id=? ORDER BY start", (db_id,))]
+    def load_queue(self):
+        return self.read("SELECT id, url, filepath, priority, position FROM downloads WHERE status=? ORDER BY position", ("Queued",))
+    def load_processing(self):
+        # 上次退出时后处理还没完成的任务
+        return [row[0] for row in self.read("SELECT id FROM downloads WHERE status=? ORDER BY id", ("Processing",))]
+    def load_interrupted(self):
+        # 上次没有正常退出时仍处于 Downloading 的任务及其分段; 走 status 索引, 历史记录再多也只读这几行
+        tasks, segments = self.read("SELECT id, filepath, downloaded_size FROM downloads WHERE status=?", ("Downloading",)), {}
+        for db_id, idx, start, end, downloaded in self.read("SELECT s.download_id, s.idx, s.start, s.end, s.downloaded FROM segments s JOIN downloads d ON d.id = s.download_id WHERE d.status=? ORDER BY s.start", ("Downloading",)):
+            segments.setdefault(db_id, []).append([idx, start, end, downloaded])
+        return tasks, segments
+    def recover_tasks(self, tasks, segments):
+        # tasks: [(db_id, downloaded_size)], segments: [(db_id, idx, downloaded)]; 同一个事务里校正进度并改回 Queued, 优先级和队列位置不变
+        def recover(conn):
+            conn.executemany("UPDATE downloads SET downloaded_size=?, status=? WHERE id=?", [(size, "Queued", db_id) for db_id, size in tasks])
+            conn.executemany("UPDATE segments SET downloaded=? WHERE download_id=? AND idx=?", [(downloaded, db_id, idx) for db_id, idx, downloaded in segments])
+        self.run(recover)
+        for db_id, _ in tasks: self.status_cache[db_id] = "Queued"
+    def load_task_state(self, db_id):
+        columns = ("downloaded_size", "total_size", "speed_limit_kb", "expected_checksum", "etag", "last_modified")
+        row = self.read_one(f"SELECT {', '.join(columns)} FROM downloads WHERE id=?", (db_id,)) or (None,) * len(columns)
+        state = dict(zip(columns, row))
+        for key in ("downloaded_size", "total_size", "speed_limit_kb"): state[key] = state[key] or 0
+        state["mirrors"] = [row[0] for row in self.read("SELECT url FROM mirrors WHERE download_id=? AND position > 0 ORDER BY position", (db_id,))]
+        return state
+    def record_attempt(self, db_id, segment, error_class, error, offset, delay):
+        # 不等待写入结果, 不阻塞下载
+        self.submit(lambda conn: conn.execute("INSERT INTO attempts (download_id, segment, error_class, error, offset, delay) VALUES (?, ?, ?, ?, ?, ?)",
+                                              (db_id, segment, error_class, error, offset, delay)))
+    def load_attempts(self, db_id):
+        return self.read("SELECT attempted_at, segment, error_class, error, offset, delay FROM attempts WHERE download_id=? ORDER BY id", (db_id,))
+    def load_mirrors(self, db_id):
+        return self.read("SELECT url, bytes, seconds, status FROM mirrors WHERE download_id=? ORDER BY position", (db_id,))
+    def host_throughputs(self, hosts):
+        rows = self.read(f"SELECT host, throughput FROM host_stats WHERE host IN ({','.join('?' * len(hosts))})", tuple(hosts)) if hosts else []
+        return dict(rows)
+    def record_mirrors(self, db_id, results):
+        # results: [(url, host, bytes, seconds, throughput, status, failed)]; 每个镜像的结果写回 mirrors, 单连接吞吐量按 0.3 的权重并入 host_stats
+        def record(conn):
+            for url, host, size, seconds, throughput, status, failed in results:
+                conn.execute("UPDATE mirrors SET bytes=bytes+?, seconds=seconds+?, status=? WHERE download_id=? AND url=?", (size, seconds, status, db_id, url))
+                conn.execute("""INSERT INTO host_stats (host, throughput, failures) VALUES (?, ?, ?) ON CONFLICT(host) DO UPDATE SET
+                                throughput=CASE WHEN excluded.throughput IS NULL THEN throughput WHEN throughput IS NULL THEN excluded.throughput ELSE throughput * 0.7 + excluded.throughput * 0.3 END,
+                                failures=failures + excluded.failures, updated_at=CURRENT_TIMESTAMP""", (host, throughput, int(failed)))
+        self.submit(record)
+    def load_connection_limits(self):
+        return dict(self.read("SELECT host, connection_limit FROM host_stats WHERE connection_limit IS NOT NULL"))
+    def save_connection_limits(self, limits):
+        # 不等待写入结果, 由调整协程在事件循环里调用
+        self.submit(lambda conn: conn.executemany("""INSERT INTO host_stats (host, connection_limit) VALUES (?, ?) ON CONFLICT(host) DO UPDATE SET
+                                                     connection_limit=excluded.connection_limit, updated_at=CURRENT_TIMESTAMP""", list(limits.items())))
+    def find_by_checksum(self, checksum):
+        return self.read("SELECT id, url, filepath, total_size FROM downloads WHERE checksum=? AND status=?", (checksum, "Complete"))
+
+    # --- 4. 写线程 ---
+    def _writer_loop(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            try: item = self._ops.get(timeout=self.flush_interval)
+            except queue.Empty: item = None
+            self._flush_pending(conn)
+            if item is _STOP: break
+            if item is None: continue
+            fn, args, future = item
+            started = time.perf_counter()
+            try:
+                result = fn(conn, *args); conn.commit()
+                self.commits, self.rows_written = self.commits + 1, conn.total_changes
+                WRITE_SECONDS.observe(time.perf_counter() - started, "op")
+            except Exception as e:
+                conn.rollback(); future.set_exception(e)
+            else: future.set_result(result)
+        conn.close()
+    def _flush_pending(self, conn):
+        with self._lock:
+            tasks, segments = self._pending_tasks, self._pending_segments
+            self._pending_tasks, self._pending_segments = {}, {}
+        if not tasks and not segments: return
+        grouped, started = {}, time.perf_counter()
+        for db_id, fields in tasks.items(): grouped.setdefault(tuple(fields), []).append((*fields.values(), db_id))
+        try:
+            for columns, rows in grouped.items():
+                conn.executemany(f"UPDATE downloads SET {', '.join(f'{c}=?' for c in columns)} WHERE id=?", rows)
+            conn.executemany("UPDATE segments SET downloaded=? WHERE download_id=? AND idx=?", [(downloaded, db_id, idx) for (db_id, idx), downloaded in segments.items()])
+            conn.commit()
+            self.commits, self.rows_written = self.commits + 1, conn.total_changes
+            WRITE_SECONDS.observe(time.perf_counter() - started, "flush")
+        except sqlite3.Error as e:
+            conn.rollback(); print(f"History flush error: {e}")
@@ -0,0 +1,26 @@
+import pytest
+import service
+
+class FakeService:
+    # 只记录入队的任务, 不下载
+    def __init__(self): self.tasks = []
+    def add_tasks(self, tasks, interactive=False, mirrors=None, post_process=None):
+        db_ids = list(range(len(self.tasks) + 1, len(self.tasks) + len(tasks) + 1)); self.tasks += tasks
+        return db_ids, set()
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(service, "downloader", FakeService())
+    return service.flask_app.test_client()
+
+def test_items_are_validated_one_by_one(client):
+    items = [{"url": "http://example.com/a.bin", "filename": 5}, {"url": "http://example.com/b.bin", "filename": "b.bin"}, {"url": "http://example.com/c.bin", "priority": "high"},
+             {"url": "http://example.com/d.bin", "checksum": "md5:xyz"}, {"url": "http://example.com/e.bin", "mirrors": "http://mirror.example/e.bin"}, {"filename": "f.bin"}, "http://example.com/g.bin"]
+    r = client.post("/add_downloads", json=items)
+    assert r.status_code == 200
+    assert [task.get("error") or task["status"] for task in r.get_json()["tasks"]] == ["invalid filename", "queued", "invalid priority", "invalid checksum", "mirrors must be a list of URLs", "missing url", "queued"]
+    assert [url for url, _, _, _ in service.downloader.tasks] == ["http://example.com/b.bin", "http://example.com/g.bin"]
+
+def test_remote_post_process_cannot_run_hooks(client):
+    r = client.post("/add_downloads", json=[{"url": "http://example.com/a.gz", "post_process": ["decompress", {"action": "hook", "command": "rm -rf ~"}]}])
+    assert r.get_json()["tasks"][0]["error"].startswith("hook:") and not service.downloader.tasks
@@ -0,0 +1,93 @@
+import time
+from engine import HostConcurrency, PROBE_HOLD
+
+HOST = "example.com"
+
+def controller(**settings):
+    concurrency = HostConcurrency(dict({"segments_per_task": 4, "min_connections_per_host": 1, "max_connections_per_host": 16}, **settings))
+    concurrency.state(HOST)
+    return concurrency
+
+def window(concurrency, rate=1000, requests=10, errors=0, throttled=0, saturated=True, blocked=True):
+    # 模拟一个评估周期: 周期长 1 秒, bytes 即吞吐量; saturated 表示名额被用满过
+    state = concurrency.state(HOST)
+    state.update(bytes=rate, requests=requests, errors=errors, throttled=throttled, blocked=blocked, started=time.monotonic() - 1,
+                 peak=int(state["limit"]) if saturated else int(state["limit"]) - 1)
+    return concurrency.tick()
+
+def test_new_host_doubles_while_throughput_grows():
+    concurrency = controller()
+    assert window(concurrency) == {HOST: 8}
+    assert window(concurrency, rate=2000) == {HOST: 16}
+    assert concurrency.limit(HOST) == 16
+
+def test_no_increase_without_demand():
+    concurrency = controller()
+    assert window(concurrency, saturated=False) == {}
+    assert window(concurrency, blocked=False) == {}
+    assert concurrency.limit(HOST) == 4
+
+def test_probe_without_throughput_gain_is_reverted_and_held():
+    concurrency = controller()
+    window(concurrency)
+    # 多开的连接没有带来 5% 以上的提升, 退回并在 PROBE_HOLD 个周期内不再试探
+    assert window(concurrency, rate=1040) == {HOST: 4}
+    assert concurrency.state(HOST)["growing"] is False
+    for _ in range(PROBE_HOLD): assert window(concurrency) == {}
+    # 之后改为每次 +1
+    assert window(concurrency) == {HOST: 5}
+
+def test_probe_is_reverted_on_congestion():
+    concurrency = controller()
+    window(concurrency)
+    assert window(concurrency, rate=5000, errors=2, throttled=2) == {HOST: 4}
+
+def test_learned_host_grows_by_one():
+    concurrency = HostConcurrency({"segments_per_task": 4, "max_connections_per_host": 16})
+    concurrency.learned[HOST] = 6
+    assert concurrency.limit(HOST) == 6
+    assert window(concurrency) == {HOST: 7}
+
+def test_throttling_halves_the_limit():
+    concurrency = controller(segments_per_task=8)
+    assert window(concurrency, errors=2, throttled=2) == {HOST: 4}
+
+def test_other_errors_cut_to_three_quarters():
+    concurrency = controller(segments_per_task=8)
+    assert window(concurrency, errors=3) == {HOST: 6}
+
+def test_isolated_errors_are_ignored():
+    concurrency = controller(segments_per_task=8)
+    # 单次出错, 或错误占请求数的比例很低, 都不算拥塞
+    assert window(concurrency, requests=1, errors=1, throttled=1, blocked=False) == {}
+    assert window(concurrency, requests=100, errors=2, throttled=2, blocked=False) == {}
+    assert window(concurrency, requests=8, errors=2, blocked=False) == {}
+    assert concurrency.limit(HOST) == 8
+
+def test_no_repeated_decrease_during_cooldown():
+    concurrency = controller(segments_per_task=16)
+    assert window(concurrency, errors=2, throttled=2) == {HOST: 8}
+    # 随后两个周期的错误来自按旧上限发出的请求
+    assert window(concurrency, errors=2, throttled=2) == {}
+    assert window(concurrency, errors=2, throttled=2) == {}
+    assert window(concurrency, errors=2, throttled=2) == {HOST: 4}
+
+def test_limit_is_clamped_to_bounds():
+    concurrency = controller(min_connections_per_host=3)
+    assert window(concurrency, errors=2, throttled=2) == {HOST: 3}
+    concurrency = controller(segments_per_task=6, max_connections_per_host=8)
+    assert window(concurrency) == {HOST: 8}
+    assert window(concurrency, rate=5000) == {}
+
+def test_limit_follows_setting_changes():
+    concurrency = controller(segments_per_task=8)
+    concurrency.settings["max_connections_per_host"] = 2
+    assert concurrency.limit(HOST) == 2
+    concurrency.settings["max_connections_per_host"], concurrency.settings["min_connections_per_host"] = 16, 12
+    assert concurrency.limit(HOST) == 12
+
+def test_fixed_limit_when_adaptive_is_off():
+    concurrency = controller(adaptive_concurrency=False, max_connections_per_host=6)
+    assert concurrency.limit(HOST) == 6
+    assert window(concurrency, errors=5, throttled=5) == {}
+    assert concurrency.limit(HOST) == 6
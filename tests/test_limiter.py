@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime
+import pytest
+import engine
+from engine import BandwidthLimiter, TokenBucket
+
+class Clock:
+    # 代替 engine 里的 time 模块: monotonic() 只在测试推进时变化, asyncio.sleep 直接把时间往前推
+    def __init__(self): self.now, self.slept = 1000.0, []
+    def monotonic(self): return self.now
+    async def sleep(self, delay): self.slept.append(delay); self.now += delay
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(engine, "time", clock)
+    monkeypatch.setattr(engine.asyncio, "sleep", clock.sleep)
+    return clock
+
+def test_bucket_debt_is_paid_back_by_sleeping(clock):
+    bucket = TokenBucket()
+    assert bucket.reserve(1000, 100) == pytest.approx(0.1)
+    clock.now += 0.1
+    assert bucket.reserve(1000, 0) == 0
+
+def test_bucket_refills_at_rate(clock):
+    bucket = TokenBucket()
+    bucket.reserve(1000, 200); clock.now += 0.2
+    # 欠账还清后每秒补 rate 个令牌
+    clock.now += 0.1
+    assert bucket.reserve(1000, 100) == 0
+    assert bucket.reserve(1000, 50) == pytest.approx(0.05)
+
+def test_bucket_burst_is_capped_at_quarter_second(clock):
+    bucket = TokenBucket()
+    clock.now += 60
+    # 空闲再久也只攒 0.25 秒的额度
+    assert bucket.reserve(1000, 250) == 0
+    assert bucket.reserve(1000, 100) == pytest.approx(0.1)
+
+def test_bucket_long_run_average_equals_rate(clock):
+    bucket, started = TokenBucket(), clock.now
+    for _ in range(1000): clock.now += bucket.reserve(50000, 4096)
+    assert 1000 * 4096 / (clock.now - started) == pytest.approx(50000, rel=0.01)
+
+def test_bucket_rate_change_drops_saved_tokens(clock):
+    bucket = TokenBucket()
+    bucket.reserve(1000, 0); clock.now += 10
+    bucket.reserve(1000, 0)
+    # 改成更低的速率时, 之前攒下的额度不能用来突发
+    assert bucket.reserve(100, 10) == pytest.approx(0.1)
+
+def limiter(**settings):
+    return BandwidthLimiter(dict({"speed_limit_kb": 0, "host_speed_limits_kb": {}}, **settings))
+
+def throttle(limiter, db_id, host, amount):
+    asyncio.run(limiter.throttle(db_id, host, amount))
+
+def test_unlimited_does_not_sleep(clock):
+    throttle(limiter(), 1, "a.example", 10 ** 9)
+    assert clock.slept == []
+
+def test_task_limit_under_global_limit(clock):
+    limits = limiter(speed_limit_kb=100)
+    limits.task_limits[1] = 10
+    # 没有单独限速的任务只受全局限速
+    throttle(limits, 2, "a.example", 10 * 1024)
+    assert clock.slept == [pytest.approx(0.1)]
+    # 全局桶和任务桶同时扣, 按欠得最多的那个睡
+    throttle(limits, 1, "a.example", 10 * 1024)
+    assert clock.slept[1] == pytest.approx(1.0)
+    assert limits.global_bucket.tokens == pytest.approx(-10 * 1024)
+
+def test_global_limit_is_shared_between_tasks(clock):
+    limits = limiter(speed_limit_kb=100)
+    limits.task_limits[1] = limits.task_limits[2] = 1000
+    throttle(limits, 1, "a.example", 100 * 1024)
+    throttle(limits, 2, "b.example", 100 * 1024)
+    assert clock.slept == [pytest.approx(1.0), pytest.approx(1.0)]
+    assert clock.now - 1000.0 == pytest.approx(2.0)
+
+def test_host_limit(clock):
+    limits = limiter(host_speed_limits_kb={"a.example": 50})
+    throttle(limits, 1, "a.example", 50 * 1024); throttle(limits, 2, "b.example", 50 * 1024)
+    assert clock.slept == [pytest.approx(1.0)]
+
+def test_chunk_cap_is_quarter_second_of_tightest_limit(clock):
+    limits = limiter(speed_limit_kb=400, host_speed_limits_kb={"a.example": 200})
+    limits.task_limits[1] = 100
+    assert limits.chunk_cap(1, "a.example") == 25 * 1024
+    assert limits.chunk_cap(2, "a.example") == 50 * 1024
+    assert limits.chunk_cap(2, "b.example") == 100 * 1024
+    limits.forget(1)
+    assert limits.chunk_cap(1, "b.example") == 100 * 1024 and 1 not in limits.task_buckets
+
+@pytest.mark.parametrize("clock_time, limit", [("08:59", 0), ("09:00", 500), ("17:59", 500), ("23:30", 50), ("03:00", 50), ("06:00", 0)])
+def test_speed_schedule(clock_time, limit):
+    limits = limiter(speed_schedule=[{"start": "09:00", "end": "18:00", "limit_kb": 500}, {"start": "23:00", "end": "06:00", "limit_kb": 50}])
+    assert limits._scheduled_limit_kb(clock_time) == limit
+
+def test_schedule_is_checked_once_a_second(clock, monkeypatch):
+    class Now:
+        value = datetime(2024, 1, 1, 8, 59, 59)
+        @classmethod
+        def now(cls): return cls.value
+    monkeypatch.setattr(engine, "datetime", Now)
+    limits = limiter(speed_schedule=[{"start": "09:00", "end": "18:00", "limit_kb": 500}])
+    assert limits.global_limit_kb() == 0
+    Now.value = datetime(2024, 1, 1, 9, 0, 0)
+    assert limits.global_limit_kb() == 0
+    clock.now += 1
+    assert limits.global_limit_kb() == 500
@@ -0,0 +1,76 @@
+import xml.etree.ElementTree as ET
+import pytest
+from engine import parse_checksum
+from service import parse_metalink
+
+SHA256 = "a" * 64
+
+V4 = f"""<?xml version="1.0" encoding="UTF-8"?>
+<metalink xmlns="urn:ietf:params:xml:ns:metalink">
+  <file name="full.iso">
+    <size>1048576</size>
+    <hash type="md5">{"b" * 32}</hash>
+    <hash type="sha-256">{SHA256}</hash>
+    <pieces length="262144" type="sha-1"><hash>{"c" * 40}</hash></pieces>
+    <url priority="2">http://mirror-b.example/full.iso</url>
+    <url priority="1">https://mirror-a.example/full.iso</url>
+    <url priority="3">ftp://mirror-c.example/full.iso</url>
+  </file>
+  <file name="bare.bin">
+    <url>http://example.com/bare.bin</url>
+  </file>
+  <file name="torrent-only.bin">
+    <metaurl mediatype="torrent">http://example.com/torrent-only.torrent</metaurl>
+  </file>
+</metalink>"""
+
+V3 = f"""<?xml version="1.0" encoding="UTF-8"?>
+<metalink version="3.0" xmlns="http://www.metalinker.org/">
+  <files>
+    <file name="v3.tar.gz">
+      <verification><hash type="sha1">{"d" * 40}</hash></verification>
+      <resources>
+        <url type="http" preference="10">http://low.example/v3.tar.gz</url>
+        <url type="http" preference="100">http://high.example/v3.tar.gz</url>
+        <url type="bittorrent" preference="100">http://high.example/v3.torrent.bin</url>
+      </resources>
+    </file>
+    <file name="nosize.bin">
+      <resources><url type="http">http://example.com/nosize.bin</url></resources>
+    </file>
+  </files>
+</metalink>"""
+
+def test_v4_orders_by_priority_and_takes_strongest_hash():
+    full = parse_metalink(V4.encode())[0]
+    # ftp 镜像被丢弃; <pieces> 里的分块哈希不算整文件哈希
+    assert full == {"url": "https://mirror-a.example/full.iso", "mirrors": ["http://mirror-b.example/full.iso"], "filename": "full.iso", "checksum": f"sha256:{SHA256}"}
+
+def test_v4_without_size_and_hash():
+    items = parse_metalink(V4.encode())
+    assert items[1] == {"url": "http://example.com/bare.bin", "mirrors": [], "filename": "bare.bin", "checksum": None}
+    # 没有 http(s) 地址的文件跳过
+    assert [item["filename"] for item in items] == ["full.iso", "bare.bin"]
+
+def test_v3_orders_by_preference():
+    items = parse_metalink(V3.encode())
+    assert items[0]["url"] == "http://high.example/v3.tar.gz"
+    assert items[0]["mirrors"] == ["http://high.example/v3.torrent.bin", "http://low.example/v3.tar.gz"]
+    assert items[0]["checksum"] == f"sha1:{'d' * 40}"
+    assert items[1] == {"url": "http://example.com/nosize.bin", "mirrors": [], "filename": "nosize.bin", "checksum": None}
+
+def test_invalid_xml_raises():
+    with pytest.raises(ET.ParseError): parse_metalink(b"<metalink><file>")
+
+@pytest.mark.parametrize("value, expected", [
+    (f"sha256:{SHA256}", f"sha256:{SHA256}"),
+    (f"  SHA-256:{SHA256.upper()} ", f"sha256:{SHA256}"),
+    # 不带算法时按长度推断
+    ("e" * 32, f"md5:{'e' * 32}"), ("e" * 40, f"sha1:{'e' * 40}"), (SHA256, f"sha256:{SHA256}"), ("e" * 128, f"sha512:{'e' * 128}"),
+])
+def test_parse_checksum(value, expected):
+    assert parse_checksum(value) == expected
+
+@pytest.mark.parametrize("value", ["", "e" * 30, f"sha1:{SHA256}", f"sha256:{'g' * 64}", f"nosuchhash:{SHA256}"])
+def test_parse_checksum_rejects(value):
+    with pytest.raises(ValueError): parse_checksum(value)
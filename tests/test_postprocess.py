@@ -0,0 +1,134 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import tarfile
+import threading
+import zipfile
+import pytest
+import postprocess
+from postprocess import PostProcessor, StreamDecoder, actions_for, normalize_actions, run_actions
+from progress import ProgressHub
+
+PAYLOAD = b"".join(b"line %d of the payload\n" % i for i in range(50000))
+COMPRESS = {"gzip": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+def test_normalize_actions():
+    assert normalize_actions(["decompress", {"action": "move", "to": "~/done"}]) == [{"action": "decompress"}, {"action": "move", "to": "~/done"}]
+    assert normalize_actions([{"action": "hook", "command": ["echo", "{path}"]}]) == [{"action": "hook", "command": ["echo", "{path}"]}]
+
+@pytest.mark.parametrize("actions", ["decompress", ["unzip"], [{"action": "move"}], [{"action": "hook", "command": ""}], [{"action": "extract", "to": ""}]])
+def test_normalize_actions_rejects(actions):
+    with pytest.raises(ValueError): normalize_actions(actions)
+
+@pytest.mark.parametrize("action", [{"action": "hook", "command": "rm -rf ~"}, {"action": "move", "to": "/tmp"}, {"action": "extract", "to": "/etc"}, {"action": "decompress", "to": ".."}])
+def test_remote_actions_cannot_run_commands_or_pick_paths(action):
+    # 经 HTTP API 来的动作只能解压和解包到默认位置
+    with pytest.raises(ValueError, match="only allowed in post_process_rules"): normalize_actions(["decompress", action], remote=True)
+    normalize_actions(["decompress", action])
+
+def test_actions_for_checks_stored_actions_again():
+    rules = [{"pattern": "*.tar.gz", "actions": ["extract"]}, {"pattern": ["*.gz", "*.xz"], "actions": ["decompress", {"action": "hook", "command": "true"}]}]
+    assert actions_for(None, "A.TAR.GZ", rules) == [{"action": "extract"}]
+    assert actions_for(None, "a.xz", rules)[1]["action"] == "hook"
+    assert actions_for(None, "a.zip", rules) == []
+    # 任务上保存的动作 (只能经 API 写入) 优先于规则, 空列表表示不处理
+    assert actions_for("[]", "a.gz", rules) == []
+    with pytest.raises(ValueError): actions_for(json.dumps([{"action": "hook", "command": "true"}]), "a.gz", rules)
+
+@pytest.mark.parametrize("kind, suffix", [("gzip", ".gz"), ("bz2", ".bz2"), ("xz", ".xz")])
+def test_run_actions_decompresses(tmp_path, kind, suffix):
+    path = tmp_path / f"data.log{suffix}"; path.write_bytes(COMPRESS[kind](PAYLOAD))
+    assert run_actions(1, str(path), [{"action": "decompress"}]) == str(tmp_path / "data.log")
+    assert (tmp_path / "data.log").read_bytes() == PAYLOAD and not path.exists()
+
+def test_run_actions_decompress_by_magic_and_keep(tmp_path):
+    # 扩展名不认识时按文件头判断, 原地替换
+    path = tmp_path / "data.bin"; path.write_bytes(gzip.compress(PAYLOAD))
+    assert run_actions(1, str(path), [{"action": "decompress"}]) == str(path) and path.read_bytes() == PAYLOAD
+    path = tmp_path / "kept.gz"; path.write_bytes(gzip.compress(PAYLOAD))
+    run_actions(1, str(path), [{"action": "decompress", "keep": True}])
+    assert path.exists() and (tmp_path / "kept").read_bytes() == PAYLOAD
+
+def test_run_actions_extracts_and_moves(tmp_path):
+    path = tmp_path / "bundle.tar.gz"
+    with tarfile.open(path, "w:gz") as archive:
+        info = tarfile.TarInfo("bundle/readme.txt"); info.size = len(PAYLOAD); archive.addfile(info, io.BytesIO(PAYLOAD))
+    result = run_actions(1, str(path), [{"action": "extract"}, {"action": "move", "to": "done"}])
+    assert result == str(tmp_path / "done" / "bundle")
+    assert (tmp_path / "done" / "bundle" / "bundle" / "readme.txt").read_bytes() == PAYLOAD and not path.exists()
+
+def test_run_actions_extract_zip_into_existing_directory(tmp_path):
+    (tmp_path / "pack").mkdir(); (tmp_path / "pack" / "old.txt").write_text("old")
+    with zipfile.ZipFile(tmp_path / "pack.zip", "w") as archive: archive.writestr("new.txt", "new")
+    assert run_actions(1, str(tmp_path / "pack.zip"), [{"action": "extract"}]) == str(tmp_path / "pack")
+    assert sorted(os.listdir(tmp_path / "pack")) == ["new.txt", "old.txt"]
+
+def test_run_actions_rejects_unsafe_archives(tmp_path):
+    path = tmp_path / "evil.tar"
+    with tarfile.open(path, "w") as archive:
+        info = tarfile.TarInfo("../escaped.txt"); info.size = 1; archive.addfile(info, io.BytesIO(b"x"))
+    with pytest.raises(RuntimeError, match="extract"): run_actions(1, str(path), [{"action": "extract"}])
+    assert not (tmp_path / "escaped.txt").exists() and not (tmp_path / "evil").exists() and not (tmp_path / "evil.part").exists()
+
+def test_run_actions_hook(tmp_path):
+    path = tmp_path / "a.txt"; path.write_text("a")
+    command = [sys.executable, "-c", "import sys; open(sys.argv[1] + '.seen', 'w').write(sys.argv[2])", "{path}", "{id}"]
+    assert run_actions(7, str(path), [{"action": "hook", "command": command}]) == str(path)
+    assert (tmp_path / "a.txt.seen").read_text() == "7"
+    with pytest.raises(RuntimeError, match="exited with 3"): run_actions(7, str(path), [{"action": "hook", "command": [sys.executable, "-c", "raise SystemExit(3)"]}])
+
+def test_run_actions_missing_input_and_resume(tmp_path):
+    path = tmp_path / "data.gz"
+    with pytest.raises(RuntimeError, match="does not exist"): run_actions(1, str(path), [{"action": "decompress"}])
+    # 重启后重做: 上次已经解压完 (输入已删除), 直接往下走
+    (tmp_path / "data").write_bytes(PAYLOAD)
+    assert run_actions(1, str(path), [{"action": "decompress"}], resumed=True) == str(tmp_path / "data")
+
+def decode(tmp_path, kind, data, chunk=65536, finish=True):
+    done = threading.Event()
+    decoder = StreamDecoder(kind, str(tmp_path / "data.log"), lambda decoder: done.set())
+    (tmp_path / "download").write_bytes(data)
+    for offset in range(0, len(data), chunk): decoder.feed(memoryview(data)[offset:offset + chunk])
+    if finish: decoder.finish(str(tmp_path / "download"))
+    else: decoder.discard()
+    assert done.wait(10)
+    return decoder
+
+@pytest.mark.parametrize("kind", ["gzip", "bz2", "xz"])
+def test_stream_decoder(tmp_path, kind):
+    decoder = decode(tmp_path, kind, COMPRESS[kind](PAYLOAD))
+    assert decoder.result == str(tmp_path / "data.log") and (tmp_path / "data.log").read_bytes() == PAYLOAD
+
+@pytest.mark.parametrize("kind", ["gzip", "bz2", "xz"])
+def test_stream_decoder_concatenated_streams(tmp_path, kind):
+    decode(tmp_path, kind, COMPRESS[kind](PAYLOAD[:1000]) + COMPRESS[kind](PAYLOAD[1000:]), chunk=777)
+    assert (tmp_path / "data.log").read_bytes() == PAYLOAD
+
+def test_stream_decoder_catches_up_from_file(tmp_path, monkeypatch):
+    # 解压跟不上时后面的数据不再排队, 结束时从下载好的文件里接着读
+    monkeypatch.setattr(postprocess, "STREAM_BACKLOG", 0)
+    decoder = decode(tmp_path, "gzip", gzip.compress(PAYLOAD), chunk=4096)
+    assert decoder.behind is not None and (tmp_path / "data.log").read_bytes() == PAYLOAD
+
+@pytest.mark.parametrize("data", [gzip.compress(PAYLOAD)[:-100], b"not gzip at all" * 100])
+def test_stream_decoder_gives_up_on_bad_data(tmp_path, data):
+    decoder = decode(tmp_path, "gzip", data)
+    assert decoder.result is None and decoder.failed and not os.path.exists(tmp_path / "data.log.part") and not os.path.exists(tmp_path / "data.log")
+
+def test_stream_decoder_discard(tmp_path):
+    decoder = decode(tmp_path, "xz", lzma.compress(PAYLOAD), finish=False)
+    assert decoder.result is None and decoder.failed == "discarded" and not os.path.exists(tmp_path / "data.log.part")
+
+def test_submit_after_close_leaves_task_processing(store, tmp_path):
+    # 引擎在线程里调用 submit, 可能晚于退出时的 close; 这时不再创建进程池, 任务保持 Processing 等下次启动重做
+    hub = ProgressHub(interval=0.05)
+    postprocessor = PostProcessor(store, {"post_process_rules": [{"pattern": "*.gz", "actions": ["decompress"]}]}, hub)
+    db_id = store.add_task("http://example.com/a.gz", "a.gz", str(tmp_path / "a.gz"))
+    postprocessor.close()
+    assert postprocessor.submit(db_id) is True and postprocessor.pool is None
+    store.flush(); hub.close()
+    assert store.load_processing() == [db_id]
@@ -0,0 +1,82 @@
+import gzip
+import os
+import threading
+import pytest
+from engine import DownloadEngine, recover_part
+from postprocess import PostProcessor
+from progress import ProgressHub
+from storage import HistoryStore
+
+def sparse_part(path, written, size):
+    # 预分配 size 个块, 只写了开头 written 个块, 其余是空洞; 返回块大小
+    if not hasattr(os, "SEEK_HOLE"): pytest.skip("no SEEK_HOLE")
+    block = os.stat(path.parent).st_blksize
+    with open(path, "wb") as f: f.write(b"x" * written * block); f.truncate(size * block)
+    with open(path, "rb") as f:
+        if os.lseek(f.fileno(), 0, os.SEEK_HOLE) >= size * block: pytest.skip("filesystem does not report holes")
+    return block
+
+def test_recover_part_trims_trailing_hole(tmp_path):
+    path = tmp_path / "a.bin.part"
+    block = sparse_part(path, 8, 64)
+    # 记录的进度落后: 从记录位置往后找到空洞, 丢掉最后一个可能只写了一半的块
+    assert recover_part(str(path), 2 * block) == 7 * block
+    assert os.path.getsize(path) == 7 * block
+
+def test_recover_part_keeps_recorded_progress_when_ahead_of_hole(tmp_path):
+    path = tmp_path / "a.bin.part"
+    block = sparse_part(path, 8, 64)
+    assert recover_part(str(path), 8 * block) == 8 * block
+
+def test_recover_part_short_file(tmp_path):
+    # 文件比记录的进度短 (被截断过): 退回到文件长度
+    path = tmp_path / "a.bin.part"; path.write_bytes(b"x" * 1000)
+    assert recover_part(str(path), 5000) == 1000 and os.path.getsize(path) == 1000
+
+def test_recover_part_without_holes_uses_recorded_progress(tmp_path):
+    path = tmp_path / "a.bin.part"; path.write_bytes(b"x" * 10000)
+    assert recover_part(str(path), 4000) == 4000 and path.read_bytes() == b"x" * 4000
+
+def crashed_store(tmp_path, tasks):
+    # 上一次运行: 按 tasks 写好任务后直接关掉, 相当于进程在下载中途退出
+    store = HistoryStore(str(tmp_path / "history.db"))
+    db_ids = []
+    for name, status, downloaded_size, plan in tasks:
+        db_id = store.add_task(f"http://example.com/{name}", name, str(tmp_path / name))
+        store.update_task(db_id, status=status, downloaded_size=downloaded_size, total_size=plan[-1][2] + 1 if plan else 0)
+        if plan: store.save_segment_plan(db_id, plan, plan[-1][2] + 1)
+        db_ids.append(db_id)
+    store.close()
+    return HistoryStore(str(tmp_path / "history.db")), db_ids
+
+def test_interrupted_downloads_are_requeued(tmp_path):
+    segmented = [[0, 0, 999, 1000], [1, 1000, 1999, 800], [2, 2000, 2999, 600]]
+    store, (single, split, missing, done, processing) = crashed_store(tmp_path, [
+        ("single.bin", "Downloading", 3000, []), ("split.bin", "Downloading", 2400, segmented), ("missing.bin", "Downloading", 500, [[0, 0, 999, 500]]),
+        ("done.bin", "Complete", 10, []), ("processing.gz", "Processing", 10, [])])
+    (tmp_path / "single.bin.part").write_bytes(b"x" * 2000)
+    # 分段下载的文件被截断在 1500: 第二段只剩 500 字节, 第三段全部作废
+    (tmp_path / "split.bin.part").write_bytes(b"x" * 1500)
+    try:
+        DownloadEngine(store, {})._recover_interrupted()
+        store.flush()
+        assert [row[0] for row in store.load_queue()] == [single, split, missing]
+        assert all(store.get_status(db_id) == "Queued" for db_id in (single, split, missing))
+        assert store.get_status(done) == "Complete" and store.get_status(processing) == "Processing" and store.load_processing() == [processing]
+        assert [store.load_task_state(db_id)["downloaded_size"] for db_id in (single, split, missing)] == [2000, 1500, 0]
+        assert store.load_segments(split) == [[0, 0, 999, 1000], [1, 1000, 1999, 500], [2, 2000, 2999, 0]]
+        assert store.load_segments(missing) == [[0, 0, 999, 0]]
+    finally: store.close()
+
+def test_interrupted_post_processing_is_redone(tmp_path):
+    store, (db_id,) = crashed_store(tmp_path, [("log.gz", "Processing", 10, [])])
+    (tmp_path / "log.gz").write_bytes(gzip.compress(b"payload" * 1000))
+    hub, finished = ProgressHub(interval=0.05), threading.Event()
+    hub.add_listener(lambda batch: any(event.get("finished") for event in batch) and finished.set())
+    postprocessor = PostProcessor(store, {"post_process_rules": [{"pattern": "*.gz", "actions": ["decompress"]}]}, hub)
+    try:
+        postprocessor.resume()
+        assert finished.wait(60)
+        store.flush()
+        assert store.get_status(db_id) == "Complete" and (tmp_path / "log").read_bytes() == b"payload" * 1000
+    finally: postprocessor.close(); hub.close(); store.close()
@@ -0,0 +1,76 @@
+import asyncio
+import aiohttp
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+from engine import DownloadEngine, RemoteChanged, classify_error
+
+TASK_URL = URL("http://example.invalid/a.bin")
+
+def response_error(status, headers=None):
+    request_info = aiohttp.RequestInfo(TASK_URL, "GET", CIMultiDictProxy(CIMultiDict()), TASK_URL)
+    return aiohttp.ClientResponseError(request_info, (), status=status, headers=headers)
+
+@pytest.mark.parametrize("error, kind", [
+    (asyncio.TimeoutError(), "timeout"), (aiohttp.ServerTimeoutError(), "timeout"),
+    (response_error(500), "server"), (response_error(503), "server"), (response_error(429), "server"),
+    (response_error(404), None), (response_error(403), None), (response_error(416), None),
+    (aiohttp.ClientConnectionError(), "connection"), (aiohttp.ClientPayloadError(), "connection"), (ConnectionResetError(), "connection"),
+    # 磁盘错误, 远端文件变化和程序错误不重试
+    (OSError(28, "No space left on device"), None), (RemoteChanged("etag changed"), None), (ValueError("bug"), None),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+def make_engine(store, **settings):
+    # 不启动事件循环线程, 直接在 asyncio.run 里调用 _backoff
+    engine = DownloadEngine(store, dict({"retry_backoff_base": 0, "retry_backoff_max": 0, "retry_budgets": {"server": 2, "timeout": 1, "connection": 3}}, **settings))
+    return engine, store.add_task("http://example.invalid/a.bin", "a.bin", "a.bin")
+
+def backoff(engine, db_id, error, segment=0, offset=0):
+    asyncio.run(engine._backoff(db_id, error, segment, offset))
+
+def test_retries_until_budget_is_used(store):
+    engine, db_id = make_engine(store)
+    backoff(engine, db_id, response_error(503)); backoff(engine, db_id, response_error(503))
+    with pytest.raises(aiohttp.ClientResponseError): backoff(engine, db_id, response_error(503))
+    store.flush()
+    assert [(row[2], row[5] is not None) for row in store.load_attempts(db_id)] == [("server", True), ("server", True), ("server", False)]
+
+def test_fatal_error_is_not_retried(store):
+    engine, db_id = make_engine(store)
+    with pytest.raises(aiohttp.ClientResponseError): backoff(engine, db_id, response_error(404))
+    store.flush()
+    assert [row[2] for row in store.load_attempts(db_id)] == ["fatal"]
+
+def test_budgets_are_per_error_class_and_per_segment(store):
+    engine, db_id = make_engine(store)
+    backoff(engine, db_id, asyncio.TimeoutError())
+    with pytest.raises(asyncio.TimeoutError): backoff(engine, db_id, asyncio.TimeoutError())
+    backoff(engine, db_id, asyncio.TimeoutError(), segment=1)
+    backoff(engine, db_id, ConnectionResetError())
+
+def test_progress_resets_the_budget(store):
+    engine, db_id = make_engine(store)
+    backoff(engine, db_id, response_error(500), offset=0); backoff(engine, db_id, response_error(500), offset=0)
+    # 两次失败之间有数据落盘, 重新计数
+    backoff(engine, db_id, response_error(500), offset=1024); backoff(engine, db_id, response_error(500), offset=1024)
+    with pytest.raises(aiohttp.ClientResponseError): backoff(engine, db_id, response_error(500), offset=1024)
+
+def test_delay_is_exponential_with_jitter_and_capped(store):
+    engine, db_id = make_engine(store, retry_backoff_base=0.001, retry_backoff_max=0.004, retry_budgets={"connection": 6})
+    for _ in range(6): backoff(engine, db_id, ConnectionResetError())
+    store.flush()
+    delays = [row[5] for row in store.load_attempts(db_id)]
+    assert all(0 <= delay <= bound for delay, bound in zip(delays, (0.001, 0.002, 0.004, 0.004, 0.004, 0.004)))
+
+def test_retry_after_is_honoured_up_to_the_cap(store):
+    engine, db_id = make_engine(store, retry_backoff_max=0.01)
+    backoff(engine, db_id, response_error(429, {"Retry-After": "120"}))
+    store.flush()
+    assert store.load_attempts(db_id)[0][5] == 0.01
+
+def test_paused_task_is_not_retried(store):
+    engine, db_id = make_engine(store)
+    engine.paused.add(db_id)
+    with pytest.raises(aiohttp.ClientResponseError): backoff(engine, db_id, response_error(503))
@@ -0,0 +1,69 @@
+import pytest
+from engine import DownloadEngine
+
+class FakeStore:
+    # 调度只用到 update_task; 记录状态变化, 不落盘
+    def __init__(self): self.statuses = {}
+    def update_task(self, db_id, flush=False, **fields):
+        if "status" in fields: self.statuses[db_id] = fields["status"]
+
+class FakeLoop:
+    # 记录被启动的下载, 协程不执行
+    def __init__(self): self.started = []
+    def create_task(self, coroutine): self.started.append(coroutine.cr_frame.f_locals["db_id"]); coroutine.close()
+
+@pytest.fixture
+def engine():
+    engine = DownloadEngine(FakeStore(), {"max_concurrent": 1, "max_connections_per_host": 8})
+    engine.loop = FakeLoop()
+    return engine
+
+def enqueue(engine, tasks):
+    # tasks: [(db_id, host, priority)], position 按添加顺序递增
+    for position, (db_id, host, priority) in enumerate(tasks, 1): engine._enqueue(db_id, f"http://{host}/{db_id}.bin", f"/tmp/{db_id}.bin", priority, position, notify=False, dispatch=False)
+
+def drain(engine):
+    order = []
+    while (picked := engine._next_queued()) is not None: order.append(picked[0])
+    return order
+
+def test_higher_priority_first_then_fifo(engine):
+    enqueue(engine, [(1, "a.example", 0), (2, "a.example", 5), (3, "a.example", 0), (4, "a.example", 5), (5, "a.example", -1)])
+    assert drain(engine) == [2, 4, 1, 3, 5]
+
+def test_priority_across_hosts(engine):
+    enqueue(engine, [(1, "a.example", 0), (2, "b.example", 0), (3, "b.example", 9), (4, "a.example", 0)])
+    assert drain(engine) == [3, 1, 2, 4]
+
+def test_hosts_with_fewer_active_tasks_go_first(engine):
+    enqueue(engine, [(1, "a.example", 0), (2, "a.example", 0), (3, "b.example", 0)])
+    engine._mark_active(99, "http://a.example/99.bin")
+    # 同优先级时先给没有任务在跑的主机
+    assert engine._next_queued()[0] == 3
+
+def test_host_connection_limit_holds_tasks_back(engine):
+    engine.settings["max_connections_per_host"] = 1
+    enqueue(engine, [(1, "a.example", 0), (2, "a.example", 0)])
+    engine._mark_active(99, "http://a.example/99.bin")
+    assert engine._next_queued() is None and engine.queued.keys() == {1, 2}
+
+def test_reprioritize_moves_task_forward(engine, monkeypatch):
+    monkeypatch.setattr(engine, "_dispatch", lambda: None)
+    enqueue(engine, [(1, "a.example", 0), (2, "a.example", 0), (3, "a.example", 0)])
+    engine._reprioritize(3, 1)
+    # 堆里的旧条目惰性删除, 不会让任务出队两次
+    assert drain(engine) == [3, 1, 2]
+
+def test_paused_task_leaves_the_queue(engine, monkeypatch):
+    monkeypatch.setattr(engine, "on_finished", lambda db_id, status: None)
+    enqueue(engine, [(1, "a.example", 0), (2, "a.example", 0)])
+    engine._pause(1)
+    assert drain(engine) == [2] and engine.store.statuses[1] == "Paused"
+
+def test_dispatch_respects_max_concurrent(engine):
+    engine.settings["max_concurrent"] = 2
+    enqueue(engine, [(1, "a.example", 0), (2, "b.example", 3), (3, "c.example", 0)])
+    engine._dispatch()
+    assert engine.loop.started == [2, 1] and engine.active == {1, 2} and engine.store.statuses == {2: "Downloading", 1: "Downloading"}
+    engine.active.discard(2); engine._dispatch()
+    assert engine.loop.started == [2, 1, 3]
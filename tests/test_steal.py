@@ -0,0 +1,93 @@
+import asyncio
+import time
+import pytest
+from engine import DownloadEngine, MIN_STEAL_SIZE, RemoteChanged
+
+MB = 1024 * 1024
+
+def worker(rate, cursor=0):
+    # bytes 为 0 时 _worker_rate 直接用 rate, 测试里速度完全由 rate 决定
+    return {"rate": rate, "cursor": cursor, "started": time.monotonic(), "bytes": 0}
+
+@pytest.fixture
+def engine(store):
+    engine = DownloadEngine(store, {})
+    engine.db_id = store.add_task("http://example.invalid/a.bin", "a.bin", "a.bin")
+    return engine
+
+def steal(engine, segments, owners, thief):
+    stolen = engine._steal(engine.db_id, segments, owners, thief)
+    engine.store.flush()
+    return stolen
+
+def test_equal_rates_split_in_half(engine):
+    victim, segments = worker(MB), [[0, 0, 8 * MB - 1, 0]]
+    assert steal(engine, segments, {0: victim}, worker(MB)) == [1, 4 * MB, 8 * MB - 1, 0]
+    assert segments == [[0, 0, 4 * MB - 1, 0], [1, 4 * MB, 8 * MB - 1, 0]]
+    # 新的分段计划已经写入数据库
+    assert engine.store.load_segments(engine.db_id) == segments
+
+def test_split_follows_rate_ratio(engine):
+    # 自己快 3 倍, 拿走剩余的 3/4, 双方预计同时完成
+    victim, segments = worker(MB, cursor=MB), [[0, 0, 9 * MB - 1, 0]]
+    assert steal(engine, segments, {0: victim}, worker(3 * MB)) == [1, 3 * MB, 9 * MB - 1, 0]
+    assert segments[0] == [0, 0, 3 * MB - 1, 0]
+
+def test_unknown_rates_split_in_half(engine):
+    victim, segments = worker(0), [[0, 0, 4 * MB - 1, 0]]
+    assert steal(engine, segments, {0: victim}, worker(0))[1] == 2 * MB
+
+def test_small_remainder_is_left_alone(engine):
+    victim, segments = worker(MB), [[0, 0, 2 * MB - 1, 0]]
+    victim["cursor"] = 2 * MB - MIN_STEAL_SIZE
+    assert steal(engine, segments, {0: victim}, worker(MB)) is None
+    assert segments == [[0, 0, 2 * MB - 1, 0]]
+
+def test_much_faster_worker_takes_whole_remainder(engine):
+    victim, segments = worker(MB // 10), [[0, 0, 2 * MB - 1, 0]]
+    victim["cursor"] = 2 * MB - MIN_STEAL_SIZE
+    assert steal(engine, segments, {0: victim}, worker(10 * MB)) == [1, 2 * MB - MIN_STEAL_SIZE, 2 * MB - 1, 0]
+    assert segments[0][2] == 2 * MB - MIN_STEAL_SIZE - 1
+
+def test_split_boundary_at_min_steal_size(engine):
+    # 两半都恰好 MIN_STEAL_SIZE 时可以切, 少一个字节就不切
+    victim, segments = worker(MB), [[0, 0, 2 * MIN_STEAL_SIZE - 1, 0]]
+    assert steal(engine, segments, {0: victim}, worker(MB)) == [1, MIN_STEAL_SIZE, 2 * MIN_STEAL_SIZE - 1, 0]
+    victim, segments = worker(MB), [[0, 0, 2 * MIN_STEAL_SIZE - 2, 0]]
+    assert steal(engine, segments, {0: victim}, worker(MB)) is None
+
+def test_picks_segment_with_largest_eta(engine):
+    fast, slow = worker(4 * MB), worker(MB)
+    segments = [[0, 0, 8 * MB - 1, 0], [1, 8 * MB, 12 * MB - 1, 0], [2, 12 * MB, 16 * MB - 1, 0]]
+    slow["cursor"] = 8 * MB
+    stolen = steal(engine, segments, {0: fast, 1: slow}, worker(MB))
+    # 分段 1 剩 4 MB 但最慢, 新分段编号接在最大编号之后, 插在被切的分段后面
+    assert stolen == [3, 10 * MB, 12 * MB - 1, 0]
+    assert [seg[0] for seg in segments] == [0, 1, 3, 2]
+
+def test_skips_own_and_unowned_segments(engine):
+    thief, segments = worker(MB), [[0, 0, 8 * MB - 1, 0], [1, 8 * MB, 16 * MB - 1, 0]]
+    assert steal(engine, segments, {0: thief}, thief) is None
+    # 已经下完的分段 (cursor 越过末尾) 也不切
+    victim = worker(MB, cursor=16 * MB)
+    assert steal(engine, segments, {0: thief, 1: victim}, thief) is None
+
+def test_assign_workers_without_live_sources():
+    dead = DownloadEngine._source("http://a.example/a.bin", None); dead["status"] = "no range support"
+    assert DownloadEngine._assign_workers([dead], 4) == []
+
+def test_resume_fails_over_to_restart_when_every_mirror_changed(engine, monkeypatch):
+    # 续传时两个镜像报告的长度都和保存的分段不一致, 抛出 RemoteChanged 让任务从头下载, 而不是以 Error 结束
+    async def probe(url): return 9 * MB, None, None
+    monkeypatch.setattr(engine, "_probe", probe)
+    segments = [[0, 0, 4 * MB - 1, MB], [1, 4 * MB, 8 * MB - 1, 0]]
+    with pytest.raises(RemoteChanged):
+        asyncio.run(engine._probe_mirrors(engine.db_id, ["http://a.example/a.bin", "http://b.example/a.bin"], segments, '"etag"'))
+
+def test_resume_keeps_mirrors_that_still_match(engine, monkeypatch):
+    async def probe(url): return (8 * MB if "a.example" in url else 9 * MB), None, None
+    monkeypatch.setattr(engine, "_probe", probe)
+    segments = [[0, 0, 4 * MB - 1, MB], [1, 4 * MB, 8 * MB - 1, 0]]
+    sources, total_size = asyncio.run(engine._probe_mirrors(engine.db_id, ["http://b.example/a.bin", "http://a.example/a.bin"], segments, '"etag"'))
+    assert total_size == 8 * MB and [source["host"] for source in sources if source["status"] is None] == ["a.example"]
+    assert DownloadEngine._assign_workers(sources, 2) == [sources[0], sources[0]]
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+import pytest
+from storage import HistoryStore
+
+@pytest.fixture
+def slow_store(tmp_path):
+    # 定时刷新间隔很长, 合并的写入只在有操作排队或 flush=True 时落盘
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=60)
+    yield store
+    store.close()
+
+def add(store, count):
+    return store.add_tasks([(f"http://example.com/{i}.bin", f"{i}.bin", f"/tmp/{i}.bin", None) for i in range(count)])
+
+def downloaded(store, db_id):
+    return store.read_one("SELECT downloaded_size FROM downloads WHERE id=?", (db_id,))[0]
+
+def test_progress_writes_are_coalesced(slow_store):
+    db_ids = add(slow_store, 10)
+    commits = slow_store.commits
+    for size in range(1, 101):
+        for db_id in db_ids: slow_store.update_task(db_id, downloaded_size=size, total_size=100)
+    # 还没落盘
+    assert downloaded(slow_store, db_ids[0]) == 0
+    slow_store.flush()
+    # 一千次更新合并成一个事务 (另一个是 flush 自己的空操作)
+    assert slow_store.commits - commits == 2
+    assert [downloaded(slow_store, db_id) for db_id in db_ids] == [100] * 10
+
+def test_segment_progress_is_coalesced(slow_store):
+    db_id, = add(slow_store, 1)
+    slow_store.save_segment_plan(db_id, [[0, 0, 99, 0], [1, 100, 199, 0]], 200)
+    for done in range(1, 51): slow_store.update_segments(db_id, [[0, 0, 99, done], [1, 100, 199, 2 * done]])
+    slow_store.flush()
+    assert slow_store.load_segments(db_id) == [[0, 0, 99, 50], [1, 100, 199, 100]]
+
+def test_pending_writes_land_before_later_operations(slow_store):
+    db_id, = add(slow_store, 1)
+    slow_store.update_task(db_id, downloaded_size=42)
+    # 写线程执行下一个操作前先把合并的进度落盘, 操作看到的是提交顺序上之前的所有修改
+    assert slow_store.run(lambda conn: conn.execute("SELECT downloaded_size FROM downloads WHERE id=?", (db_id,)).fetchone()[0]) == 42
+
+def test_flush_true_writes_without_waiting_for_the_interval(slow_store):
+    db_id, = add(slow_store, 1)
+    slow_store.update_task(db_id, downloaded_size=7)
+    slow_store.update_task(db_id, flush=True, status="Error")
+    deadline = time.monotonic() + 5
+    while slow_store.read_one("SELECT status FROM downloads WHERE id=?", (db_id,))[0] != "Error" and time.monotonic() < deadline: time.sleep(0.01)
+    assert slow_store.read_one("SELECT status, downloaded_size FROM downloads WHERE id=?", (db_id,)) == ("Error", 7)
+
+def test_failed_operation_is_rolled_back_and_writer_keeps_going(slow_store):
+    db_id, = add(slow_store, 1)
+    def broken(conn):
+        conn.execute("UPDATE downloads SET status='Broken' WHERE id=?", (db_id,)); conn.execute("SELECT * FROM no_such_table")
+    with pytest.raises(sqlite3.OperationalError): slow_store.run(broken)
+    assert slow_store.read_one("SELECT status FROM downloads WHERE id=?", (db_id,))[0] == "Ready"
+    assert add(slow_store, 2)[1] == db_id + 1
+
+def test_status_cache(tmp_path, slow_store):
+    db_id, = add(slow_store, 1)
+    slow_store.update_task(db_id, status="Downloading")
+    # 缓存立即更新, 库里的状态在下次落盘时才跟上
+    assert slow_store.get_status(db_id) == "Downloading"
+    assert slow_store.read_one("SELECT status FROM downloads WHERE id=?", (db_id,))[0] == "Ready"
+    slow_store.flush()
+    # 新实例按需从库里读
+    other = HistoryStore(str(tmp_path / "history.db"))
+    try: assert other.status_cache == {} and other.get_status(db_id) == "Downloading" and other.get_status(db_id + 1) is None
+    finally: other.close()
+    slow_store.delete_task(db_id)
+    assert slow_store.get_status(db_id) is None
+
+def test_queue_tasks_skips_active_tasks(slow_store):
+    db_ids = add(slow_store, 5)
+    for db_id, status in zip(db_ids, ("Downloading", "Processing", "Complete", "Error", "Paused")): slow_store.update_task(db_id, status=status)
+    # 状态还在缓存里没落盘, 也要按它判断
+    positions = slow_store.queue_tasks([(db_id, 1) for db_id in db_ids])
+    assert positions[:2] == [None, None] and positions[2] < positions[3] < positions[4]
+    assert [slow_store.get_status(db_id) for db_id in db_ids] == ["Downloading", "Processing", "Queued", "Queued", "Queued"]
+    slow_store.flush()
+    assert [row[0] for row in slow_store.load_queue()] == db_ids[2:]
+
+def test_concurrent_writers(slow_store):
+    # 多个线程同时添加和更新任务, 全部经同一个写线程按顺序执行
+    results, errors = {}, []
+    def worker(n):
+        try:
+            db_ids = slow_store.add_tasks([(f"http://example.com/{n}/{i}.bin", f"{i}.bin", f"/tmp/{n}/{i}.bin", None) for i in range(50)])
+            for db_id in db_ids: slow_store.update_task(db_id, downloaded_size=n)
+            results[n] = db_ids
+        except Exception as e: errors.append(e)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    slow_store.flush()
+    assert not errors and len({db_id for db_ids in results.values() for db_id in db_ids}) == 400
+    assert all(downloaded(slow_store, db_id) == n for n, db_ids in results.items() for db_id in db_ids)